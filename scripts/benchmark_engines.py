@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark AprioriAnalyzer mining engines on synthetic data.
+
+Usage:
+    python benchmark_engines.py [--engines apriori sparse fpgrowth] [--max-len 3] [--scale 1.0] [--n-jobs 1]
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from aiti_insights.apriori import AprioriAnalyzer, ENGINES
+
+
+def make_sparse(scale: float, seed: int = 0) -> pd.DataFrame:
+    """Retail-like data: many small baskets over a large catalog."""
+    rng = np.random.default_rng(seed)
+    n_baskets = int(50_000 * scale)
+    sizes = rng.poisson(4, n_baskets) + 1
+
+    return pd.DataFrame({
+        "cliente_id": np.repeat(np.arange(n_baskets), sizes),
+        "produto_id": rng.zipf(1.4, sizes.sum()) % 5_000,
+        "data": "2025-01-01",
+        "valor": 1.0,
+    })
+
+
+def make_dense(scale: float, seed: int = 0) -> pd.DataFrame:
+    """Wholesale-like data: few customers buying 200+ SKUs each."""
+    rng = np.random.default_rng(seed)
+    n_baskets = int(1_000 * scale)
+    catalog = 600
+
+    # Each customer follows one of a few assortment profiles plus a random tail
+    profiles = [rng.choice(catalog, 200, replace=False) for _ in range(4)]
+    rows = []
+    for b in range(n_baskets):
+        core = profiles[rng.integers(len(profiles))]
+        core = core[rng.random(len(core)) < 0.95]
+        tail = rng.choice(catalog, 20, replace=False)
+        items = np.union1d(core, tail)
+        rows.append(pd.DataFrame({"cliente_id": b, "produto_id": items}))
+
+    df = pd.concat(rows, ignore_index=True)
+    df["data"] = "2025-01-01"
+    df["valor"] = 1.0
+    return df
+
+
+def run(name: str, df: pd.DataFrame, engines: list, min_support: float, max_len: int, n_jobs: int = 1):
+    print(f"\n{name}: {len(df):,} lines, {df['cliente_id'].nunique():,} baskets, "
+          f"{df['produto_id'].nunique():,} SKUs, min_support={min_support}, max_len={max_len}")
+    print(f"{'engine':<10} {'seconds':>10} {'itemsets':>10} {'rules':>8}  same")
+
+    reference = None
+    for engine in engines:
+        analyzer = AprioriAnalyzer(
+            min_support=min_support, min_confidence=0.1, max_rules=10**9,
+            engine=engine, max_len=max_len, n_jobs=n_jobs
+        )
+
+        start = time.perf_counter()
+        rules = analyzer.analyze(df)
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference = analyzer.frequent_itemsets
+        same = "yes" if analyzer.frequent_itemsets == reference else "NO"
+
+        print(f"{engine:<10} {elapsed:>10.2f} {len(analyzer.frequent_itemsets):>10,} {len(rules):>8,}  {same}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AprioriAnalyzer engines")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--max-len", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=1.0, help="Dataset size multiplier")
+    parser.add_argument("--n-jobs", type=int, default=1, help="Processes for pair counting (-1 = all CPUs)")
+
+    args = parser.parse_args()
+
+    run("Sparse baskets", make_sparse(args.scale), args.engines, 0.001, args.max_len, args.n_jobs)
+    run("Dense baskets", make_dense(args.scale), args.engines, 0.3, args.max_len, args.n_jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,7 @@ from aiti_insights.apriori import AprioriAnalyzer
 from aiti_insights.rfm import RFMAnalyzer
 from aiti_insights.opportunities import OpportunityEngine
 from aiti_insights.reports import ReportGenerator
+from aiti_insights.cache import default_cache_dir, default_model_path
 
 
 def main():
@@ -28,6 +29,9 @@ def main():
     parser.add_argument("--products", help="Path to products CSV/Excel", default=None)
     parser.add_argument("--output", "-o", help="Output file path", default=None)
     parser.add_argument("--format", "-f", choices=["html", "markdown"], default="html")
+    parser.add_argument("--cache-dir", help="ETL cache directory (default: $AITI_CACHE_DIR)", default=None)
+    parser.add_argument("--model", help="Precomputed Apriori model, reused if the data is unchanged "
+                        "(default: $AITI_CACHE_DIR/apriori_model.npz)", default=None)
     
     args = parser.parse_args()
     
@@ -35,7 +39,7 @@ def main():
     print("📂 Loading data...")
     
     data_dir = Path(__file__).parent.parent / "data" / "demo"
-    etl = ETLProcessor()
+    etl = ETLProcessor(cache_dir=args.cache_dir or default_cache_dir())
     
     if args.sales:
         sales_df = etl.load_sales(args.sales)
@@ -58,7 +62,7 @@ def main():
     # Run Apriori
     print("🔍 Running Apriori analysis...")
     apriori = AprioriAnalyzer(min_support=0.02, min_confidence=0.3)
-    rules = apriori.analyze(sales_df)
+    rules = apriori.analyze_or_load(sales_df, args.model or default_model_path(args.cache_dir))
     print(f"   ✅ Found {len(rules)} association rules")
     
     # Run RFM
@@ -9,6 +9,7 @@ Funcionalidades:
 - ETL para importação de dados (CSV/Excel)
 - Análise Apriori para cross-sell
 - Segmentação RFM de clientes
+- Padrões sequenciais (A e depois B em N dias)
 - Dashboard interactivo Streamlit
 - Geração de relatórios semanais
 
@@ -27,13 +28,18 @@ __email__ = "info@aiparati.pt"
 from .etl import ETLProcessor
 from .apriori import AprioriAnalyzer
 from .rfm import RFMAnalyzer
+from .sequences import SequentialAnalyzer
 from .opportunities import OpportunityEngine
+from .cache import default_cache_dir, default_model_path
+from .encoding import IDVocabulary
 
 __all__ = [
     "ETLProcessor",
     "AprioriAnalyzer", 
     "RFMAnalyzer",
+    "SequentialAnalyzer",
     "OpportunityEngine",
+    "IDVocabulary",
 ]
 
 
@@ -48,10 +54,17 @@ class AITIInsights:
         engine.generate_report("relatorio.html")
     """
     
-    def __init__(self):
-        self.etl = ETLProcessor()
+    def __init__(self, cache_dir: str = None, model_path: str = None):
+        """
+        Args:
+            cache_dir: Directório da cache ETL (opcional, default AITI_CACHE_DIR)
+            model_path: Modelo Apriori pré-calculado (opcional, default em AITI_CACHE_DIR)
+        """
+        self.etl = ETLProcessor(cache_dir=cache_dir or default_cache_dir())
+        self.model_path = model_path or default_model_path(cache_dir)
         self.apriori = AprioriAnalyzer()
         self.rfm = RFMAnalyzer()
+        self.sequences = SequentialAnalyzer()
         self.opportunity_engine = OpportunityEngine()
         
         self.sales_df = None
@@ -76,16 +89,19 @@ class AITIInsights:
         Executa todas as análises e retorna oportunidades.
         
         Returns:
-            dict com regras_apriori, segmentos_rfm, e oportunidades
+            dict com regras_apriori, segmentos_rfm, regras_sequenciais e oportunidades
         """
         if self.sales_df is None:
             raise ValueError("Dados não carregados. Use load_data() primeiro.")
         
-        # Análise Apriori
-        regras = self.apriori.analyze(self.sales_df)
+        # Análise Apriori (reutiliza o modelo guardado se os dados não mudaram)
+        regras = self.apriori.analyze_or_load(self.sales_df, self.model_path, vocab=self.etl.product_vocab)
         
         # Análise RFM
-        segmentos = self.rfm.analyze(self.sales_df)
+        segmentos = self.rfm.analyze(self.sales_df, vocab=self.etl.customer_vocab)
+        
+        # Padrões sequenciais (timing do cross-sell)
+        sequencias = self.sequences.analyze(self.sales_df, vocab=self.etl.product_vocab)
         
         # Gerar oportunidades
         self.opportunities = self.opportunity_engine.generate(
@@ -93,12 +109,16 @@ class AITIInsights:
             rules=regras,
             rfm_segments=segmentos,
             customers_df=self.customers_df,
-            products_df=self.products_df
+            products_df=self.products_df,
+            sequential_rules=sequencias,
+            customer_vocab=self.etl.customer_vocab,
+            product_vocab=self.etl.product_vocab
         )
         
         return {
             "regras_apriori": regras,
             "segmentos_rfm": segmentos,
+            "regras_sequenciais": sequencias,
             "oportunidades": self.opportunities,
             "metricas": self._calculate_metrics()
         }
@@ -8,15 +8,49 @@ Identifica regras de associação entre produtos:
 Baseado no algoritmo Apriori para market basket analysis.
 """
 
+import hashlib
 import pandas as pd
 import numpy as np
-from typing import Optional, List, Dict
+from scipy import sparse
+from scipy.stats import hypergeom
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Dict, Tuple, Union
 from collections import defaultdict
 import logging
 
+from .encoding import IDVocabulary, encode_ids, json_bytes, read_json, save_npz
+from .fpgrowth import fpgrowth
+from .eclat import eclat
+from .incremental import AssociationState
+from .parallel import count_pairs_parallel, resolve_n_jobs
+from .sketch import approximate_pairs
+
 logger = logging.getLogger(__name__)
 
 
+# Motores de contagem disponíveis
+ENGINES = ("apriori", "sparse", "fpgrowth", "eclat", "sketch")
+
+# Definições de cesto disponíveis
+BASKETS = ("transaction", "day", "window")
+
+# Correcções para testes múltiplos dos p-values das regras
+CORRECTIONS = ("fdr_bh", "bonferroni", "none")
+
+# Níveis da hierarquia de produtos
+LEVELS = ("product", "category", "mixed")
+
+# Prefixo dos itens de categoria em regras mistas (evita colisões com IDs de produto)
+CATEGORY_PREFIX = "categoria:"
+
+# Motores que mineram todos os níveis de uma vez (sem contagem nível a nível)
+_MINERS = {"fpgrowth": fpgrowth, "eclat": eclat}
+
+# Versão do formato de modelo (save/load); incrementar se os arrays mudarem
+MODEL_VERSION = 1
+
+
 class AprioriAnalyzer:
     """
     Analisador de regras de associação usando Apriori.
@@ -25,6 +59,31 @@ class AprioriAnalyzer:
     - Suporte: Frequência da combinação no dataset
     - Confiança: P(B|A) - Probabilidade de B dado A
     - Lift: Quanto a regra é melhor que random
+    - p-value: teste exacto de Fisher (unilateral) de associação positiva
+      entre antecedente e consequente, corrigido para testes múltiplos
+      sobre todas as regras candidatas (Benjamini-Hochberg por omissão)
+    
+    Motores de contagem:
+    - "apriori": contagem de pares em Python, cesto a cesto
+    - "sparse": matriz CSR cesto×produto, pares via produto esparso X^T·X
+    - "fpgrowth": FP-tree sem geração de candidatos (cestos densos)
+    - "eclat": bitsets verticais por item, suporte por AND + popcount
+    - "sketch": pares aproximados com memória fixa (Count-Min sketch);
+      cada regra traz "exact" a indicar se as contagens são exactas
+    
+    Ponderação (weight="valor" ou "quantidade"):
+    - Cada cesto pesa o total da coluna weight; suporte, confiança e lift
+      usam somas de pesos em vez de números de cestos (X^T·diag(w)·X)
+    - Utilidade de um itemset: valor dos seus próprios itens nos cestos
+      que o contêm, em fracção do peso total (X^T·V); com min_utility
+      só ficam regras de itemsets de alta utilidade. O peso do cesto é
+      um majorante da utilidade e mantém a poda nível a nível
+    
+    Decaimento temporal (half_life_days):
+    - Cada cesto pesa 2^(-idade/half_life_days), com a idade contada da
+      sua última compra até à data mais recente dos dados; combina-se
+      com weight (valor × decaimento). update() mantém as contagens com
+      decaimento de forma incremental (ver AssociationState)
     
     Exemplo:
         analyzer = AprioriAnalyzer(min_support=0.05, min_confidence=0.5)
@@ -36,179 +95,867 @@ class AprioriAnalyzer:
         min_support: float = 0.01,
         min_confidence: float = 0.3,
         min_lift: float = 1.0,
-        max_rules: int = 100
+        max_p_value: float = 1.0,
+        correction: str = "fdr_bh",
+        max_rules: int = 100,
+        engine: str = "apriori",
+        max_len: int = 2,
+        n_jobs: int = 1,
+        sketch_memory_mb: float = 64,
+        sketch_max_candidates: Optional[int] = None,
+        weight: Optional[str] = None,
+        min_utility: float = 0.0,
+        half_life_days: Optional[float] = None
     ):
         """
         Args:
             min_support: Suporte mínimo (0-1)
             min_confidence: Confiança mínima (0-1)
             min_lift: Lift mínimo (>=1 significa correlação positiva)
+            max_p_value: p-value corrigido máximo (1.0 = sem filtro)
+            correction: Correcção para testes múltiplos ("fdr_bh", "bonferroni" ou "none")
             max_rules: Número máximo de regras a retornar
+            engine: Motor de contagem ("apriori", "sparse", "fpgrowth", "eclat" ou "sketch")
+            max_len: Tamanho máximo dos itemsets (2 = só pares)
+            n_jobs: Processos para a contagem de pares ("apriori"/"sparse"; -1 = todos os CPUs)
+            sketch_memory_mb: Memória do sketch e dos pares candidatos (engine="sketch")
+            sketch_max_candidates: Pares candidatos seguidos (None = derivado de sketch_memory_mb)
+            weight: Coluna de vendas que pondera os cestos ("valor" ou "quantidade")
+            min_utility: Utilidade mínima dos itemsets (fracção do peso total; requer weight)
+            half_life_days: Meia-vida do decaimento temporal dos cestos (None = sem decaimento)
         """
+        if engine not in ENGINES:
+            raise ValueError(f"Motor desconhecido: {engine}. Disponíveis: {list(ENGINES)}")
+        
+        if max_len < 1:
+            raise ValueError(f"max_len deve ser >= 1: {max_len}")
+        
+        resolve_n_jobs(n_jobs)
+        
+        if half_life_days is not None and half_life_days <= 0:
+            raise ValueError(f"half_life_days deve ser > 0: {half_life_days}")
+        
+        weighted = weight is not None or half_life_days is not None
+        if weighted and (engine not in ("apriori", "sparse") or n_jobs != 1):
+            raise ValueError("weight/half_life_days requerem engine 'apriori' ou 'sparse' com n_jobs=1")
+        
+        if min_utility > 0 and weight is None:
+            raise ValueError("min_utility requer weight (ex.: weight='valor')")
+        
+        if correction not in CORRECTIONS:
+            raise ValueError(f"Correcção desconhecida: {correction}. Disponíveis: {list(CORRECTIONS)}")
+        
+        if max_p_value < 1.0 and weighted:
+            raise ValueError("max_p_value requer contagens de cestos: use weight=None e half_life_days=None")
+        
         self.min_support = min_support
         self.min_confidence = min_confidence
         self.min_lift = min_lift
+        self.max_p_value = max_p_value
+        self.correction = correction
         self.max_rules = max_rules
+        self.engine = engine
+        self.max_len = max_len
+        self.n_jobs = n_jobs
+        self.sketch_memory_mb = sketch_memory_mb
+        self.sketch_max_candidates = sketch_max_candidates
+        self.weight = weight
+        self.min_utility = min_utility
+        self.half_life_days = half_life_days
         
         self.rules = []
         self.frequent_itemsets = {}
+        self.approximation = None
+        self.vocab = None
+        self.state = None
+        self.data_hash = None
+        self.n_baskets = 0
+        self.total_weight = 0.0
     
     def analyze(
         self,
         sales_df: pd.DataFrame,
         product_col: str = "produto_id",
         transaction_col: str = "cliente_id",
-        date_col: str = "data"
+        date_col: str = "data",
+        vocab: Optional[IDVocabulary] = None,
+        basket: str = "transaction",
+        window_days: int = None,
+        products_df: pd.DataFrame = None,
+        level: str = "product",
+        category_col: str = "categoria"
     ) -> List[Dict]:
         """
         Executa análise Apriori nos dados de vendas.
         
+        Definições de cesto (basket):
+        - "transaction": um cesto por valor de transaction_col (cliente ou factura)
+        - "day": um cesto por transaction_col e dia
+        - "window": um cesto por transaction_col e janela de window_days dias,
+          contada a partir da primeira compra de cada transaction_col
+        
+        Cestos com todo o histórico do cliente inflacionam as contagens de
+        pares; cestos por factura, dia ou janela são mais fiéis e mais baratos.
+        
+        Níveis (level), com a categoria de products_df:
+        - "product": regras entre SKUs
+        - "category": regras entre categorias ("Peixe" -> "Azeite")
+        - "mixed": SKUs e categorias (com CATEGORY_PREFIX) no mesmo cesto,
+          sem itemsets que juntem um SKU à sua própria categoria
+        
         Args:
             sales_df: DataFrame com vendas
             product_col: Coluna com ID do produto
             transaction_col: Coluna para agrupar transacções (cliente ou factura)
             date_col: Coluna de data (para agrupar por período)
-            
+            vocab: Vocabulário de produtos partilhado (opcional)
+            basket: Definição de cesto ("transaction", "day" ou "window")
+            window_days: Tamanho da janela em dias (basket="window")
+            products_df: Produtos com category_col (level "category"/"mixed")
+            level: Nível da hierarquia ("product", "category" ou "mixed")
+            category_col: Coluna de categoria em products_df
+        
         Returns:
             Lista de regras de associação ordenadas por lift
         """
         logger.info("Iniciando análise Apriori...")
         
+        if level not in LEVELS:
+            raise ValueError(f"Nível desconhecido: {level}. Disponíveis: {list(LEVELS)}")
+        
+        if level != "product" and (products_df is None or category_col not in products_df.columns):
+            raise ValueError(f"level='{level}' requer products_df com a coluna '{category_col}'")
+        
+        self.data_hash = _input_hash(
+            sales_df, self._hashed_columns(product_col, transaction_col, date_col), products_df, category_col, level
+        )
+        self._basket_params = _basket_signature(transaction_col, basket, window_days, level, category_col)
+        self._excluded = None
+        self._values = None
+        self._basket_weights = None
+        
         # Criar "cestos de compras" - produtos comprados juntos
-        baskets = self._create_baskets(sales_df, product_col, transaction_col)
+        baskets = self._create_baskets(
+            sales_df, product_col, transaction_col, vocab,
+            date_col=date_col, basket=basket, window_days=window_days
+        )
+        
+        # Subir na hierarquia: mesmos cestos, itens = categorias (ou ambos)
+        if level != "product" and baskets.shape[0] > 0:
+            baskets = self._roll_up(baskets, products_df, product_col, category_col, level)
         
-        if len(baskets) < 10:
+        if baskets.shape[0] < 10:
             logger.warning("Poucos cestos de compras para análise significativa")
             return []
         
-        # Encontrar itemsets frequentes
-        self.frequent_itemsets = self._find_frequent_itemsets(baskets)
-        
-        # Gerar regras de associação
-        self.rules = self._generate_rules(baskets)
-        
-        # Filtrar e ordenar
-        filtered_rules = [
-            r for r in self.rules
-            if r["confidence"] >= self.min_confidence
-            and r["lift"] >= self.min_lift
-        ]
+        # Encontrar itemsets frequentes (sobre códigos inteiros)
+        self._coded_itemsets = self._find_frequent_itemsets(baskets)
         
-        # Ordenar por lift (descendente)
-        filtered_rules.sort(key=lambda x: x["lift"], reverse=True)
+        return self._finalize_rules(baskets.shape[0])
+    
+    def _finalize_rules(self, n_baskets: int) -> List[Dict]:
+        """Descodifica itemsets, gera, filtra e ordena as regras."""
+        self.n_baskets = n_baskets
+        self.frequent_itemsets = {
+            frozenset(self.vocab.decode(list(itemset))): support
+            for itemset, support in self._coded_itemsets.items()
+        }
         
-        # Limitar número de regras
-        self.rules = filtered_rules[:self.max_rules]
+        # Gerar, filtrar e seleccionar o top-k sobre arrays; dicts só no fim
+        candidates = self._rule_candidates(self.total_weight if self._weighted() else n_baskets)
+        self.rules = self._select_rules(candidates)
+        self._rule_index()
         
         logger.info(f"Encontradas {len(self.rules)} regras de associação")
         
         return self.rules
     
+    def update(
+        self,
+        sales_df: pd.DataFrame,
+        product_col: str = "produto_id",
+        transaction_col: str = "cliente_id",
+        date_col: str = "data",
+        basket: str = "transaction",
+        window_days: int = None
+    ) -> List[Dict]:
+        """
+        Actualiza as contagens com novas vendas e re-deriva as regras.
+        
+        Na primeira chamada cria o estado incremental (self.state); a
+        definição de cesto fica fixa a partir daí. Só os cestos novos ou
+        alterados pelas vendas recebidas são re-contados.
+        
+        Args:
+            sales_df: Vendas novas (delta)
+            product_col: Coluna com ID do produto
+            transaction_col: Coluna para agrupar transacções
+            date_col: Coluna de data
+            basket: Definição de cesto ("transaction", "day" ou "window")
+            window_days: Tamanho da janela em dias (basket="window")
+        
+        Returns:
+            Lista de regras de associação ordenadas por lift
+        """
+        if self.max_len > 2:
+            raise ValueError("update() mantém só itens e pares: use max_len <= 2")
+        
+        if self.weight is not None:
+            raise ValueError("update() conta cestos sem ponderação: use weight=None")
+        
+        if self.state is None:
+            self.state = AssociationState(
+                basket=basket, window_days=window_days, vocab=self.vocab, half_life_days=self.half_life_days
+            )
+        
+        self.state.update(sales_df, product_col, transaction_col, date_col)
+        self._basket_params = _basket_signature(
+            transaction_col, self.state.basket, self.state.window_days, "product", "categoria"
+        )
+        return self._rules_from_state()
+    
+    def expire(self, before) -> List[Dict]:
+        """
+        Remove do estado incremental os cestos sem compras desde before
+        (janela deslizante) e re-deriva as regras.
+        """
+        if self.state is None:
+            raise ValueError("Estado incremental vazio. Use update() primeiro.")
+        
+        self.state.expire(before)
+        return self._rules_from_state()
+    
+    def _rules_from_state(self) -> List[Dict]:
+        """
+        Re-deriva itemsets frequentes e regras a partir das contagens do estado.
+        
+        O modelo deixa de corresponder a um DataFrame de vendas concreto:
+        data_hash fica None e analyze_or_load() não o reutiliza.
+        """
+        self.data_hash = None
+        n_baskets = self.state.n_baskets
+        self.vocab = self.state.vocab
+        self.total_weight = float(self.state.total)
+        
+        if n_baskets < 10:
+            logger.warning("Poucos cestos de compras para análise significativa")
+            self.rules = []
+            return self.rules
+        
+        self._approximate = set()
+        self._utilities = {}
+        self._levels = {
+            k: level for k, level in self.state.levels(self.min_support).items()
+            if k <= self.max_len
+        }
+        # Com decaimento as contagens são somas de pesos: suporte relativo ao peso total
+        total = self.total_weight if self._weighted() else n_baskets
+        self._coded_itemsets = {
+            frozenset(itemset): count / total
+            for itemsets, counts in self._levels.values()
+            for itemset, count in zip(itemsets.tolist(), counts.tolist())
+        }
+        
+        return self._finalize_rules(n_baskets)
+    
     def _create_baskets(
         self,
         df: pd.DataFrame,
         product_col: str,
-        transaction_col: str
-    ) -> List[set]:
+        transaction_col: str,
+        vocab: Optional[IDVocabulary] = None,
+        date_col: str = "data",
+        basket: str = "transaction",
+        window_days: int = None
+    ) -> sparse.csr_matrix:
         """
         Cria cestos de compras agrupando produtos por transacção/cliente.
+        
+        Devolve a matriz de incidência cesto×produto em formato CSR
+        (uma linha por cesto, colunas = códigos de produto ordenados).
+        Com weight, self._values fica com a mesma estrutura e o total
+        da coluna weight de cada (cesto, produto); com weight ou
+        half_life_days, self._basket_weights tem o peso de cada cesto.
         """
-        baskets = []
+        if basket not in BASKETS:
+            raise ValueError(f"Definição de cesto desconhecida: {basket}. Disponíveis: {list(BASKETS)}")
+        
+        if basket == "window" and (window_days is None or window_days < 1):
+            raise ValueError("basket='window' requer window_days >= 1")
         
-        # Agrupar por transacção
-        grouped = df.groupby(transaction_col)[product_col].apply(set).reset_index()
+        if self.weight is not None and self.weight not in df.columns:
+            raise ValueError(f"Coluna de ponderação em falta: {self.weight}")
         
-        for _, row in grouped.iterrows():
-            if len(row[product_col]) >= 2:  # Só cestos com 2+ produtos
-                baskets.append(row[product_col])
+        if len(df) == 0:
+            logger.info("Criados 0 cestos de compras")
+            return sparse.csr_matrix((0, 0), dtype=np.int32)
         
-        logger.info(f"Criados {len(baskets)} cestos de compras")
+        transactions = self._basket_keys(df, transaction_col, date_col, basket, window_days)
+        products, self.vocab = encode_ids(df[product_col], vocab)
+        n_products = len(self.vocab)
+        
+        # Pares (transacção, produto) únicos, ordenados por transacção
+        keys, inverse = np.unique(transactions.astype(np.int64) * n_products + products, return_inverse=True)
+        basket_ids = keys // n_products
+        items = (keys % n_products).astype(products.dtype)
+        
+        # Só cestos com 2+ produtos
+        basket_codes, basket_index, sizes = np.unique(basket_ids, return_inverse=True, return_counts=True)
+        keep = sizes[basket_index] >= 2
+        basket_codes = basket_codes[sizes >= 2]
+        sizes = sizes[sizes >= 2]
+        
+        indptr = np.concatenate([[0], np.cumsum(sizes)])
+        baskets = sparse.csr_matrix(
+            (np.ones(int(indptr[-1]), dtype=np.int32), items[keep], indptr),
+            shape=(len(sizes), n_products)
+        )
+        
+        # Decaimento: 2^(-idade/meia-vida) pela última compra de cada cesto
+        decay = None
+        if self.half_life_days is not None:
+            days = pd.to_datetime(df[date_col]).to_numpy().astype("datetime64[D]").astype(np.int64)
+            last_day = np.full(int(transactions.max()) + 1, days.min(), dtype=np.int64)
+            np.maximum.at(last_day, transactions, days)
+            decay = np.exp2(-(days.max() - last_day[basket_codes]) / self.half_life_days)
+        
+        if self.weight is not None:
+            # Devoluções (valores negativos) não pesam: mantém a poda monótona
+            weights = pd.to_numeric(df[self.weight], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+            amounts = np.clip(np.bincount(inverse.ravel(), weights=weights, minlength=len(keys)), 0, None)
+            self._values = sparse.csr_matrix((amounts[keep], items[keep], indptr), shape=baskets.shape)
+            if decay is not None:
+                self._values = sparse.csr_matrix(sparse.diags(decay) @ self._values)
+            self._basket_weights = np.asarray(self._values.sum(axis=1)).ravel()
+        elif decay is not None:
+            self._basket_weights = decay
+        
+        logger.info(f"Criados {baskets.shape[0]} cestos de compras")
         return baskets
     
-    def _find_frequent_itemsets(self, baskets: List[set]) -> Dict[frozenset, float]:
+    def _roll_up(
+        self,
+        baskets: sparse.csr_matrix,
+        products_df: pd.DataFrame,
+        product_col: str,
+        category_col: str,
+        level: str
+    ) -> sparse.csr_matrix:
         """
-        Encontra itemsets frequentes usando Apriori.
+        Remapeia os cestos para o espaço de categorias.
+        
+        Com H a matriz produto×categoria, X·H dá as categorias de cada
+        cesto; o motor de contagem corre sobre este espaço (muito menor)
+        sem alterações. Em "mixed" as colunas de categoria juntam-se às
+        de produto e os pares (SKU, categoria do SKU) ficam excluídos.
+        Com weight, V·H dá o valor de cada categoria no cesto.
         """
-        n_baskets = len(baskets)
-        frequent = {}
+        # Chaves comparadas como texto: o ETL guarda produto_id das vendas
+        # como string, mas o ficheiro de produtos pode trazê-lo numérico
+        product_ids = products_df[product_col].astype(str).str.strip()
+        categories = (
+            products_df.assign(**{product_col: product_ids})
+            .drop_duplicates(product_col)
+            .set_index(product_col)[category_col]
+            .reindex(pd.Index(self.vocab.values).astype(str).str.strip())
+        )
+        known = categories.notna().to_numpy()
+        
+        if not known.any():
+            raise ValueError(
+                f"Nenhum produto das vendas tem '{category_col}' em products_df "
+                f"(verifique se '{product_col}' usa os mesmos IDs)"
+            )
+        if not known.all():
+            logger.warning(f"{int((~known).sum())} de {len(known)} produtos sem '{category_col}': ignorados na hierarquia")
+        
+        category_codes, category_vocab = encode_ids(categories[known])
+        products = np.flatnonzero(known)
+        n_products, n_categories = len(self.vocab), len(category_vocab)
+        
+        hierarchy = sparse.csr_matrix(
+            (np.ones(len(products), dtype=np.int32), (products, category_codes)),
+            shape=(n_products, n_categories)
+        )
+        rolled = baskets[:, :n_products] @ hierarchy
+        rolled.data[:] = 1
+        values = self._values[:, :n_products] @ hierarchy if self._values is not None else None
+        
+        if level == "category":
+            self.vocab = IDVocabulary(category_vocab.values)
+            keep = np.diff(rolled.indptr) >= 2
+            rolled = rolled[keep]
+            if values is not None:
+                values = values[keep]
+                self._basket_weights = np.asarray(values.sum(axis=1)).ravel()
+            elif self._basket_weights is not None:
+                self._basket_weights = self._basket_weights[keep]
+        else:
+            self.vocab = IDVocabulary(np.concatenate([
+                self.vocab.values,
+                np.array([f"{CATEGORY_PREFIX}{c}" for c in category_vocab.values], dtype=object),
+            ]))
+            rolled = sparse.hstack([baskets[:, :n_products], rolled], format="csr")
+            values = sparse.hstack([self._values, values], format="csr") if values is not None else None
+            self._excluded = products.astype(np.int64) * len(self.vocab) + n_products + category_codes
+        
+        rolled = sparse.csr_matrix(rolled, dtype=np.int32)
+        rolled.sort_indices()
+        if values is not None:
+            self._values = sparse.csr_matrix(values, dtype=np.float64)
+        
+        logger.info(f"Hierarquia '{level}': {n_categories} categorias, {rolled.shape[0]} cestos")
+        return rolled
+    
+    def _drop_excluded(self, itemsets: np.ndarray, *arrays: np.ndarray) -> tuple:
+        """
+        Remove itemsets que contêm um par excluído (SKU + a sua categoria),
+        e as posições correspondentes dos arrays alinhados (contagens, ...).
+        """
+        if getattr(self, "_excluded", None) is None or len(itemsets) == 0:
+            return (itemsets, *arrays)
+        
+        n = len(self.vocab)
+        keep = np.ones(len(itemsets), dtype=bool)
+        for i in range(itemsets.shape[1]):
+            for j in range(i + 1, itemsets.shape[1]):
+                keys = itemsets[:, i].astype(np.int64) * n + itemsets[:, j]
+                keep &= ~np.isin(keys, self._excluded)
+        
+        return (itemsets[keep], *(a[keep] for a in arrays))
+    
+    def _basket_keys(
+        self,
+        df: pd.DataFrame,
+        transaction_col: str,
+        date_col: str,
+        basket: str,
+        window_days: int = None
+    ) -> np.ndarray:
+        """
+        Código inteiro do cesto de cada linha de vendas.
+        
+        Para "day" e "window" o cesto é o par (transacção, período), com o
+        período calculado de forma vectorizada sobre as datas ordenadas.
+        """
+        transactions, _ = encode_ids(df[transaction_col])
+        
+        if basket == "transaction":
+            return transactions
+        
+        days = pd.to_datetime(df[date_col]).to_numpy().astype("datetime64[D]").astype(np.int64)
+        
+        if basket == "day":
+            periods = days - days.min()
+        else:
+            # Primeira compra de cada transacção: mínimo por grupo sobre dados ordenados
+            order = np.lexsort((days, transactions))
+            sorted_transactions = transactions[order]
+            starts = np.flatnonzero(np.r_[True, sorted_transactions[1:] != sorted_transactions[:-1]])
+            first_day = np.empty(int(transactions.max()) + 1, dtype=np.int64)
+            first_day[sorted_transactions[starts]] = days[order][starts]
+            periods = (days - first_day[transactions]) // window_days
+        
+        keys = transactions.astype(np.int64) * (int(periods.max()) + 1) + periods
+        codes, _ = pd.factorize(keys)
+        return codes.astype(np.int32)
+    
+    def _find_frequent_itemsets(self, baskets: sparse.csr_matrix) -> Dict[frozenset, float]:
+        """
+        Encontra itemsets frequentes usando Apriori (nível a nível).
+        
+        Cada nível k fica em self._levels[k] como (itemsets, counts):
+        um array int32 (n_k, k) de códigos ordenados, por ordem
+        lexicográfica, e um array com o número de cestos de cada um
+        (com weight, a soma dos pesos dos cestos, e self._utilities[k]
+        com a utilidade de cada itemset).
+        
+        As chaves do dict devolvido são frozensets de códigos de produto.
+        """
+        n_baskets = baskets.shape[0]
+        self._approximate = set()
+        self._utilities = {}
+        self.approximation = None
+        weighted = self._weighted()
+        
+        # Contar itens individuais (pesos dos cestos com weight/decaimento)
+        if weighted:
+            self.total_weight = float(self._basket_weights.sum())
+            rows = np.repeat(np.arange(n_baskets), np.diff(baskets.indptr))
+            item_counts = np.bincount(
+                baskets.indices, weights=self._basket_weights[rows], minlength=baskets.shape[1]
+            )
+            total = self.total_weight
+        else:
+            item_counts = np.bincount(baskets.indices, minlength=baskets.shape[1])
+            total = n_baskets
+        
+        # Filtrar por suporte mínimo (e pelo majorante da utilidade)
+        min_count = max(self.min_support, self.min_utility) * total
+        frequent_items = np.flatnonzero(item_counts >= min_count)
         
-        # Contar itens individuais
-        item_counts = defaultdict(int)
-        for basket in baskets:
-            for item in basket:
-                item_counts[item] += 1
-        
-        # Filtrar por suporte mínimo
-        min_count = self.min_support * n_baskets
-        frequent_items = {
-            item for item, count in item_counts.items()
-            if count >= min_count
+        self._levels = {
+            1: (frequent_items[:, None].astype(np.int32), item_counts[frequent_items].astype(np.float64 if weighted else np.int64))
         }
+        if self._values is not None:
+            item_values = np.asarray(self._values.sum(axis=0)).ravel()
+            self._utilities[1] = item_values[frequent_items]
         
-        # Guardar suporte de itens individuais
-        for item in frequent_items:
-            frequent[frozenset([item])] = item_counts[item] / n_baskets
+        if self.engine in _MINERS:
+            mine = _MINERS[self.engine]
+            self._levels.update({
+                k: level for k, level in mine(baskets, min_count, self.max_len).items() if k >= 2
+            })
+            if 2 in self._levels:
+                pairs, counts = self._levels[2]
+                keep = counts / n_baskets >= self.min_support
+                self._levels[2] = (pairs[keep], counts[keep])
+            
+            for k in [k for k in self._levels if k >= 2]:
+                self._levels[k] = self._drop_excluded(*self._levels[k])
         
         # Encontrar pares frequentes
+        elif self.max_len >= 2 and len(frequent_items) >= 2:
+            utilities = None
+            if weighted:
+                pairs, counts, utilities = self._count_pairs_weighted(baskets, frequent_items, min_count)
+            elif self.engine == "sketch":
+                pairs, counts, exact, self.approximation = approximate_pairs(
+                    baskets, frequent_items, min_count, self.sketch_memory_mb, self.sketch_max_candidates
+                )
+                self._approximate = {frozenset(p) for p in pairs[~exact].tolist()}
+            elif self.n_jobs != 1:
+                pairs, counts = count_pairs_parallel(baskets, frequent_items, min_count, self.n_jobs)
+            elif self.engine == "sparse":
+                pairs, counts = self._count_pairs_sparse(baskets, frequent_items)
+            else:
+                pairs, counts = self._count_pairs_python(baskets, frequent_items)
+            
+            keep = counts / total >= self.min_support
+            pairs, counts = pairs[keep], counts[keep]
+            order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+            if utilities is not None:
+                pairs, counts, self._utilities[2] = self._drop_excluded(
+                    pairs[order], counts[order], utilities[keep][order]
+                )
+                self._levels[2] = (pairs, counts)
+            else:
+                self._levels[2] = self._drop_excluded(pairs[order], counts[order])
+        
+        # Níveis k >= 3: candidatos a partir do nível k-1
+        k = 3
+        while self.engine not in _MINERS and k <= self.max_len and len(self._levels.get(k - 1, ((), ()))[0]) >= 2:
+            itemsets, counts, utilities = self._count_level(baskets, self._levels[k - 1][0], min_count)
+            if len(itemsets) == 0:
+                break
+            self._levels[k] = (itemsets, counts)
+            if utilities is not None:
+                self._utilities[k] = utilities
+            k += 1
+        
+        frequent = {}
+        for itemsets, counts in self._levels.values():
+            for itemset, count in zip(itemsets.tolist(), counts.tolist()):
+                frequent[frozenset(itemset)] = count / total
+        
+        logger.info(f"Encontrados {len(frequent)} itemsets frequentes")
+        return frequent
+    
+    def _count_pairs_python(
+        self,
+        baskets: sparse.csr_matrix,
+        frequent_items: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Conta pares de itens frequentes cesto a cesto."""
+        frequent_mask = np.zeros(baskets.shape[1], dtype=bool)
+        frequent_mask[frequent_items] = True
+        
         pair_counts = defaultdict(int)
-        for basket in baskets:
-            items = basket & frequent_items
-            items_list = list(items)
+        indptr, indices = baskets.indptr, baskets.indices
+        
+        for b in range(baskets.shape[0]):
+            basket = indices[indptr[b]:indptr[b + 1]]
+            items_list = basket[frequent_mask[basket]].tolist()
             for i in range(len(items_list)):
                 for j in range(i + 1, len(items_list)):
-                    pair = frozenset([items_list[i], items_list[j]])
-                    pair_counts[pair] += 1
+                    pair_counts[(items_list[i], items_list[j])] += 1
         
-        # Filtrar pares por suporte
-        for pair, count in pair_counts.items():
-            support = count / n_baskets
-            if support >= self.min_support:
-                frequent[pair] = support
+        pairs = np.array(list(pair_counts.keys()), dtype=np.int32).reshape(-1, 2)
+        counts = np.array(list(pair_counts.values()), dtype=np.int64)
+        return pairs, counts
+    
+    def _count_pairs_sparse(
+        self,
+        baskets: sparse.csr_matrix,
+        frequent_items: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Conta pares de itens frequentes com o produto esparso X^T·X.
         
-        logger.info(f"Encontrados {len(frequent)} itemsets frequentes")
-        return frequent
+        X é a matriz cesto×item restrita aos itens frequentes; a entrada
+        (i, j) de X^T·X é o número de cestos com i e j.
+        """
+        x = baskets[:, frequent_items]
+        
+        co_occurrence = sparse.triu(x.T @ x, k=1).tocoo()
+        
+        min_count = self.min_support * baskets.shape[0]
+        keep = co_occurrence.data >= min_count
+        pairs = np.column_stack([
+            frequent_items[co_occurrence.row[keep]],
+            frequent_items[co_occurrence.col[keep]],
+        ]).astype(np.int32)
+        
+        return pairs, co_occurrence.data[keep].astype(np.int64)
     
-    def _generate_rules(self, baskets: List[set]) -> List[Dict]:
+    def _count_pairs_weighted(
+        self,
+        baskets: sparse.csr_matrix,
+        frequent_items: np.ndarray,
+        min_count: float
+    ) -> tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
         """
-        Gera regras de associação a partir dos itemsets frequentes.
+        Peso e utilidade dos pares de itens frequentes por produtos esparsos.
+        
+        Com X a matriz binária cesto×item, w os pesos dos cestos e V os
+        valores de cada item no cesto: X^T·diag(w)·X dá o peso dos cestos
+        com i e j; S = X^T·V dá o valor de j nos cestos com i, e a
+        utilidade do par é S[i, j] + S[j, i] (None sem weight).
         """
-        rules = []
-        n_baskets = len(baskets)
+        x = baskets[:, frequent_items]
         
-        # Para cada par frequente, gerar regras A->B e B->A
-        for itemset, support in self.frequent_itemsets.items():
-            if len(itemset) != 2:
-                continue
-            
-            items = list(itemset)
-            
-            for i in range(2):
-                antecedent = frozenset([items[i]])
-                consequent = frozenset([items[1-i]])
-                
-                # Calcular confiança: P(B|A) = support(A,B) / support(A)
-                support_antecedent = self.frequent_itemsets.get(antecedent, 0)
-                support_consequent = self.frequent_itemsets.get(consequent, 0)
+        co_weight = sparse.triu(x.T @ sparse.diags(self._basket_weights) @ x, k=1).tocoo()
+        keep = co_weight.data >= min_count
+        rows, cols = co_weight.row[keep], co_weight.col[keep]
+        
+        # Só as entradas dos pares frequentes de S e S^T
+        utilities = None
+        if self._values is not None:
+            shares = sparse.csr_matrix(x.T @ self._values[:, frequent_items])
+            utilities = (
+                np.asarray(shares[rows, cols]).ravel()
+                + np.asarray(shares[cols, rows]).ravel()
+            )
+        
+        pairs = np.column_stack([frequent_items[rows], frequent_items[cols]]).astype(np.int32)
+        return pairs, co_weight.data[keep].astype(np.float64), utilities
+    
+    def _count_level(
+        self,
+        baskets: sparse.csr_matrix,
+        previous: np.ndarray,
+        min_count: float
+    ) -> tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        Gera e conta os candidatos de tamanho k a partir do nível k-1.
+        
+        Dois itemsets do nível k-1 com o mesmo prefixo de k-2 itens
+        juntam-se num candidato; candidatos com algum subconjunto de
+        tamanho k-1 não frequente são podados (propriedade downward
+        closure). A contagem é feita por "pai": os cestos que contêm
+        o pai são intersectados e as extensões somadas de uma vez.
+        
+        Com weight ou decaimento, as contagens são somas de pesos dos
+        cestos; com weight, o terceiro array traz a utilidade de cada
+        itemset (senão None).
+        """
+        k = previous.shape[1] + 1
+        known = set(map(tuple, previous.tolist()))
+        columns = baskets.tocsc()
+        
+        # Grupos de itemsets com o mesmo prefixo (previous está ordenado)
+        prefixes = previous[:, :-1]
+        change = np.flatnonzero(np.any(prefixes[1:] != prefixes[:-1], axis=1)) + 1
+        bounds = np.concatenate([[0], change, [len(previous)]])
+        
+        weighted = self._weighted()
+        with_utility = self._values is not None
+        itemsets, counts, utilities = [], [], []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            for i in range(start, end - 1):
+                parent = previous[i].tolist()
                 
-                if support_antecedent == 0:
+                # Poda: todos os subconjuntos de tamanho k-1 têm de ser frequentes
+                extensions = [
+                    b for b in previous[i + 1:end, -1].tolist()
+                    if all(
+                        tuple(parent[:j] + parent[j + 1:] + [b]) in known
+                        for j in range(k - 2)
+                    )
+                ]
+                if not extensions:
                     continue
                 
-                confidence = support / support_antecedent
-                
-                # Calcular lift: confidence / support(B)
-                if support_consequent == 0:
-                    continue
-                    
-                lift = confidence / support_consequent
+                # Cestos que contêm todos os itens do pai
+                rows = columns.indices[columns.indptr[parent[0]]:columns.indptr[parent[0] + 1]]
+                for item in parent[1:]:
+                    rows = np.intersect1d(
+                        rows, columns.indices[columns.indptr[item]:columns.indptr[item + 1]],
+                        assume_unique=True
+                    )
+                if not weighted:
+                    if len(rows) < min_count:
+                        continue
+                    ext_counts = np.asarray(baskets[rows][:, extensions].sum(axis=0)).ravel()
+                    ext_utilities = ext_counts
+                else:
+                    # Peso: w·X; utilidade: valor do pai por cesto ·X + valor da extensão
+                    weights = self._basket_weights[rows]
+                    if weights.sum() < min_count:
+                        continue
+                    present = baskets[rows][:, extensions]
+                    ext_counts = present.T @ weights
+                    ext_utilities = ext_counts
+                    if with_utility:
+                        values = self._values[rows]
+                        parent_value = np.asarray(values[:, parent].sum(axis=1)).ravel()
+                        ext_utilities = present.T @ parent_value + np.asarray(values[:, extensions].sum(axis=0)).ravel()
                 
-                rules.append({
-                    "antecedent": list(antecedent),
-                    "consequent": list(consequent),
-                    "support": round(support, 4),
-                    "confidence": round(confidence, 4),
-                    "lift": round(lift, 2),
-                    "count": int(support * n_baskets)
-                })
+                for b, count, utility in zip(extensions, ext_counts.tolist(), ext_utilities.tolist()):
+                    if count >= min_count:
+                        itemsets.append(parent + [b])
+                        counts.append(count)
+                        utilities.append(utility)
+        
+        logger.info(f"Nível {k}: {len(itemsets)} itemsets frequentes")
+        return (
+            np.array(itemsets, dtype=np.int32).reshape(-1, k),
+            np.array(counts, dtype=np.float64 if weighted else np.int64),
+            np.array(utilities, dtype=np.float64) if with_utility else None,
+        )
+    
+    def _rule_candidates(self, total: float) -> Dict[str, np.ndarray]:
+        """
+        Todas as regras candidatas X\\{c} -> c em arrays, nível a nível.
+        
+        Para cada itemset de tamanho k e cada posição j, o antecedente é
+        o itemset sem a coluna j (procurado no nível k-1 por pesquisa
+        binária) e o consequente é a coluna j. A ordem dos candidatos é
+        a de geração (nível, itemset, consequente), usada para desempates.
+        
+        total é o número de cestos (ou o peso total, com weight ou
+        decaimento); com weight, itemsets abaixo de min_utility não geram
+        regras.
+        
+        Sem ponderação, o p-value de cada candidato sai da tabela de
+        contingência (cestos com X∪c, com X, com c, total): P(>= count)
+        numa hipergeométrica, calculado de uma vez para todos e corrigido
+        para o número de candidatos.
+        """
+        n_items = len(self.vocab)
+        utilities = getattr(self, "_utilities", {})
+        weighted = self._weighted()
+        item_counts = np.zeros(n_items, dtype=np.float64 if weighted else np.int64)
+        singles, single_counts = self._levels.get(1, (np.empty((0, 1), dtype=np.int32), np.empty(0, dtype=np.int64)))
+        item_counts[singles[:, 0]] = single_counts
+        
+        approximate = _pair_keys(
+            np.array([sorted(p) for p in self._approximate], dtype=np.int64).reshape(-1, 2), n_items
+        )
+        
+        parts = defaultdict(list)
+        for k in sorted(self._levels):
+            if k < 2:
+                continue
+            itemsets, counts = self._levels[k]
+            previous, previous_counts = self._levels.get(
+                k - 1, (np.empty((0, k - 1), dtype=np.int32), np.empty(0, dtype=np.int64))
+            )
+            lookup = _RowLookup(previous)
+            itemset_exact = ~_contains_pairs(itemsets, approximate, n_items)
+            
+            # Ordem de geração: itemset a itemset, consequente por ordem crescente
+            rows = np.repeat(np.arange(len(itemsets)), k)
+            positions = np.tile(np.arange(k), len(itemsets))
+            others = np.array([[c for c in range(k) if c != j] for j in range(k)], dtype=np.intp)
+            antecedents = itemsets[rows[:, None], others[positions]]
+            
+            found = lookup.find(antecedents)
+            known = found >= 0
+            consequents = itemsets[rows, positions]
+            known &= item_counts[consequents] > 0
+            if utilities:
+                known &= utilities[k][rows] >= self.min_utility * total
+                parts["utility"].append(utilities[k][rows[known]] / total)
+            
+            parts["itemset_level"].append(np.full(int(known.sum()), k, dtype=np.int32))
+            parts["itemset_row"].append(rows[known])
+            parts["consequent"].append(consequents[known])
+            parts["position"].append(positions[known])
+            parts["count"].append(counts[rows[known]])
+            parts["antecedent_count"].append(previous_counts[found[known]])
+            parts["exact"].append(
+                itemset_exact[rows[known]] & ~_contains_pairs(antecedents[known], approximate, n_items)
+            )
+        
+        if not parts:
+            return {}
+        
+        candidates = {name: np.concatenate(values) for name, values in parts.items()}
+        count = candidates["count"].astype(np.float64)
+        
+        candidates["support"] = count / total
+        candidates["confidence"] = candidates["support"] / (candidates["antecedent_count"] / total)
+        candidates["lift"] = candidates["confidence"] / (item_counts[candidates["consequent"]] / total)
+        
+        if not weighted:
+            p_values = hypergeom.sf(
+                candidates["count"] - 1, int(total),
+                candidates["antecedent_count"], item_counts[candidates["consequent"]]
+            )
+            candidates["p_value"] = _adjust_p_values(p_values, self.correction)
+        return candidates
+    
+    def _select_rules(self, candidates: Dict[str, np.ndarray]) -> List[Dict]:
+        """
+        Filtra os candidatos e selecciona as max_rules com maior lift.
+        
+        A selecção usa np.argpartition (sem ordenar todos os candidatos);
+        só os sobreviventes são ordenados (lift decrescente, desempate
+        pela ordem de geração) e convertidos em dicts.
+        """
+        if not candidates:
+            return []
+        
+        confidence = np.round(candidates["confidence"], 4)
+        lift = np.round(candidates["lift"], 2)
+        
+        passed = (confidence >= self.min_confidence) & (lift >= self.min_lift)
+        if "p_value" in candidates:
+            passed &= candidates["p_value"] <= self.max_p_value
+        survivors = np.flatnonzero(passed)
+        
+        # Top-k parcial: todos os candidatos com lift >= ao k-ésimo maior
+        if len(survivors) > self.max_rules:
+            kth = len(survivors) - self.max_rules
+            threshold = np.partition(lift[survivors], kth)[kth]
+            survivors = survivors[lift[survivors] >= threshold]
+        
+        survivors = survivors[np.lexsort((survivors, -lift[survivors]))][:self.max_rules]
+        
+        weighted = self._weighted()
+        rules = []
+        for i in survivors.tolist():
+            itemset = self._levels[int(candidates["itemset_level"][i])][0][candidates["itemset_row"][i]]
+            antecedent = np.delete(itemset, candidates["position"][i])
+            
+            rule = {
+                "antecedent": self.vocab.decode(antecedent).tolist(),
+                "consequent": self.vocab.decode([candidates["consequent"][i]]).tolist(),
+                "support": round(float(candidates["support"][i]), 4),
+                "confidence": float(confidence[i]),
+                "lift": float(lift[i]),
+                "count": int(candidates["count"][i]),
+                "exact": bool(candidates["exact"][i]),
+            }
+            if "p_value" in candidates:
+                rule["p_value"] = float(candidates["p_value"][i])
+            if weighted:
+                rule["count"] = round(float(candidates["count"][i]), 2)
+            if "utility" in candidates:
+                rule["utilidade"] = round(float(candidates["utility"][i]), 4)
+            
+            rules.append(rule)
         
         return rules
     
@@ -223,15 +970,20 @@ class AprioriAnalyzer:
         Args:
             customer_products: Lista de produtos que o cliente já compra
             max_recommendations: Máximo de recomendações
-            
+        
         Returns:
             Lista de produtos recomendados com probabilidade
         """
         recommendations = {}
         customer_set = set(customer_products)
         
-        for rule in self.rules:
-            antecedent = set(rule["antecedent"])
+        # Só as regras com algum item do antecedente nos produtos do cliente
+        index = self._rule_index()
+        candidates = sorted({i for product in customer_set for i in index.get(product, ())})
+        
+        for i in candidates:
+            rule = self.rules[i]
+            antecedent = self._antecedents[i]
             consequent = rule["consequent"][0]
             
             # Se cliente compra o antecedente mas não o consequente
@@ -259,6 +1011,356 @@ class AprioriAnalyzer:
         
         return sorted_recs[:max_recommendations]
     
+    def customer_matrix(
+        self,
+        sales_df: pd.DataFrame,
+        customer_col: str = "cliente_id",
+        product_col: str = "produto_id"
+    ) -> Tuple[sparse.csr_matrix, np.ndarray]:
+        """
+        Matriz esparsa cliente×produto no espaço de códigos das regras.
+        
+        Produtos fora do vocabulário da análise são ignorados.
+        
+        Returns:
+            (matriz CSR binária, IDs de cliente de cada linha)
+        """
+        if self.vocab is None:
+            raise ValueError("Análise não executada. Use analyze() primeiro.")
+        
+        customers, customer_vocab = encode_ids(sales_df[customer_col])
+        products = self.vocab.encode(sales_df[product_col])
+        known = products >= 0
+        
+        matrix = sparse.csr_matrix(
+            (np.ones(int(known.sum()), dtype=np.int8), (customers[known], products[known])),
+            shape=(len(customer_vocab), len(self.vocab))
+        )
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return matrix, customer_vocab.values
+    
+    def recommend_batch(
+        self,
+        customer_item_matrix: sparse.spmatrix,
+        k: int = 5
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Recomendações para todos os clientes de uma vez.
+        
+        Equivalente a get_recommendations por linha: a pontuação de um
+        produto é a maior confiança entre as regras cujo antecedente o
+        cliente já compra, excluindo produtos que já compra. As regras
+        que disparam saem do produto esparso cliente×item · item×regra
+        (itens do antecedente possuídos == tamanho do antecedente).
+        
+        Args:
+            customer_item_matrix: Matriz esparsa cliente×produto (colunas =
+                códigos do vocabulário, ver customer_matrix)
+            k: Recomendações por cliente
+        
+        Returns:
+            (códigos de produto int32 (n_clientes, k), confianças float32
+            (n_clientes, k)); posições vazias com -1 e 0. Use
+            self.vocab.decode para obter os IDs.
+        """
+        antecedents, sizes, consequents, confidences = self._rule_arrays()
+        n_items = antecedents.shape[1]
+        
+        x = sparse.csr_matrix(customer_item_matrix, dtype=np.int32)
+        x.resize((x.shape[0], n_items))
+        x.sum_duplicates()
+        x.data[:] = 1
+        n_customers = x.shape[0]
+        
+        top_items = np.full((n_customers, k), -1, dtype=np.int32)
+        top_scores = np.zeros((n_customers, k), dtype=np.float32)
+        
+        if len(sizes) == 0 or n_customers == 0 or k == 0:
+            return top_items, top_scores
+        
+        # Regras que disparam: todos os itens do antecedente possuídos
+        owned = (x @ antecedents.T).tocoo()
+        fired = owned.data == sizes[owned.col]
+        customers, rules = owned.row[fired].astype(np.int64), owned.col[fired]
+        items = consequents[rules].astype(np.int64)
+        scores = confidences[rules]
+        
+        # Excluir produtos que o cliente já compra
+        keys = customers * n_items + items
+        owned_keys = np.repeat(np.arange(n_customers, dtype=np.int64), np.diff(x.indptr)) * n_items + x.indices
+        new = ~np.isin(keys, owned_keys)
+        customers, items, scores, keys = customers[new], items[new], scores[new], keys[new]
+        
+        # Melhor confiança por (cliente, produto)
+        order = np.lexsort((-scores, keys))
+        keys, scores = keys[order], scores[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        customers, items, scores = keys[first] // n_items, keys[first] % n_items, scores[first]
+        
+        # Top-k por cliente
+        order = np.lexsort((items, -scores, customers))
+        customers, items, scores = customers[order], items[order], scores[order]
+        new_customer = np.ones(len(customers), dtype=bool)
+        new_customer[1:] = customers[1:] != customers[:-1]
+        starts = np.flatnonzero(new_customer)
+        rank = np.arange(len(customers)) - np.repeat(starts, np.diff(np.r_[starts, len(customers)]))
+        keep = rank < k
+        
+        top_items[customers[keep], rank[keep]] = items[keep]
+        top_scores[customers[keep], rank[keep]] = scores[keep]
+        
+        return top_items, top_scores
+    
+    def _rule_arrays(self) -> tuple:
+        """
+        Regras em arrays: antecedentes (CSR regra×item), tamanho do
+        antecedente, código do consequente e confiança.
+        """
+        if getattr(self, "_arrays_rules", None) is not self.rules:
+            n_items = len(self.vocab) if self.vocab is not None else 0
+            lengths = np.array([len(r["antecedent"]) for r in self.rules], dtype=np.int32)
+            codes = (
+                self.vocab.encode([p for r in self.rules for p in r["antecedent"]])
+                if self.rules else np.empty(0, dtype=np.int32)
+            )
+            
+            antecedents = sparse.csr_matrix(
+                (np.ones(len(codes), dtype=np.int32), codes, np.r_[0, np.cumsum(lengths)]),
+                shape=(len(self.rules), n_items)
+            )
+            consequents = (
+                self.vocab.encode([r["consequent"][0] for r in self.rules])
+                if self.rules else np.empty(0, dtype=np.int32)
+            )
+            confidences = np.array([r["confidence"] for r in self.rules], dtype=np.float32)
+            
+            self._arrays = (antecedents, lengths, consequents, confidences)
+            self._arrays_rules = self.rules
+        
+        return self._arrays
+    
+    def _rule_index(self) -> Dict[str, List[int]]:
+        """
+        Índice invertido produto -> posições das regras com esse produto
+        no antecedente (reconstruído quando self.rules muda).
+        """
+        if getattr(self, "_indexed_rules", None) is not self.rules:
+            index = defaultdict(list)
+            for i, rule in enumerate(self.rules):
+                for product in rule["antecedent"]:
+                    index[product].append(i)
+            
+            self._index = dict(index)
+            self._antecedents = [frozenset(rule["antecedent"]) for rule in self.rules]
+            self._indexed_rules = self.rules
+        
+        return self._index
+    
+    def save(self, path: Union[str, Path]):
+        """
+        Guarda o modelo (itemsets frequentes, regras e vocabulário).
+        
+        Formato: arquivo NumPy (.npz, sem pickle) com um cabeçalho JSON de
+        metadados (hash dos dados, limiares, data) e arrays de códigos
+        int32. load() reconstrói o analisador sem voltar a minerar.
+        """
+        if self.vocab is None:
+            raise ValueError("Análise não executada. Use analyze() primeiro.")
+        
+        header = {
+            "versao": MODEL_VERSION,
+            "data_hash": self.data_hash,
+            "criado_em": datetime.now().isoformat(timespec="seconds"),
+            "parametros": self.params(),
+            "cestos": getattr(self, "_basket_params", {}),
+            "n_cestos": int(self.n_baskets),
+            "peso_total": float(self.total_weight),
+            "n_regras": len(self.rules),
+        }
+        
+        antecedents, lengths, consequents, _ = self._rule_arrays()
+        arrays = {
+            "header": json_bytes(header),
+            "vocab": json_bytes(self.vocab.values.tolist()),
+            "rule_antecedent_codes": antecedents.indices.astype(np.int32),
+            "rule_antecedent_lengths": lengths,
+            "rule_consequents": consequents.astype(np.int32),
+            "rule_metrics": np.array(
+                [[r["support"], r["confidence"], r["lift"], r["count"]] for r in self.rules], dtype=np.float64
+            ).reshape(-1, 4),
+            "rule_exact": np.array([r.get("exact", True) for r in self.rules], dtype=bool),
+            "approximate": np.array(
+                sorted(sorted(p) for p in getattr(self, "_approximate", ())), dtype=np.int32
+            ).reshape(-1, 2),
+        }
+        for k, (itemsets, counts) in getattr(self, "_levels", {}).items():
+            arrays[f"itemsets_{k}"] = itemsets
+            arrays[f"counts_{k}"] = counts
+        for k, utilities in getattr(self, "_utilities", {}).items():
+            arrays[f"utilities_{k}"] = utilities
+        if self.rules and "p_value" in self.rules[0]:
+            arrays["rule_p_value"] = np.array([r["p_value"] for r in self.rules], dtype=np.float64)
+        if self.weight is not None:
+            arrays["rule_utility"] = np.array([r["utilidade"] for r in self.rules], dtype=np.float64)
+        
+        save_npz(path, arrays)
+        
+        logger.info(f"Modelo Apriori guardado em {path} ({len(self.rules)} regras)")
+    
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "AprioriAnalyzer":
+        """Carrega um modelo guardado com save()."""
+        with np.load(path, allow_pickle=False) as data:
+            header = _read_header(data)
+            params = header["parametros"]
+            
+            analyzer = cls(**params)
+            analyzer.data_hash = header["data_hash"]
+            analyzer.n_baskets = header["n_cestos"]
+            analyzer.total_weight = header.get("peso_total", 0.0)
+            analyzer._basket_params = header["cestos"]
+            analyzer.vocab = IDVocabulary(read_json(data["vocab"]))
+            
+            analyzer._levels = {}
+            for name in data.files:
+                if name.startswith("itemsets_"):
+                    k = int(name.split("_")[1])
+                    analyzer._levels[k] = (data[name], data[f"counts_{k}"])
+            analyzer._utilities = {
+                int(name.split("_")[1]): data[name] for name in data.files if name.startswith("utilities_")
+            }
+            
+            total = analyzer.total_weight if analyzer._weighted() else analyzer.n_baskets
+            analyzer._approximate = {frozenset(p) for p in data["approximate"].tolist()}
+            analyzer._coded_itemsets = {
+                frozenset(itemset): count / total
+                for itemsets, counts in analyzer._levels.values()
+                for itemset, count in zip(itemsets.tolist(), counts.tolist())
+            }
+            analyzer.frequent_itemsets = {
+                frozenset(analyzer.vocab.decode(list(itemset))): support
+                for itemset, support in analyzer._coded_itemsets.items()
+            }
+            
+            values = analyzer.vocab.values
+            codes = values[data["rule_antecedent_codes"]].tolist()
+            ends = np.cumsum(data["rule_antecedent_lengths"]).tolist()
+            consequents = values[data["rule_consequents"]].tolist()
+            
+            analyzer.rules = [
+                {
+                    "antecedent": codes[end - length:end],
+                    "consequent": [consequent],
+                    "support": support,
+                    "confidence": confidence,
+                    "lift": lift,
+                    "count": count if analyzer._weighted() else int(count),
+                    "exact": exact,
+                }
+                for end, length, consequent, (support, confidence, lift, count), exact in zip(
+                    ends, data["rule_antecedent_lengths"].tolist(), consequents,
+                    data["rule_metrics"].tolist(), data["rule_exact"].tolist()
+                )
+            ]
+            
+            if "rule_p_value" in data.files:
+                for rule, p_value in zip(analyzer.rules, data["rule_p_value"].tolist()):
+                    rule["p_value"] = p_value
+            if analyzer.weight is not None:
+                for rule, utility in zip(analyzer.rules, data["rule_utility"].tolist()):
+                    rule["utilidade"] = utility
+        
+        logger.info(f"Modelo Apriori carregado de {path} ({len(analyzer.rules)} regras)")
+        return analyzer
+    
+    @staticmethod
+    def read_header(path: Union[str, Path]) -> Dict:
+        """Lê só o cabeçalho de metadados de um modelo guardado."""
+        with np.load(path, allow_pickle=False) as data:
+            return _read_header(data)
+    
+    def params(self) -> Dict:
+        """Parâmetros do construtor que afectam o modelo (limiares, motor e memória do sketch)."""
+        return {
+            "min_support": self.min_support,
+            "min_confidence": self.min_confidence,
+            "min_lift": self.min_lift,
+            "max_p_value": self.max_p_value,
+            "correction": self.correction,
+            "max_rules": self.max_rules,
+            "engine": self.engine,
+            "max_len": self.max_len,
+            "sketch_memory_mb": self.sketch_memory_mb,
+            "sketch_max_candidates": self.sketch_max_candidates,
+            "weight": self.weight,
+            "min_utility": self.min_utility,
+            "half_life_days": self.half_life_days,
+        }
+    
+    def analyze_or_load(
+        self,
+        sales_df: pd.DataFrame,
+        model_path: Union[str, Path, None],
+        **kwargs
+    ) -> List[Dict]:
+        """
+        Carrega o modelo de model_path se foi minerado sobre os mesmos
+        dados com os mesmos parâmetros; senão executa analyze() e guarda-o.
+        
+        Args:
+            sales_df: DataFrame com vendas
+            model_path: Ficheiro do modelo (None = só analyze())
+            **kwargs: Argumentos de analyze()
+        """
+        if model_path is None:
+            return self.analyze(sales_df, **kwargs)
+        
+        model_path = Path(model_path)
+        columns = [kwargs.get(c, d) for c, d in
+                   [("product_col", "produto_id"), ("transaction_col", "cliente_id"), ("date_col", "data")]]
+        hashed = self._hashed_columns(*columns)
+        level = kwargs.get("level", "product")
+        category_col = kwargs.get("category_col", "categoria")
+        basket_params = _basket_signature(
+            columns[1], kwargs.get("basket", "transaction"), kwargs.get("window_days"), level, category_col
+        )
+        
+        if model_path.exists():
+            try:
+                header = self.read_header(model_path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Modelo inválido em {model_path}, a recalcular: {e}")
+                header = None
+            
+            if (
+                header is not None
+                and header["data_hash"] is not None
+                and header["parametros"] == self.params()
+                and header["cestos"] == basket_params
+                and header["data_hash"] == _input_hash(
+                    sales_df, hashed, kwargs.get("products_df"), category_col, level
+                )
+            ):
+                loaded = self.load(model_path)
+                self.__dict__.update(loaded.__dict__)
+                return self.rules
+        
+        rules = self.analyze(sales_df, **kwargs)
+        if self.vocab is not None:
+            self.save(model_path)
+        return rules
+    
+    def _weighted(self) -> bool:
+        """Contagens são somas de pesos (weight e/ou decaimento) em vez de cestos."""
+        return self.weight is not None or self.half_life_days is not None
+    
+    def _hashed_columns(self, product_col: str, transaction_col: str, date_col: str) -> List[str]:
+        """Colunas de vendas que entram no hash dos dados (inclui a de ponderação)."""
+        columns = [product_col, transaction_col, date_col]
+        return columns + [self.weight] if self.weight is not None else columns
+    
     def get_summary(self) -> Dict:
         """Retorna resumo da análise."""
         if not self.rules:
@@ -272,6 +1374,105 @@ class AprioriAnalyzer:
         }
 
 
+class _RowLookup:
+    """Pesquisa binária de linhas inteiras (itemsets) num array (n, k)."""
+    
+    def __init__(self, rows: np.ndarray):
+        self._keys = _row_keys(rows)
+        self._order = np.argsort(self._keys)
+        self._sorted = self._keys[self._order]
+    
+    def find(self, rows: np.ndarray) -> np.ndarray:
+        """Índice de cada linha em rows no array original, ou -1."""
+        if len(self._sorted) == 0:
+            return np.full(len(rows), -1, dtype=np.intp)
+        
+        keys = _row_keys(rows)
+        positions = np.minimum(np.searchsorted(self._sorted, keys), len(self._sorted) - 1)
+        return np.where(self._sorted[positions] == keys, self._order[positions], -1)
+
+
+def _row_keys(rows: np.ndarray) -> np.ndarray:
+    """Chave comparável (bytes) por linha de um array de códigos int32."""
+    rows = np.ascontiguousarray(rows, dtype=np.int32)
+    return rows.view(np.dtype((np.void, rows.dtype.itemsize * max(rows.shape[1], 1)))).ravel()
+
+
+def _pair_keys(pairs: np.ndarray, n_items: int) -> np.ndarray:
+    """Chaves int64 a·n + b de pares (a < b)."""
+    return pairs[:, 0].astype(np.int64) * n_items + pairs[:, 1]
+
+
+def _adjust_p_values(p_values: np.ndarray, method: str) -> np.ndarray:
+    """Corrige p-values para testes múltiplos (Benjamini-Hochberg ou Bonferroni)."""
+    m = len(p_values)
+    if method == "none" or m == 0:
+        return p_values
+    
+    if method == "bonferroni":
+        return np.minimum(p_values * m, 1.0)
+    
+    # Benjamini-Hochberg: p·m/posição, mínimo acumulado a partir do maior
+    order = np.argsort(p_values)
+    adjusted = p_values[order] * m / np.arange(1, m + 1)
+    adjusted = np.minimum.accumulate(adjusted[::-1])[::-1]
+    result = np.empty(m, dtype=np.float64)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+
+def _contains_pairs(itemsets: np.ndarray, keys: np.ndarray, n_items: int) -> np.ndarray:
+    """Itemsets (linhas ordenadas) que contêm algum dos pares em keys."""
+    found = np.zeros(len(itemsets), dtype=bool)
+    if len(keys) == 0:
+        return found
+    
+    for i in range(itemsets.shape[1]):
+        for j in range(i + 1, itemsets.shape[1]):
+            found |= np.isin(_pair_keys(itemsets[:, [i, j]], n_items), keys)
+    return found
+
+
+def data_hash(df: pd.DataFrame, columns: List[str]) -> str:
+    """Hash do conteúdo das colunas usadas na análise."""
+    hashed = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    return hashlib.blake2b(hashed.tobytes(), digest_size=16).hexdigest()
+
+
+def _input_hash(
+    sales_df: pd.DataFrame,
+    columns: List[str],
+    products_df: Optional[pd.DataFrame],
+    category_col: str,
+    level: str
+) -> str:
+    """Hash dos dados de entrada (inclui a hierarquia fora do nível "product")."""
+    digest = data_hash(sales_df, columns)
+    if level == "product":
+        return digest
+    
+    hierarchy = data_hash(products_df, [columns[0], category_col])
+    return hashlib.blake2b(f"{digest}{hierarchy}".encode(), digest_size=16).hexdigest()
+
+
+def _basket_signature(transaction_col: str, basket: str, window_days: Optional[int], level: str, category_col: str) -> Dict:
+    """Parâmetros de construção dos cestos guardados no cabeçalho do modelo."""
+    return {
+        "basket": basket,
+        "window_days": window_days,
+        "transaction_col": transaction_col,
+        "level": level,
+        "category_col": category_col if level != "product" else None,
+    }
+
+
+def _read_header(data) -> Dict:
+    header = read_json(data["header"])
+    if header.get("versao") != MODEL_VERSION:
+        raise ValueError(f"Versão de modelo incompatível: {header.get('versao')}")
+    return header
+
+
 def analyze_cross_sell(sales_df: pd.DataFrame, **kwargs) -> List[Dict]:
     """
     Função de conveniência para análise rápida de cross-sell.
@@ -279,7 +1480,7 @@ def analyze_cross_sell(sales_df: pd.DataFrame, **kwargs) -> List[Dict]:
     Args:
         sales_df: DataFrame com vendas
         **kwargs: Argumentos para AprioriAnalyzer
-        
+    
     Returns:
         Lista de regras de associação
     """
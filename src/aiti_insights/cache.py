@@ -0,0 +1,199 @@
+"""
+AITI Insights - Cache ETL
+=========================
+
+Guarda o resultado normalizado do ETL num ficheiro colunar (Arrow IPC)
+para que leituras seguintes do mesmo ficheiro sejam feitas por
+memory-map, sem voltar a interpretar CSV/Excel.
+
+A chave de cache combina:
+- hash do conteúdo do ficheiro de origem
+- hash do mapeamento de colunas
+- versão do ETL (ETL_VERSION)
+
+Qualquer alteração a um destes invalida a entrada, que é reconstruída.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional, Union
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Incrementar sempre que _transform_sales mude o formato de saída
+ETL_VERSION = "2"
+
+_HASH_BLOCK = 1024 * 1024
+
+
+class ETLCache:
+    """
+    Cache persistente de DataFrames normalizados.
+    
+    Exemplo:
+        cache = ETLCache("~/.cache/aiti_insights")
+        df = cache.get(path, mappings)
+        if df is None:
+            df = processar(path)
+            cache.put(path, mappings, df)
+    """
+    
+    INDEX_FILE = "index.json"
+    
+    def __init__(self, cache_dir: Union[str, Path]):
+        """
+        Args:
+            cache_dir: Directório onde ficam as entradas de cache
+        """
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.enabled = _has_pyarrow()
+        
+        if not self.enabled:
+            logger.warning("pyarrow não instalado: cache ETL desactivada")
+    
+    def key(self, path: Union[str, Path], mappings: dict) -> str:
+        """Calcula a chave de cache de um ficheiro de origem."""
+        mapping_hash = hashlib.blake2b(
+            json.dumps(mappings, sort_keys=True).encode("utf-8"), digest_size=8
+        ).hexdigest()
+        
+        return f"{self._content_hash(Path(path))}-{mapping_hash}-v{ETL_VERSION}"
+    
+    def get(self, path: Union[str, Path], mappings: dict) -> Optional[pd.DataFrame]:
+        """Devolve o DataFrame em cache, ou None se não existir ou estiver obsoleto."""
+        if not self.enabled:
+            return None
+        
+        entry = self._entry_path(self.key(path, mappings))
+        if not entry.exists():
+            return None
+        
+        import pyarrow as pa
+        
+        try:
+            with pa.memory_map(str(entry), "r") as source:
+                df = pa.ipc.open_file(source).read_all().to_pandas()
+        except (OSError, pa.ArrowInvalid) as e:
+            logger.warning(f"Entrada de cache inválida {entry.name}, a reconstruir: {e}")
+            entry.unlink(missing_ok=True)
+            return None
+        
+        logger.info(f"Cache ETL: {Path(path).name} lido de {entry.name}")
+        return df
+    
+    def put(self, path: Union[str, Path], mappings: dict, df: pd.DataFrame):
+        """Guarda um DataFrame normalizado e remove entradas antigas da mesma origem."""
+        if not self.enabled:
+            return
+        
+        import pyarrow as pa
+        
+        key = self.key(path, mappings)
+        entry = self._entry_path(key)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            logger.warning(f"Cache ETL ignorada para {Path(path).name}: {e}")
+            return
+        
+        # Escrita atómica: ficheiro temporário + rename
+        tmp = entry.with_suffix(".tmp")
+        with pa.OSFile(str(tmp), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, entry)
+        
+        # Remover entrada anterior da mesma origem (obsoleta)
+        index = self._read_index()
+        source = str(Path(path).resolve())
+        previous = index.get(source, {}).get("entry")
+        if previous and previous != entry.name:
+            (self.cache_dir / previous).unlink(missing_ok=True)
+        
+        index.setdefault(source, {})["entry"] = entry.name
+        self._write_index(index)
+        
+        logger.info(f"Cache ETL: {Path(path).name} guardado em {entry.name}")
+    
+    def clear(self):
+        """Remove todas as entradas de cache."""
+        if not self.cache_dir.exists():
+            return
+        
+        for entry in self.cache_dir.glob("*.arrow"):
+            entry.unlink()
+        (self.cache_dir / self.INDEX_FILE).unlink(missing_ok=True)
+    
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.arrow"
+    
+    def _content_hash(self, path: Path) -> str:
+        """
+        Hash do conteúdo do ficheiro.
+        
+        O hash fica registado no índice com tamanho e mtime, para não
+        voltar a ler ficheiros grandes que não mudaram.
+        """
+        stat = path.stat()
+        source = str(path.resolve())
+        index = self._read_index()
+        known = index.get(source, {})
+        
+        if known.get("size") == stat.st_size and known.get("mtime_ns") == stat.st_mtime_ns:
+            return known["content_hash"]
+        
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+                digest.update(block)
+        content_hash = digest.hexdigest()
+        
+        known.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, content_hash=content_hash)
+        index[source] = known
+        self._write_index(index)
+        
+        return content_hash
+    
+    def _read_index(self) -> dict:
+        index_path = self.cache_dir / self.INDEX_FILE
+        if not index_path.exists():
+            return {}
+        
+        try:
+            return json.loads(index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+    
+    def _write_index(self, index: dict):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        index_path = self.cache_dir / self.INDEX_FILE
+        tmp = index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(index, indent=2), encoding="utf-8")
+        os.replace(tmp, index_path)
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def default_cache_dir() -> Optional[Path]:
+    """Directório de cache definido em AITI_CACHE_DIR (None se não definido)."""
+    value = os.environ.get("AITI_CACHE_DIR")
+    return Path(value).expanduser() if value else None
+
+
+def default_model_path(cache_dir: Union[str, Path, None] = None) -> Optional[Path]:
+    """Ficheiro do modelo Apriori em cache_dir ou AITI_CACHE_DIR (None se nenhum)."""
+    cache_dir = Path(cache_dir).expanduser() if cache_dir else default_cache_dir()
+    return cache_dir / "apriori_model.npz" if cache_dir else None
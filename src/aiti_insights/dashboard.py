@@ -18,8 +18,10 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from aiti_insights.etl import ETLProcessor
 from aiti_insights.apriori import AprioriAnalyzer
 from aiti_insights.rfm import RFMAnalyzer, RFM_SEGMENTS
+from aiti_insights.sequences import SequentialAnalyzer
 from aiti_insights.opportunities import OpportunityEngine
 from aiti_insights.reports import ReportGenerator
+from aiti_insights.cache import default_cache_dir, default_model_path
 
 # === PAGE CONFIG ===
 st.set_page_config(
@@ -274,37 +276,27 @@ def load_demo_data():
         st.error("⚠️ Dados de demonstração não encontrados.")
         st.stop()
 
-    etl = ETLProcessor()
+    etl = ETLProcessor(cache_dir=default_cache_dir())
     sales_df = etl.load_sales(data_dir / "vendas.csv")
     customers_df = etl.load_customers(data_dir / "clientes.csv")
     products_df = etl.load_products(data_dir / "produtos.csv")
 
-    # Ensure consistent key types
-    sales_df["cliente_id"] = sales_df["cliente_id"].astype(str)
-    sales_df["produto_id"] = sales_df["produto_id"].astype(str)
+    # Ensure consistent key types (sales IDs are already encoded as text categories by the ETL)
     if customers_df is not None and "cliente_id" in customers_df.columns:
         customers_df["cliente_id"] = customers_df["cliente_id"].astype(str)
     if products_df is not None and "produto_id" in products_df.columns:
         products_df["produto_id"] = products_df["produto_id"].astype(str)
 
-    # Enrich sales with customer/product names
+    # Enrich sales with customer/product names (map keeps the encoded ID columns)
     if customers_df is not None and "nome" in customers_df.columns:
-        sales_df = sales_df.merge(
-            customers_df[["cliente_id", "nome"]].rename(columns={"nome": "cliente_nome"}),
-            on="cliente_id", how="left"
-        )
+        names = customers_df.drop_duplicates(subset=["cliente_id"]).set_index("cliente_id")["nome"]
+        sales_df["cliente_nome"] = sales_df["cliente_id"].map(names)
     if products_df is not None:
-        merge_cols = ["produto_id"]
-        rename = {}
-        if "nome" in products_df.columns:
-            merge_cols.append("nome")
-            rename["nome"] = "produto_nome"
-        if "categoria" in products_df.columns:
-            merge_cols.append("categoria")
-        prod_merge = products_df[merge_cols].drop_duplicates(subset=["produto_id"])
-        if rename:
-            prod_merge = prod_merge.rename(columns=rename)
-        sales_df = sales_df.merge(prod_merge, on="produto_id", how="left")
+        products = products_df.drop_duplicates(subset=["produto_id"]).set_index("produto_id")
+        if "nome" in products.columns:
+            sales_df["produto_nome"] = sales_df["produto_id"].map(products["nome"])
+        if "categoria" in products.columns:
+            sales_df["categoria"] = sales_df["produto_id"].map(products["categoria"])
 
     # Add synthetic payment status if missing
     if "estado_pagamento" not in sales_df.columns:
@@ -314,26 +306,32 @@ def load_demo_data():
             ["Pago", "Pendente", "Vencido"], len(sales_df), p=[0.6, 0.25, 0.15]
         )
 
-    return sales_df, customers_df, products_df, etl.get_summary()
+    return sales_df, customers_df, products_df, etl
 
 
-def run_analysis(sales_df, customers_df, products_df, min_support=0.02, min_confidence=0.3, min_value=50):
-    """Executa todas as análises."""
+def run_analysis(sales_df, customers_df, products_df, min_support=0.02, min_confidence=0.3, min_value=50,
+                 customer_vocab=None, product_vocab=None):
+    """Executa todas as análises (sobre os códigos de IDs do ETL, com os vocabulários partilhados)."""
     apriori = AprioriAnalyzer(min_support=min_support, min_confidence=min_confidence)
-    rules = apriori.analyze(sales_df)
+    rules = apriori.analyze_or_load(sales_df, default_model_path(), vocab=product_vocab)
 
     rfm = RFMAnalyzer()
-    rfm_df = rfm.analyze(sales_df)
+    rfm_df = rfm.analyze(sales_df, vocab=customer_vocab)
     rfm_summary = rfm.get_segment_summary()
     rfm_insights = rfm.get_insights()
 
+    sequential_rules = SequentialAnalyzer().analyze(sales_df, vocab=product_vocab)
+
     engine = OpportunityEngine(min_value=min_value)
     opportunities = engine.generate(
         sales_df=sales_df,
         rules=rules,
         rfm_segments=rfm_df,
         customers_df=customers_df,
-        products_df=products_df
+        products_df=products_df,
+        sequential_rules=sequential_rules,
+        customer_vocab=customer_vocab,
+        product_vocab=product_vocab
     )
 
     return {
@@ -341,6 +339,7 @@ def run_analysis(sales_df, customers_df, products_df, min_support=0.02, min_conf
         "rfm_df": rfm_df,
         "rfm_summary": rfm_summary,
         "rfm_insights": rfm_insights,
+        "sequential_rules": sequential_rules,
         "opportunities": opportunities,
         "apriori_summary": apriori.get_summary(),
         "sales_df": sales_df,
@@ -1090,7 +1089,8 @@ def main():
     # Load data
     with st.spinner("🔄 Carregando dados..."):
         try:
-            sales_df, customers_df, products_df, summary = load_demo_data()
+            sales_df, customers_df, products_df, etl = load_demo_data()
+            summary = etl.get_summary()
         except Exception as e:
             st.error(f"Erro ao carregar dados: {e}")
             st.stop()
@@ -1101,7 +1101,10 @@ def main():
     # Run analysis
     with st.spinner("🧠 A IA está a analisar os dados..."):
         try:
-            results = run_analysis(sales_df, customers_df, products_df, min_support, min_confidence, min_value)
+            results = run_analysis(
+                sales_df, customers_df, products_df, min_support, min_confidence, min_value,
+                customer_vocab=etl.customer_vocab, product_vocab=etl.product_vocab
+            )
         except Exception as e:
             st.error(f"Erro na análise: {e}")
             st.stop()
@@ -0,0 +1,177 @@
+"""
+AITI Insights - Codificação de IDs
+==================================
+
+Converte IDs de clientes e produtos (texto) em códigos inteiros densos
+(int32) uma única vez. As análises trabalham sobre os códigos e só
+voltam aos IDs originais na saída, através do vocabulário partilhado.
+
+O ETL guarda as colunas de IDs como categóricas (códigos inteiros +
+vocabulário): encode() e encode_ids() reutilizam esses códigos em vez
+de voltar a fazer hash do texto de cada linha.
+
+Inclui também a serialização sem pickle usada pelos ficheiros .npz de
+modelos e estados: vocabulários e metadados em JSON guardado como uint8.
+"""
+
+import json
+import os
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+CODE_DTYPE = np.int32
+
+
+class IDVocabulary:
+    """
+    Vocabulário bidireccional ID <-> código inteiro.
+    
+    Os códigos são densos (0..n-1) e atribuídos por ordem de aparição.
+    IDs desconhecidos são codificados como -1 (ou acrescentados, com extend=True).
+    
+    Exemplo:
+        vocab = IDVocabulary.fit(sales_df["produto_id"])
+        codes = vocab.encode(sales_df["produto_id"])
+        ids = vocab.decode(codes)
+    """
+    
+    def __init__(self, values: Iterable = None):
+        """
+        Args:
+            values: IDs únicos, pela ordem dos códigos
+        """
+        self._values = _object_array([] if values is None else values)
+        self._index = pd.Index(self._values)
+        
+        if not self._index.is_unique:
+            raise ValueError("Vocabulário com IDs duplicados")
+    
+    @classmethod
+    def fit(cls, values: Iterable) -> "IDVocabulary":
+        """Cria um vocabulário a partir de uma coluna de IDs."""
+        _, uniques = pd.factorize(_object_array(values), use_na_sentinel=False)
+        return cls(uniques)
+    
+    def encode(self, values: Iterable, extend: bool = False) -> np.ndarray:
+        """
+        Converte IDs em códigos int32.
+        
+        Args:
+            values: IDs a codificar
+            extend: Acrescentar IDs desconhecidos ao vocabulário (senão ficam -1)
+        """
+        categorical = _categorical_codes(values)
+        if categorical is not None:
+            codes, categories = categorical
+            if len(categories) <= len(self) and categories.equals(self._index[:len(categories)]):
+                return codes  # Categorias do próprio vocabulário (colunas do ETL)
+            return self.encode(categories, extend=extend)[codes]
+        
+        values = _object_array(values)
+        codes = self._index.get_indexer(values)
+        
+        if extend and (codes < 0).any():
+            _, new = pd.factorize(values[codes < 0], use_na_sentinel=False)
+            self._values = np.concatenate([self._values, _object_array(new)])
+            self._index = pd.Index(self._values)
+            codes = self._index.get_indexer(values)
+        
+        return codes.astype(CODE_DTYPE)
+    
+    def decode(self, codes: Iterable) -> np.ndarray:
+        """Converte códigos em IDs originais."""
+        return self._values[np.asarray(codes, dtype=np.intp)]
+    
+    @property
+    def values(self) -> np.ndarray:
+        """IDs pela ordem dos códigos."""
+        return self._values
+    
+    def __len__(self) -> int:
+        return len(self._values)
+    
+    def __contains__(self, value) -> bool:
+        return value in self._index
+    
+    def __repr__(self) -> str:
+        return f"IDVocabulary({len(self)} IDs)"
+
+
+def encode_ids(
+    values: Iterable,
+    vocab: Optional[IDVocabulary] = None
+) -> Tuple[np.ndarray, IDVocabulary]:
+    """
+    Codifica uma coluna de IDs, criando ou estendendo o vocabulário.
+    
+    Args:
+        values: IDs a codificar
+        vocab: Vocabulário partilhado (estendido com IDs novos)
+    
+    Returns:
+        Tuple com (códigos int32, vocabulário)
+    """
+    if vocab is not None:
+        return vocab.encode(values, extend=True), vocab
+    
+    categorical = _categorical_codes(values)
+    if categorical is not None:
+        # Só as categorias presentes, renumeradas densamente
+        codes, categories = categorical
+        present = np.bincount(codes, minlength=len(categories)) > 0
+        remap = (np.cumsum(present) - 1).astype(CODE_DTYPE)
+        return remap[codes], IDVocabulary(categories[present])
+    
+    codes, uniques = pd.factorize(_object_array(values), use_na_sentinel=False)
+    return codes.astype(CODE_DTYPE), IDVocabulary(uniques)
+
+
+def encode_column(values: Iterable, vocab: IDVocabulary) -> pd.Categorical:
+    """
+    Coluna categórica com os códigos do vocabulário (estendido com IDs novos).
+    
+    Guarda cada ID uma vez nas categorias e um inteiro por linha; as
+    análises obtêm os códigos int32 sem voltar a ler o texto.
+    """
+    codes = vocab.encode(values, extend=True)
+    return pd.Categorical.from_codes(codes, categories=pd.Index(vocab.values, dtype=object))
+
+
+def _categorical_codes(values) -> Optional[Tuple[np.ndarray, pd.Index]]:
+    """(códigos int32, categorias) de uma coluna categórica sem nulos, ou None."""
+    if not isinstance(getattr(values, "dtype", None), pd.CategoricalDtype):
+        return None
+    
+    categorical = values.array if isinstance(values, (pd.Series, pd.Index)) else values
+    codes = np.array(categorical.codes, dtype=CODE_DTYPE)
+    if len(codes) and codes.min() < 0:
+        return None
+    return codes, categorical.categories
+
+
+def _object_array(values: Iterable) -> np.ndarray:
+    """Array 1-D de objectos a partir de qualquer colecção de IDs."""
+    return np.asarray(values if hasattr(values, "__len__") else list(values), dtype=object)
+
+
+def json_bytes(value) -> np.ndarray:
+    """Serializa em JSON como array uint8 (guardável sem pickle)."""
+    encoded = json.dumps(value, default=lambda o: o.item() if hasattr(o, "item") else str(o))
+    return np.frombuffer(encoded.encode("utf-8"), dtype=np.uint8)
+
+
+def read_json(array: np.ndarray) -> Any:
+    """Lê um valor guardado com json_bytes()."""
+    return json.loads(array.tobytes())
+
+
+def save_npz(path: Union[str, Path], arrays: Dict[str, np.ndarray]):
+    """Grava arrays num .npz de forma atómica (ficheiro temporário + rename)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
@@ -6,16 +6,60 @@ Módulo para importação e normalização de dados de vendas.
 Suporta CSV, Excel, e pode ser estendido para ERPs.
 """
 
+import codecs
+import csv
+import re
+import shutil
+import tempfile
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Union
+from typing import Callable, Iterator, List, Optional, Union
 import logging
 
+from .cache import ETLCache
+from .encoding import encode_column, encode_ids
+
 logger = logging.getLogger(__name__)
 
 
+# Parâmetros de detecção de dialecto CSV
+CSV_SAMPLE_BYTES = 64 * 1024
+CSV_ENCODINGS = ["utf-8", "cp1252", "latin-1"]
+CSV_DELIMITERS = [",", ";", "\t", "|"]
+
+# Linhas por bloco no modo streaming
+DEFAULT_CHUNKSIZE = 500_000
+
+# Máximo de runs fundidos numa passagem do merge externo; os runs são
+# gravados em row groups de chunksize // MERGE_FANIN linhas
+MERGE_FANIN = 16
+
+# Tipos das colunas padrão de vendas em formato colunar
+SALES_DTYPES = {
+    "data": "datetime64[ns]",
+    "cliente_id": "string",
+    "produto_id": "string",
+    "quantidade": "int64",
+    "valor": "float64",
+}
+
+# Bytes inválidos no encoding detectado (depois da amostra) lidos como latin-1
+CSV_DECODE_ERRORS = "aiti_latin1_fallback"
+
+
+def _latin1_fallback(error: UnicodeDecodeError):
+    """Descodifica como latin-1 (aceita qualquer byte) só o troço inválido."""
+    return error.object[error.start:error.end].decode("latin-1"), error.end
+
+
+codecs.register_error(CSV_DECODE_ERRORS, _latin1_fallback)
+
+_DECIMAL_COMMA = re.compile(r"^-?\d+,\d+$")
+_DECIMAL_DOT = re.compile(r"^-?\d+\.\d+$")
+
+
 class ETLProcessor:
     """
     Processador ETL para dados de vendas.
@@ -40,12 +84,23 @@ class ETLProcessor:
         "quantidade": ["quantidade", "quantity", "qty", "qtd", "qtde", "unidades"],
         # Valor
         "valor": ["valor", "value", "amount", "total", "preco_total", "valor_total", "revenue", "montante"],
+        # Factura (opcional - permite cestos por factura)
+        "factura_id": ["factura_id", "fatura_id", "invoice_id", "invoice", "factura", "fatura", "num_factura", "documento"],
     }
     
-    def __init__(self):
+    def __init__(self, cache_dir: Union[str, Path] = None):
+        """
+        Args:
+            cache_dir: Directório da cache colunar de vendas normalizadas (opcional)
+        """
         self.sales_df = None
         self.customers_df = None
         self.products_df = None
+        self.last_dialect = None
+        self._dialect_cache = {}  # impressão digital do ficheiro -> dialecto detectado
+        self.customer_vocab = None
+        self.product_vocab = None
+        self.cache = ETLCache(cache_dir) if cache_dir else None
     
     def load_sales(self, path: Union[str, Path]) -> pd.DataFrame:
         """
@@ -62,6 +117,15 @@ class ETLProcessor:
         if not path.exists():
             raise FileNotFoundError(f"Ficheiro não encontrado: {path}")
         
+        # Cache colunar (conteúdo + mapeamento + versão do ETL)
+        if self.cache is not None:
+            df = self.cache.get(path, self.COLUMN_MAPPINGS)
+            if df is not None:
+                df = self._encode_ids(df)
+                self.sales_df = df
+                logger.info(f"Carregadas {len(df)} transacções de vendas (cache)")
+                return df
+        
         # Carregar baseado na extensão
         if path.suffix.lower() == ".csv":
             df = self._load_csv(path)
@@ -78,12 +142,130 @@ class ETLProcessor:
         
         # Transformações
         df = self._transform_sales(df)
+        df = self._encode_ids(df)
+        
+        if self.cache is not None:
+            self.cache.put(path, self.COLUMN_MAPPINGS, df)
         
         self.sales_df = df
         logger.info(f"Carregadas {len(df)} transacções de vendas")
         
         return df
     
+    def iter_sales(
+        self,
+        path: Union[str, Path],
+        chunksize: int = DEFAULT_CHUNKSIZE
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Lê vendas de um CSV em blocos de tamanho limitado.
+        
+        Cada bloco é normalizado, validado e transformado como em
+        load_sales() e sai ordenado por data. Os IDs são lidos como
+        texto para que todos os blocos tenham os mesmos tipos.
+        
+        Args:
+            path: Caminho para o ficheiro CSV
+            chunksize: Número máximo de linhas por bloco
+            
+        Yields:
+            DataFrames normalizados, um por bloco
+        """
+        path = Path(path)
+        
+        if not path.exists():
+            raise FileNotFoundError(f"Ficheiro não encontrado: {path}")
+        
+        if path.suffix.lower() != ".csv":
+            raise ValueError(f"Modo streaming só suporta CSV: {path.suffix}")
+        
+        dialect = self.sniff_csv(path)
+        
+        # Ler como texto todas as colunas que não são numéricas
+        header = self._read_csv(path, dialect, nrows=0)
+        renamed = self._normalize_columns(header.copy(), "sales").columns
+        dtype = {
+            original: str
+            for original, target in zip(header.columns, renamed)
+            if target not in ("quantidade", "valor")
+        }
+        
+        reader = self._read_csv(path, dialect, chunksize=chunksize, dtype=dtype)
+        
+        for chunk in reader:
+            chunk = self._normalize_columns(chunk, "sales")
+            self._validate_sales(chunk)
+            chunk = self._transform_sales(chunk)
+            
+            if len(chunk) > 0:
+                yield chunk
+    
+    def stream_sales(
+        self,
+        path: Union[str, Path],
+        output_path: Union[str, Path] = None,
+        chunksize: int = DEFAULT_CHUNKSIZE,
+        sinks: Optional[List[Callable[[pd.DataFrame], None]]] = None
+    ) -> dict:
+        """
+        Processa ficheiros de vendas maiores que a RAM em blocos.
+        
+        Cada bloco transformado é enviado para os sinks (agregadores
+        a jusante) e, se output_path for dado, gravado como run ordenado
+        em Parquet. No fim, os runs são fundidos por data (merge externo)
+        num único Parquet ordenado. A memória usada depende de chunksize,
+        não do tamanho do ficheiro: os runs têm row groups pequenos, lidos
+        um a um, e a fusão junta no máximo MERGE_FANIN runs por passagem.
+        
+        Args:
+            path: Caminho para o ficheiro CSV
+            output_path: Parquet de saída ordenado por data (opcional)
+            chunksize: Número máximo de linhas por bloco
+            sinks: Funções chamadas com cada bloco transformado
+            
+        Returns:
+            dict com transacoes, blocos e ficheiro de saída
+        """
+        sinks = sinks or []
+        run_dir = None
+        run_paths = []
+        schema = None
+        rows = 0
+        
+        if output_path is not None:
+            _require_pyarrow()
+            run_dir = Path(tempfile.mkdtemp(prefix="aiti_runs_"))
+        
+        try:
+            for i, chunk in enumerate(self.iter_sales(path, chunksize=chunksize)):
+                rows += len(chunk)
+                
+                for sink in sinks:
+                    sink(chunk)
+                
+                if run_dir is not None:
+                    chunk = _to_sales_dtypes(chunk)
+                    if schema is None:
+                        schema = _sales_schema(chunk)
+                    run_path = run_dir / f"run_{i:05d}.parquet"
+                    _write_run(chunk, run_path, schema, max(1, chunksize // MERGE_FANIN))
+                    run_paths.append(run_path)
+            
+            if run_dir is not None and run_paths:
+                peak = _merge_runs(run_paths, Path(output_path), schema, "data", chunksize, run_dir)
+                logger.debug(f"Fusão de {len(run_paths)} runs com pico de {peak / 2**20:.1f} MB em Arrow")
+        finally:
+            if run_dir is not None:
+                shutil.rmtree(run_dir, ignore_errors=True)
+        
+        logger.info(f"Processadas {rows} transacções de vendas em modo streaming")
+        
+        return {
+            "transacoes": rows,
+            "blocos": len(run_paths) if run_dir is not None else None,
+            "ficheiro": str(output_path) if output_path is not None and run_paths else None,
+        }
+    
     def load_customers(self, path: Union[str, Path]) -> pd.DataFrame:
         """Carrega dados de clientes."""
         path = Path(path)
@@ -116,17 +298,155 @@ class ETLProcessor:
     
     def _load_csv(self, path: Path) -> pd.DataFrame:
         """Carrega CSV com detecção automática de encoding e separador."""
-        # Tentar diferentes encodings
-        for encoding in ["utf-8", "latin-1", "cp1252"]:
-            for sep in [",", ";", "\t", "|"]:
-                try:
-                    df = pd.read_csv(path, encoding=encoding, sep=sep)
-                    if len(df.columns) > 1:
-                        return df
-                except:
-                    continue
-        
-        raise ValueError(f"Não foi possível ler o ficheiro CSV: {path}")
+        dialect = self.sniff_csv(path)
+        
+        try:
+            df = self._read_csv(path, dialect)
+        except pd.errors.ParserError as e:
+            raise ValueError(f"Não foi possível ler o ficheiro CSV: {path} ({e})") from e
+        
+        if len(df.columns) <= 1:
+            raise ValueError(f"Não foi possível ler o ficheiro CSV: {path}")
+        
+        return df
+    
+    def _read_csv(self, path: Path, dialect: dict, **kwargs) -> pd.DataFrame:
+        """
+        Lê o CSV com um dialecto já detectado.
+        
+        O encoding vem da amostra; bytes inválidos mais à frente no ficheiro
+        são lidos como latin-1 na mesma passagem, sem reler o ficheiro.
+        """
+        return pd.read_csv(
+            path,
+            encoding=dialect["encoding"],
+            encoding_errors=CSV_DECODE_ERRORS,
+            sep=dialect["sep"],
+            decimal=dialect["decimal"],
+            header=0 if dialect["header"] else None,
+            **kwargs,
+        )
+    
+    @staticmethod
+    def _fingerprint(path: Path) -> tuple:
+        """Impressão digital barata de um ficheiro (caminho, tamanho, mtime)."""
+        stat = path.stat()
+        return (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    
+    def sniff_csv(self, path: Union[str, Path]) -> dict:
+        """
+        Detecta o dialecto de um CSV a partir de uma amostra limitada.
+        
+        Lê no máximo CSV_SAMPLE_BYTES do início do ficheiro e decide
+        encoding, separador, presença de cabeçalho e separador decimal.
+        A decisão fica em cache pela impressão digital do ficheiro
+        (caminho, tamanho e data de modificação).
+        
+        Args:
+            path: Caminho para o ficheiro CSV
+            
+        Returns:
+            dict com encoding, sep, header e decimal
+        """
+        path = Path(path)
+        fingerprint = self._fingerprint(path)
+        
+        dialect = self._dialect_cache.get(fingerprint)
+        if dialect is None:
+            with open(path, "rb") as f:
+                sample = f.read(CSV_SAMPLE_BYTES)
+            dialect = self._detect_dialect(sample, truncated=fingerprint[1] > len(sample))
+            self._dialect_cache[fingerprint] = dialect
+        
+        self.last_dialect = dict(dialect)
+        logger.info(
+            f"Dialecto CSV de {path.name}: encoding={dialect['encoding']}, "
+            f"sep={dialect['sep']!r}, header={dialect['header']}, decimal={dialect['decimal']!r}"
+        )
+        return self.last_dialect
+    
+    def _detect_dialect(self, sample: bytes, truncated: bool = False) -> dict:
+        """Decide o dialecto a partir de uma amostra de bytes."""
+        # Descartar a última linha se a amostra foi cortada a meio
+        if truncated and b"\n" in sample:
+            sample = sample[:sample.rindex(b"\n")]
+        
+        encoding = None
+        text = None
+        for candidate in CSV_ENCODINGS:
+            try:
+                text = sample.decode(candidate)
+                encoding = candidate
+                break
+            except UnicodeDecodeError:
+                continue
+        
+        if text is None:
+            raise ValueError("Não foi possível detectar o encoding do ficheiro CSV")
+        
+        if text.startswith("\ufeff"):
+            text = text[1:]
+            encoding = "utf-8-sig"
+        
+        lines = [line for line in text.splitlines() if line.strip()]
+        if not lines:
+            raise ValueError("Ficheiro CSV vazio")
+        
+        sep = self._detect_delimiter(lines)
+        rows = list(csv.reader(lines, delimiter=sep))
+        
+        return {
+            "encoding": encoding,
+            "sep": sep,
+            "header": self._detect_header(rows, "\n".join(lines)),
+            "decimal": self._detect_decimal(rows[1:] or rows, sep),
+        }
+    
+    def _detect_delimiter(self, lines: list) -> str:
+        """Escolhe o separador que produz o número de colunas mais consistente."""
+        try:
+            return csv.Sniffer().sniff("\n".join(lines), delimiters="".join(CSV_DELIMITERS)).delimiter
+        except csv.Error:
+            pass
+        
+        # Fallback: separador com mais colunas constantes entre linhas
+        best_sep, best_score = CSV_DELIMITERS[0], 0
+        for sep in CSV_DELIMITERS:
+            widths = [len(row) for row in csv.reader(lines, delimiter=sep)]
+            if widths[0] <= 1:
+                continue
+            score = widths[0] * sum(1 for w in widths if w == widths[0])
+            if score > best_score:
+                best_sep, best_score = sep, score
+        
+        return best_sep
+    
+    def _detect_header(self, rows: list, text: str) -> bool:
+        """Detecta se a primeira linha é um cabeçalho."""
+        known = {alias for aliases in self.COLUMN_MAPPINGS.values() for alias in aliases}
+        if any(field.lower().strip() in known for field in rows[0]):
+            return True
+        
+        try:
+            return csv.Sniffer().has_header(text)
+        except csv.Error:
+            return True
+    
+    def _detect_decimal(self, rows: list, sep: str) -> str:
+        """Detecta vírgula decimal (só possível se o separador não for vírgula)."""
+        if sep == ",":
+            return "."
+        
+        comma = dot = 0
+        for row in rows:
+            for field in row:
+                field = field.strip()
+                if _DECIMAL_COMMA.match(field):
+                    comma += 1
+                elif _DECIMAL_DOT.match(field):
+                    dot += 1
+        
+        return "," if comma > dot else "."
     
     def _load_excel(self, path: Path) -> pd.DataFrame:
         """Carrega Excel."""
@@ -134,7 +454,7 @@ class ETLProcessor:
     
     def _normalize_columns(self, df: pd.DataFrame, data_type: str) -> pd.DataFrame:
         """Normaliza nomes de colunas para formato padrão."""
-        df.columns = df.columns.str.lower().str.strip()
+        df.columns = df.columns.astype(str).str.lower().str.strip()
         
         # Mapeamento específico por tipo
         if data_type == "sales":
@@ -144,6 +464,7 @@ class ETLProcessor:
                 "produto_id": self.COLUMN_MAPPINGS["produto_id"],
                 "quantidade": self.COLUMN_MAPPINGS["quantidade"],
                 "valor": self.COLUMN_MAPPINGS["valor"],
+                "factura_id": self.COLUMN_MAPPINGS["factura_id"],
             }
         elif data_type == "customers":
             mapping = {
@@ -216,6 +537,23 @@ class ETLProcessor:
         
         return df
     
+    def _encode_ids(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Codifica cliente_id e produto_id uma única vez (IDs -> int32).
+        
+        Cria os vocabulários partilhados e guarda as colunas como
+        categóricas com os códigos desses vocabulários: um inteiro por
+        linha em vez de um objecto str, e as análises reutilizam os
+        códigos em vez de voltar a codificar o texto.
+        """
+        _, self.customer_vocab = encode_ids(df["cliente_id"])
+        _, self.product_vocab = encode_ids(df["produto_id"])
+        
+        return df.assign(
+            cliente_id=encode_column(df["cliente_id"], self.customer_vocab),
+            produto_id=encode_column(df["produto_id"], self.product_vocab),
+        )
+    
     def get_summary(self) -> dict:
         """Retorna resumo dos dados carregados."""
         if self.sales_df is None:
@@ -243,10 +581,157 @@ class ETLProcessor:
             logger.info(f"Dados exportados para {output_path}")
 
 
-def load_demo_data() -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+def _require_pyarrow():
+    """Importa pyarrow (dependência opcional para formato colunar)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow é necessário para ficheiros Parquet: pip install 'aiti-insights[parquet]'"
+        ) from e
+    
+    return pa, pq
+
+
+def _to_sales_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Fixa os tipos das colunas de vendas para um esquema colunar estável."""
+    dtypes = {col: SALES_DTYPES.get(col, "string") for col in df.columns}
+    return df.astype(dtypes)
+
+
+def _sales_schema(df: pd.DataFrame):
+    """Esquema Arrow de um DataFrame de vendas já tipado."""
+    pa, _ = _require_pyarrow()
+    return pa.Schema.from_pandas(df, preserve_index=False)
+
+
+def _write_run(df: pd.DataFrame, path: Path, schema, row_group_size: int):
+    """Grava um run ordenado em Parquet, em row groups de row_group_size linhas."""
+    pa, pq = _require_pyarrow()
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    pq.write_table(table, path, row_group_size=row_group_size)
+
+
+def _merge_runs(
+    run_paths: List[Path],
+    output_path: Path,
+    schema,
+    key: str,
+    batch_size: int,
+    work_dir: Path,
+    fanin: int = MERGE_FANIN
+) -> int:
+    """
+    Funde runs Parquet ordenados em passagens de no máximo fanin runs.
+    
+    Com mais de fanin runs, cada grupo é fundido num run intermédio em
+    work_dir (row groups de batch_size // fanin linhas), até restarem no
+    máximo fanin runs, fundidos em output_path. Assim a memória não cresce
+    com o número de runs.
+    
+    Returns:
+        Pico de memória Arrow (bytes) durante a fusão
+    """
+    peak = 0
+    merge_pass = 0
+    row_group_size = max(1, batch_size // fanin)
+    
+    while len(run_paths) > fanin:
+        merged_paths = []
+        for start in range(0, len(run_paths), fanin):
+            group = run_paths[start:start + fanin]
+            merged_path = work_dir / f"merge_{merge_pass:02d}_{start // fanin:05d}.parquet"
+            peak = max(peak, _merge_sorted_runs(group, merged_path, schema, key, batch_size, row_group_size))
+            merged_paths.append(merged_path)
+            
+            # Runs intermédios de passagens anteriores já não são precisos
+            if merge_pass > 0:
+                for path in group:
+                    path.unlink()
+        
+        logger.debug(f"Passagem {merge_pass} da fusão: {len(run_paths)} -> {len(merged_paths)} runs")
+        run_paths = merged_paths
+        merge_pass += 1
+    
+    return max(peak, _merge_sorted_runs(run_paths, output_path, schema, key, batch_size))
+
+
+def _merge_sorted_runs(
+    run_paths: List[Path],
+    output_path: Path,
+    schema,
+    key: str,
+    batch_size: int,
+    row_group_size: Optional[int] = None
+) -> int:
+    """
+    Funde runs Parquet ordenados por key num único ficheiro ordenado.
+    
+    As batch_size linhas em memória são repartidas pelos runs: cada um
+    tem um buffer de batch_size // len(run_paths) linhas (mínimo 1). Os
+    runs são lidos sem pre-buffer, um row group de cada vez. Em cada
+    passo escreve todas as linhas com chave <= ao menor último valor
+    dos buffers, que já não podem ser ultrapassadas por linhas ainda não
+    lidas, e só depois volta a ler dos runs esgotados.
+    
+    Returns:
+        Pico de memória Arrow (bytes, pa.total_allocated_bytes) durante a fusão
+    """
+    pa, pq = _require_pyarrow()
+    
+    run_batch = max(1, batch_size // len(run_paths))
+    readers = [
+        pq.ParquetFile(p, pre_buffer=False).iter_batches(batch_size=run_batch)
+        for p in run_paths
+    ]
+    
+    def next_buffer(reader):
+        batch = next(reader, None)
+        return None if batch is None else batch.to_pandas()
+    
+    buffers = [next_buffer(reader) for reader in readers]
+    peak = pa.total_allocated_bytes()
+    
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with pq.ParquetWriter(output_path, schema) as writer:
+        while True:
+            active = [i for i, buf in enumerate(buffers) if buf is not None]
+            if not active:
+                break
+            
+            bound = min(buffers[i][key].iloc[-1] for i in active)
+            
+            parts, exhausted = [], []
+            for i in active:
+                buf = buffers[i]
+                n = int(buf[key].searchsorted(bound, side="right"))
+                parts.append(buf.iloc[:n])
+                buffers[i] = buf.iloc[n:]
+                
+                if n == len(buf):
+                    exhausted.append(i)
+            
+            merged = pd.concat(parts, ignore_index=True).sort_values(key, kind="stable")
+            table = pa.Table.from_pandas(merged, schema=schema, preserve_index=False)
+            peak = max(peak, pa.total_allocated_bytes())
+            writer.write_table(table, row_group_size=row_group_size)
+            del parts, merged, table
+            
+            for i in exhausted:
+                buffers[i] = next_buffer(readers[i])
+            peak = max(peak, pa.total_allocated_bytes())
+    
+    return peak
+
+
+def load_demo_data(cache_dir: Union[str, Path] = None) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
     Carrega dados de demonstração incluídos no pacote.
     
+    Args:
+        cache_dir: Directório da cache ETL (opcional)
+    
     Returns:
         Tuple com (sales_df, customers_df, products_df)
     """
@@ -257,7 +742,7 @@ def load_demo_data() -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     if not data_dir.exists():
         raise FileNotFoundError("Dados de demonstração não encontrados")
     
-    etl = ETLProcessor()
+    etl = ETLProcessor(cache_dir=cache_dir)
     
     sales_df = etl.load_sales(data_dir / "vendas.csv")
     customers_df = etl.load_customers(data_dir / "clientes.csv")
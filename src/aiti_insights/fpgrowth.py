@@ -0,0 +1,225 @@
+"""
+AITI Insights - FP-Growth
+=========================
+
+Mineração de itemsets frequentes sem geração de candidatos.
+
+Constrói uma FP-tree em duas passagens pelos cestos (contagem de itens,
+depois inserção dos itens frequentes por ordem de frequência) e minera
+recursivamente as árvores condicionais. Indicado para cestos densos
+(clientes grossistas com centenas de SKUs), onde a geração de
+candidatos nível a nível explode.
+"""
+
+import numpy as np
+from scipy import sparse
+from collections import defaultdict
+from itertools import combinations
+from typing import Dict, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _FPNode:
+    """Nó da FP-tree."""
+    
+    __slots__ = ("item", "count", "parent", "children", "next")
+    
+    def __init__(self, item: int, parent: "_FPNode" = None):
+        self.item = item
+        self.count = 0
+        self.parent = parent
+        self.children = {}
+        self.next = None
+
+
+class FPTree:
+    """
+    FP-tree: prefixos partilhados dos cestos, com uma lista ligada
+    por item (header table) para percorrer todas as suas ocorrências.
+    """
+    
+    def __init__(self):
+        self.root = _FPNode(-1)
+        self.header = {}
+        self.item_counts = defaultdict(int)
+        self._last = {}
+    
+    def insert(self, path: List[int], count: int = 1):
+        """Insere um caminho (itens já pela ordem global) com um peso."""
+        node = self.root
+        
+        for item in path:
+            child = node.children.get(item)
+            if child is None:
+                child = _FPNode(item, node)
+                node.children[item] = child
+                
+                if item in self._last:
+                    self._last[item].next = child
+                else:
+                    self.header[item] = child
+                self._last[item] = child
+            
+            child.count += count
+            self.item_counts[item] += count
+            node = child
+    
+    def prefix_paths(self, item: int) -> List[Tuple[List[int], int]]:
+        """Base de padrões condicional: caminhos até às ocorrências de item."""
+        paths = []
+        node = self.header.get(item)
+        
+        while node is not None:
+            path = []
+            parent = node.parent
+            while parent.item != -1:
+                path.append(parent.item)
+                parent = parent.parent
+            
+            if path:
+                path.reverse()
+                paths.append((path, node.count))
+            node = node.next
+        
+        return paths
+    
+    def prefix_counts(self, item: int) -> Dict[int, int]:
+        """Contagem de cada item nos caminhos até às ocorrências de item."""
+        counts = defaultdict(int)
+        node = self.header.get(item)
+        
+        while node is not None:
+            count = node.count
+            parent = node.parent
+            while parent.item != -1:
+                counts[parent.item] += count
+                parent = parent.parent
+            node = node.next
+        
+        return counts
+    
+    def single_path(self) -> List[_FPNode]:
+        """Devolve os nós se a árvore for um único caminho, senão None."""
+        nodes = []
+        node = self.root
+        
+        while node.children:
+            if len(node.children) > 1:
+                return None
+            node = next(iter(node.children.values()))
+            nodes.append(node)
+        
+        return nodes
+
+
+def fpgrowth(
+    baskets: sparse.csr_matrix,
+    min_count: float,
+    max_len: int = 2
+) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Encontra itemsets frequentes com FP-Growth.
+    
+    Args:
+        baskets: Matriz CSR cesto×item (códigos de produto)
+        min_count: Número mínimo de cestos
+        max_len: Tamanho máximo dos itemsets
+    
+    Returns:
+        dict nível k -> (itemsets int32 (n_k, k) ordenados, counts int64),
+        no mesmo formato dos níveis do AprioriAnalyzer
+    """
+    # Passagem 1: contar itens e fixar a ordem global (frequência decrescente)
+    item_counts = np.bincount(baskets.indices, minlength=baskets.shape[1])
+    frequent_items = np.flatnonzero(item_counts >= min_count)
+    order = frequent_items[np.lexsort((frequent_items, -item_counts[frequent_items]))]
+    rank = np.full(baskets.shape[1], -1, dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    
+    # Passagem 2: inserir cada cesto filtrado e ordenado na árvore
+    tree = FPTree()
+    indptr, indices = baskets.indptr, baskets.indices
+    for b in range(baskets.shape[0]):
+        basket = indices[indptr[b]:indptr[b + 1]]
+        basket = basket[rank[basket] >= 0]
+        if len(basket) > 0:
+            tree.insert(basket[np.argsort(rank[basket])].tolist())
+    
+    found = []
+    _mine(tree, (), min_count, max_len, found)
+    
+    logger.info(f"FP-Growth: {len(found)} itemsets frequentes")
+    return _to_levels(found)
+
+
+def _mine(
+    tree: FPTree,
+    suffix: tuple,
+    min_count: float,
+    max_len: int,
+    found: list
+):
+    """Minera recursivamente as árvores condicionais de uma FP-tree."""
+    # Árvore com um só caminho: todas as combinações são frequentes
+    path = tree.single_path()
+    if path is not None:
+        room = max_len - len(suffix)
+        for size in range(1, min(room, len(path)) + 1):
+            for combo in combinations(path, size):
+                found.append((suffix + tuple(node.item for node in combo), combo[-1].count))
+        return
+    
+    for item, count in tree.item_counts.items():
+        if count < min_count:
+            continue
+        
+        itemset = suffix + (item,)
+        found.append((itemset, count))
+        
+        if len(itemset) >= max_len:
+            continue
+        
+        # Último nível: as contagens condicionais já são os suportes
+        if len(itemset) == max_len - 1:
+            found.extend(
+                (itemset + (prefix_item,), c)
+                for prefix_item, c in tree.prefix_counts(item).items() if c >= min_count
+            )
+            continue
+        
+        paths = tree.prefix_paths(item)
+        
+        # Itens frequentes na base condicional
+        conditional_counts = defaultdict(int)
+        for prefix, path_count in paths:
+            for prefix_item in prefix:
+                conditional_counts[prefix_item] += path_count
+        
+        if not any(c >= min_count for c in conditional_counts.values()):
+            continue
+        
+        conditional = FPTree()
+        for prefix, path_count in paths:
+            prefix = [i for i in prefix if conditional_counts[i] >= min_count]
+            if prefix:
+                conditional.insert(prefix, path_count)
+        
+        _mine(conditional, itemset, min_count, max_len, found)
+
+
+def _to_levels(found: list) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """Agrupa itemsets por tamanho em arrays ordenados lexicograficamente."""
+    by_size = defaultdict(list)
+    for itemset, count in found:
+        by_size[len(itemset)].append((sorted(itemset), count))
+    
+    levels = {}
+    for k in sorted(by_size):
+        itemsets = np.array([i for i, _ in by_size[k]], dtype=np.int32).reshape(-1, k)
+        counts = np.array([c for _, c in by_size[k]], dtype=np.int64)
+        order = np.lexsort(itemsets.T[::-1])
+        levels[k] = (itemsets[order], counts[order])
+    
+    return levels
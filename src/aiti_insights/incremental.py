@@ -0,0 +1,512 @@
+"""
+AITI Insights - Regras de Associação Incrementais
+=================================================
+
+Estado persistente de contagens para manter regras de associação à
+medida que chegam vendas novas, sem recontar o histórico:
+
+- contagem de itens e de pares (códigos inteiros)
+- número de cestos
+- composição de cada cesto, para re-calcular só os cestos alterados
+- última compra de cada cesto, para expirar dados antigos (janela deslizante)
+
+Tal como no AprioriAnalyzer, só cestos com 2+ produtos contam.
+
+Com half_life_days, cada cesto pesa 2^(-idade/half_life) pela sua
+última compra ("forward decay"): as contagens guardam exp(λ·(dia - âncora))
+e o decaimento até hoje é um único factor comum, aplicado na leitura.
+Quando o expoente cresce demasiado, os totais são re-escalados para uma
+âncora nova — nunca se recontam os cestos.
+
+O conjunto de pares frequentes é mantido entre chamadas a levels(): só se
+reavaliam os pares cuja contagem mudou, os que já eram frequentes e, se o
+limiar desceu (cestos expirados), os dos escalões de contagem (potências
+de 2) entre o limiar novo e o antigo. Re-derivar as regras custa o delta
+e o número de pares frequentes, não o total de pares guardados.
+"""
+
+import heapq
+import math
+import pandas as pd
+import numpy as np
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Tuple, Union
+import logging
+
+from .encoding import IDVocabulary, json_bytes, read_json, save_npz
+
+logger = logging.getLogger(__name__)
+
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+# Versão do formato de estado (save/load); incrementar se os arrays mudarem
+STATE_VERSION = 2
+
+# Re-escalar os totais com decaimento quando o factor da âncora passa 2^32
+RESCALE_HALF_LIVES = 32
+
+
+class AssociationState:
+    """
+    Contagens incrementais de itens e pares por cesto.
+    
+    Exemplo:
+        state = AssociationState(basket="day", half_life_days=90)
+        state.update(vendas_ontem)
+        state.expire(pd.Timestamp("2024-01-01"))
+        levels = state.levels(min_support=0.01)
+    """
+    
+    def __init__(
+        self,
+        basket: str = "transaction",
+        window_days: int = None,
+        vocab: IDVocabulary = None,
+        half_life_days: float = None
+    ):
+        """
+        Args:
+            basket: Definição de cesto ("transaction", "day" ou "window")
+            window_days: Tamanho da janela em dias (basket="window")
+            vocab: Vocabulário de produtos partilhado (opcional)
+            half_life_days: Meia-vida do decaimento dos cestos (None = sem decaimento)
+        """
+        if basket not in ("transaction", "day", "window"):
+            raise ValueError(f"Definição de cesto desconhecida: {basket}")
+        
+        if basket == "window" and (window_days is None or window_days < 1):
+            raise ValueError("basket='window' requer window_days >= 1")
+        
+        if half_life_days is not None and half_life_days <= 0:
+            raise ValueError(f"half_life_days deve ser > 0: {half_life_days}")
+        
+        self.basket = basket
+        self.window_days = window_days
+        self.vocab = vocab if vocab is not None else IDVocabulary()
+        
+        self.baskets = {}  # chave do cesto -> códigos de produto ordenados
+        self.last_seen = {}  # chave do cesto -> dia da última compra
+        self.first_day = {}  # transacção -> dia da primeira compra (janelas)
+        self.half_life_days = half_life_days
+        self.item_counts = np.zeros(len(self.vocab), dtype=self._dtype)
+        self.pair_counts = defaultdict(self._dtype)  # (a << 32) | b, com a < b -> contagem
+        self.n_baskets = 0
+        self.weight_sum = 0.0  # soma dos pesos na escala da âncora (com decaimento)
+        self.anchor_day = None  # dia de referência dos pesos guardados
+        self.current_day = None  # compra mais recente vista
+        
+        self._expiry = []  # heap (dia, sequência, chave) com entradas obsoletas ignoradas
+        self._sequence = 0
+        self._reset_frequent()
+    
+    def update(
+        self,
+        sales_df: pd.DataFrame,
+        product_col: str = "produto_id",
+        transaction_col: str = "cliente_id",
+        date_col: str = "data"
+    ) -> int:
+        """
+        Acrescenta vendas novas ao estado.
+        
+        Returns:
+            Número de cestos novos ou alterados
+        """
+        if len(sales_df) == 0:
+            return 0
+        
+        products = self.vocab.encode(sales_df[product_col], extend=True)
+        if len(self.vocab) > len(self.item_counts):
+            self.item_counts = np.concatenate([
+                self.item_counts, np.zeros(len(self.vocab) - len(self.item_counts), dtype=self._dtype)
+            ])
+        
+        days = pd.to_datetime(sales_df[date_col]).to_numpy().astype("datetime64[D]").astype(np.int64)
+        if self.half_life_days is not None:
+            self._advance(int(days.max()))
+        transactions = sales_df[transaction_col].to_numpy()
+        
+        delta = pd.DataFrame({
+            "transaction": transactions,
+            "period": self._periods(transactions, days),
+            "item": products,
+            "day": days,
+        })
+        grouped = delta.groupby(["transaction", "period"], sort=False).agg(
+            items=("item", "unique"), last_day=("day", "max")
+        )
+        
+        pair_deltas, pair_weights = [], []
+        changed = 0
+        
+        for key, items, last_day in zip(grouped.index, grouped["items"], grouped["last_day"]):
+            old_day = self.last_seen.get(key)
+            if last_day > self.last_seen.get(key, last_day - 1):
+                self.last_seen[key] = int(last_day)
+                heapq.heappush(self._expiry, (int(last_day), self._sequence, key))
+                self._sequence += 1
+            
+            old = self.baskets.get(key, _EMPTY)
+            added = np.setdiff1d(items.astype(np.int32), old)
+            
+            if self.half_life_days is not None:
+                # Peso do cesto muda com a última compra: sai com o antigo, entra com o novo
+                new = np.union1d(old, added).astype(np.int32)
+                moved = old_day is not None and self.last_seen[key] != old_day
+                if len(added) == 0 and not moved:
+                    continue
+                
+                self.baskets[key] = new
+                changed += 1
+                if len(old) >= 2:
+                    self._add_basket(old, -self._weight(old_day), pair_deltas, pair_weights)
+                if len(new) >= 2:
+                    self._add_basket(new, self._weight(self.last_seen[key]), pair_deltas, pair_weights)
+                continue
+            
+            if len(added) == 0:
+                continue
+            
+            new = np.union1d(old, added).astype(np.int32)
+            self.baskets[key] = new
+            changed += 1
+            
+            if len(old) >= 2:
+                # Cesto já contado: só os itens e pares novos
+                self.item_counts[added] += 1
+                pair_deltas.append(_pair_keys(added))
+                pair_deltas.append(_cross_keys(added, old))
+            elif len(new) >= 2:
+                # Cesto passa a ter 2+ produtos: entra na contagem
+                self.n_baskets += 1
+                self.item_counts[new] += 1
+                pair_deltas.append(_pair_keys(new))
+        
+        self._apply_pairs(pair_deltas, +1, pair_weights or None)
+        
+        logger.info(f"Estado incremental: {changed} cestos alterados, {self.n_baskets} cestos no total")
+        return changed
+    
+    def expire(self, before) -> int:
+        """
+        Remove cestos cuja última compra é anterior a before.
+        
+        Com basket="transaction" e transacção = cliente, um cliente só sai
+        quando não compra desde before; com "day" ou "window" a janela
+        deslizante é exacta ao nível do dia/janela.
+        
+        Returns:
+            Número de cestos removidos
+        """
+        cutoff = int(np.datetime64(pd.Timestamp(before), "D").astype(np.int64))
+        pair_deltas, pair_weights = [], []
+        removed = 0
+        
+        while self._expiry and self._expiry[0][0] < cutoff:
+            day, _, key = heapq.heappop(self._expiry)
+            if self.last_seen.get(key) != day:
+                continue  # entrada obsoleta: o cesto teve compras depois
+            
+            del self.last_seen[key]
+            items = self.baskets.pop(key, _EMPTY)
+            removed += 1
+            
+            if len(items) >= 2 and self.half_life_days is not None:
+                self._add_basket(items, -self._weight(day), pair_deltas, pair_weights)
+            elif len(items) >= 2:
+                self.n_baskets -= 1
+                self.item_counts[items] -= 1
+                pair_deltas.append(_pair_keys(items))
+        
+        self._apply_pairs(pair_deltas, -1, pair_weights or None)
+        
+        logger.info(f"Estado incremental: {removed} cestos expirados")
+        return removed
+    
+    def levels(self, min_support: float) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Itens e pares frequentes no formato de níveis do AprioriAnalyzer.
+        
+        Com decaimento, as contagens são somas de pesos à data de
+        current_day (ver total).
+        
+        Returns:
+            dict 1 e 2 -> (itemsets int32 (n_k, k) ordenados, counts int64
+            ou float64 com decaimento)
+        """
+        n_baskets = self.total
+        scale = self._scale()
+        min_count = min_support * n_baskets
+        
+        item_counts = self.item_counts * scale if scale != 1 else self.item_counts
+        items = np.flatnonzero(item_counts >= min_count)
+        levels = {1: (items[:, None].astype(np.int32), item_counts[items])}
+        
+        keys = self._frequent_pairs(min_support)
+        if len(keys):
+            counts = np.array([self.pair_counts[key] for key in keys.tolist()], dtype=self._dtype)
+            if scale != 1:
+                counts = counts * scale
+            
+            pairs = np.column_stack([keys >> 32, keys & 0xFFFFFFFF]).astype(np.int32)
+            levels[2] = (pairs, counts)
+        
+        return levels
+    
+    @property
+    def total(self) -> float:
+        """Número de cestos, ou soma dos pesos com decaimento à data de current_day."""
+        if self.half_life_days is None:
+            return self.n_baskets
+        return self.weight_sum * self._scale()
+    
+    def save(self, path: Union[str, Path]):
+        """
+        Guarda o estado em disco.
+        
+        Formato: arquivo NumPy (.npz, sem pickle), como AprioriAnalyzer.save:
+        cabeçalho JSON com os escalares, vocabulário e IDs de transacção em
+        JSON, e arrays para contagens e para a composição dos cestos (CSR).
+        """
+        keys = list(self.last_seen)
+        items = [self.baskets.get(key, _EMPTY) for key in keys]
+        pair_keys = np.fromiter(self.pair_counts.keys(), dtype=np.int64, count=len(self.pair_counts))
+        
+        header = {
+            "versao": STATE_VERSION,
+            "basket": self.basket,
+            "window_days": self.window_days,
+            "half_life_days": self.half_life_days,
+            "n_baskets": int(self.n_baskets),
+            "weight_sum": float(self.weight_sum),
+            "anchor_day": self.anchor_day,
+            "current_day": self.current_day,
+        }
+        
+        save_npz(path, {
+            "header": json_bytes(header),
+            "vocab": json_bytes(self.vocab.values.tolist()),
+            "item_counts": self.item_counts,
+            "pair_keys": pair_keys,
+            "pair_counts": np.array([self.pair_counts[key] for key in pair_keys.tolist()], dtype=self._dtype),
+            "basket_transactions": json_bytes([key[0] for key in keys]),
+            "basket_periods": np.array([key[1] for key in keys], dtype=np.int64),
+            "basket_last_day": np.array([self.last_seen[key] for key in keys], dtype=np.int64),
+            "basket_indptr": np.concatenate([[0], np.cumsum([len(i) for i in items])]).astype(np.int64),
+            "basket_items": np.concatenate([_EMPTY, *items]).astype(np.int32),
+            "first_day_transactions": json_bytes(list(self.first_day)),
+            "first_day": np.array(list(self.first_day.values()), dtype=np.int64),
+        })
+    
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "AssociationState":
+        """Carrega um estado guardado com save()."""
+        with np.load(path, allow_pickle=False) as data:
+            header = read_json(data["header"])
+            if header.get("versao") != STATE_VERSION:
+                raise ValueError(f"Versão de estado incompatível: {header.get('versao')}")
+            
+            state = cls(
+                basket=header["basket"],
+                window_days=header["window_days"],
+                vocab=IDVocabulary(read_json(data["vocab"])),
+                half_life_days=header["half_life_days"],
+            )
+            state.n_baskets = header["n_baskets"]
+            state.weight_sum = header["weight_sum"]
+            state.anchor_day = header["anchor_day"]
+            state.current_day = header["current_day"]
+            state.item_counts = data["item_counts"]
+            state.pair_counts.update(zip(data["pair_keys"].tolist(), data["pair_counts"].tolist()))
+            
+            indptr, items = data["basket_indptr"], data["basket_items"]
+            keys = zip(read_json(data["basket_transactions"]), data["basket_periods"].tolist())
+            for i, (key, last_day) in enumerate(zip(keys, data["basket_last_day"].tolist())):
+                state.baskets[key] = items[indptr[i]:indptr[i + 1]]
+                state.last_seen[key] = last_day
+            state.first_day = dict(zip(read_json(data["first_day_transactions"]), data["first_day"].tolist()))
+        
+        # Fila de expiração reconstruída a partir das últimas compras
+        state._expiry = [(day, i, key) for i, (key, day) in enumerate(state.last_seen.items())]
+        heapq.heapify(state._expiry)
+        state._sequence = len(state._expiry)
+        state._reset_frequent()
+        return state
+    
+    def _reset_frequent(self):
+        """Descarta o conjunto de pares frequentes; a próxima chamada a levels() revê todos os pares."""
+        self._buckets = defaultdict(set)  # escalão (expoente de 2 da contagem) -> chaves dos pares
+        for key, count in self.pair_counts.items():
+            self._buckets[_bucket(count)].add(key)
+        
+        self._touched = set()  # pares com contagem alterada desde a última chamada a levels()
+        self._frequent = None  # pares frequentes na última chamada (None = rever todos)
+        self._frequent_support = None
+        self._threshold = 0.0  # limiar da última chamada, na escala das contagens guardadas
+    
+    def _frequent_pairs(self, min_support: float) -> np.ndarray:
+        """
+        Chaves ordenadas dos pares frequentes, actualizadas desde a última chamada.
+        
+        Reavalia os pares alterados (self._touched), os que já eram
+        frequentes (o limiar sobe com o total) e, se o limiar desceu, os
+        escalões de contagem entre o limiar novo e o antigo.
+        """
+        total = self.total
+        scale = self._scale()
+        threshold = min_support * total / scale
+        
+        if self._frequent is None or min_support != self._frequent_support:
+            self._frequent = set()
+            check = set(self.pair_counts)
+        else:
+            check = self._touched | self._frequent
+            if threshold < self._threshold:
+                low = _bucket(threshold) - 1 if threshold > 0 else -math.inf
+                high = _bucket(self._threshold) + 1
+                for bucket, keys in self._buckets.items():
+                    if low <= bucket <= high:
+                        check |= keys
+        
+        if check:
+            keys = np.fromiter(check, dtype=np.int64, count=len(check))
+            counts = np.array([self.pair_counts.get(key, 0) for key in keys.tolist()], dtype=self._dtype)
+            if scale != 1:
+                counts = counts * scale
+            keep = counts / total >= min_support
+            
+            self._frequent.difference_update(keys[~keep].tolist())
+            self._frequent.update(keys[keep].tolist())
+        
+        self._touched = set()
+        self._frequent_support = min_support
+        self._threshold = threshold
+        
+        return np.sort(np.fromiter(self._frequent, dtype=np.int64, count=len(self._frequent)))
+    
+    def _periods(self, transactions: np.ndarray, days: np.ndarray) -> np.ndarray:
+        """Período de cada linha segundo a definição de cesto."""
+        if self.basket == "transaction":
+            return np.zeros(len(days), dtype=np.int64)
+        
+        if self.basket == "day":
+            return days
+        
+        # Janelas contadas a partir da primeira compra conhecida da transacção
+        firsts = pd.Series(days).groupby(transactions).min()
+        for transaction, day in firsts.items():
+            self.first_day.setdefault(transaction, int(day))
+        
+        anchors = pd.Series(transactions).map(self.first_day).to_numpy(dtype=np.int64)
+        return (days - anchors) // self.window_days
+    
+    @property
+    def _dtype(self):
+        return np.int64 if self.half_life_days is None else np.float64
+    
+    @property
+    def _decay_rate(self) -> float:
+        return np.log(2) / self.half_life_days
+    
+    @property
+    def _tolerance(self) -> float:
+        """Contagem com decaimento abaixo da qual um total é considerado zero."""
+        return 1e-9 * max(self.weight_sum, 1.0)
+    
+    def _weight(self, day: int) -> float:
+        """Peso de um cesto com última compra em day, na escala da âncora."""
+        return float(np.exp(self._decay_rate * (day - self.anchor_day)))
+    
+    def _scale(self) -> float:
+        """Factor de decaimento da âncora até current_day."""
+        if self.half_life_days is None or self.anchor_day is None:
+            return 1
+        return float(np.exp(-self._decay_rate * (self.current_day - self.anchor_day)))
+    
+    def _advance(self, day: int):
+        """Avança current_day; re-escala os totais se a âncora ficou distante."""
+        if self.anchor_day is None:
+            self.anchor_day = self.current_day = day
+            return
+        
+        self.current_day = max(self.current_day, day)
+        if self.current_day - self.anchor_day <= RESCALE_HALF_LIVES * self.half_life_days:
+            return
+        
+        factor = self._scale()
+        self.item_counts *= factor
+        self.weight_sum *= factor
+        for key in self.pair_counts:
+            self.pair_counts[key] *= factor
+        self.anchor_day = self.current_day
+        self._reset_frequent()
+        logger.info(f"Estado incremental: totais com decaimento re-escalados (factor {factor:.3g})")
+    
+    def _add_basket(self, items: np.ndarray, weight: float, pair_deltas: list, pair_weights: list):
+        """Soma (ou subtrai, com weight < 0) um cesto com decaimento aos totais."""
+        self.n_baskets += 1 if weight > 0 else -1
+        self.weight_sum += weight
+        self.item_counts[items] += weight
+        if weight < 0:
+            # Resíduos de arredondamento de itens que já não estão em nenhum cesto
+            residue = items[np.abs(self.item_counts[items]) <= self._tolerance]
+            self.item_counts[residue] = 0
+        pair_deltas.append(_pair_keys(items))
+        pair_weights.append(weight)
+    
+    def _apply_pairs(self, pair_deltas: list, sign: int, pair_weights: list = None):
+        """
+        Aplica contagens de pares agregadas (uma entrada por par distinto).
+        
+        Com pair_weights (decaimento), cada bloco de pair_deltas soma o
+        seu peso (com sinal) em vez de sign.
+        """
+        if not pair_deltas:
+            return
+        
+        if pair_weights is None:
+            keys, counts = np.unique(np.concatenate(pair_deltas), return_counts=True)
+            counts = sign * counts
+        else:
+            keys, inverse = np.unique(np.concatenate(pair_deltas), return_inverse=True)
+            weights = np.repeat(pair_weights, [len(d) for d in pair_deltas])
+            counts = np.bincount(inverse.ravel(), weights=weights, minlength=len(keys))
+        
+        pair_counts, buckets = self.pair_counts, self._buckets
+        keys = keys.tolist()
+        for key, count in zip(keys, counts.tolist()):
+            old = pair_counts.get(key, 0)
+            value = old + count
+            if old:
+                buckets[_bucket(old)].discard(key)
+            
+            if pair_weights is None and value:
+                pair_counts[key] = value
+            elif pair_weights is not None and abs(value) > self._tolerance:
+                pair_counts[key] = value
+            else:
+                pair_counts.pop(key, None)
+                continue
+            buckets[_bucket(value)].add(key)
+        
+        self._touched.update(keys)
+
+
+def _bucket(count: float) -> int:
+    """Escalão de uma contagem: expoente de 2 (contagens em [2^(e-1), 2^e) -> e)."""
+    return math.frexp(count)[1]
+
+
+def _pair_keys(items: np.ndarray) -> np.ndarray:
+    """Chaves int64 de todos os pares de um array ordenado de códigos."""
+    i, j = np.triu_indices(len(items), k=1)
+    return (items[i].astype(np.int64) << 32) | items[j].astype(np.int64)
+
+
+def _cross_keys(added: np.ndarray, old: np.ndarray) -> np.ndarray:
+    """Chaves int64 dos pares (novo, antigo), com o menor código primeiro."""
+    a = np.repeat(added, len(old)).astype(np.int64)
+    b = np.tile(old, len(added)).astype(np.int64)
+    return (np.minimum(a, b) << 32) | np.maximum(a, b)
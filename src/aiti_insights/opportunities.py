@@ -12,6 +12,8 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, List
 import logging
 
+from .encoding import IDVocabulary, encode_ids
+
 logger = logging.getLogger(__name__)
 
 
@@ -55,7 +57,10 @@ class OpportunityEngine:
         rules: List[Dict],
         rfm_segments: pd.DataFrame,
         customers_df: pd.DataFrame = None,
-        products_df: pd.DataFrame = None
+        products_df: pd.DataFrame = None,
+        sequential_rules: List[Dict] = None,
+        customer_vocab: Optional[IDVocabulary] = None,
+        product_vocab: Optional[IDVocabulary] = None
     ) -> List[Dict]:
         """
         Gera todas as oportunidades combinando análises.
@@ -66,6 +71,10 @@ class OpportunityEngine:
             rfm_segments: DataFrame com segmentação RFM
             customers_df: DataFrame com info de clientes (opcional)
             products_df: DataFrame com info de produtos (opcional)
+            sequential_rules: Regras sequenciais A -> B (opcional), para
+                agendar o cross-sell após a compra de A
+            customer_vocab: Vocabulário de clientes partilhado (opcional)
+            product_vocab: Vocabulário de produtos partilhado (opcional)
             
         Returns:
             Lista de oportunidades ordenadas por valor estimado
@@ -75,7 +84,9 @@ class OpportunityEngine:
         self.opportunities = []
         
         # 1. Oportunidades de Cross-Sell
-        cross_sell = self._generate_cross_sell(sales_df, rules, products_df)
+        cross_sell = self._generate_cross_sell(
+            sales_df, rules, products_df, sequential_rules, customer_vocab, product_vocab
+        )
         self.opportunities.extend(cross_sell)
         logger.info(f"Geradas {len(cross_sell)} oportunidades cross-sell")
         
@@ -106,50 +117,121 @@ class OpportunityEngine:
         self,
         sales_df: pd.DataFrame,
         rules: List[Dict],
-        products_df: pd.DataFrame = None
+        products_df: pd.DataFrame = None,
+        sequential_rules: List[Dict] = None,
+        customer_vocab: Optional[IDVocabulary] = None,
+        product_vocab: Optional[IDVocabulary] = None
     ) -> List[Dict]:
-        """Gera oportunidades de cross-sell baseado em regras Apriori."""
+        """
+        Gera oportunidades de cross-sell baseado em regras Apriori.
+        
+        Com regras sequenciais A -> B, a oportunidade de B ganha data
+        sugerida (última compra de A + atraso mediano) e a probabilidade
+        sequencial, usando a regra com maior confiança entre os produtos
+        que o cliente já compra.
+        """
         opportunities = []
         
         if not rules:
             return opportunities
         
-        # Produtos por cliente
-        customer_products = sales_df.groupby("cliente_id")["produto_id"].apply(set).to_dict()
+        # Códigos inteiros dos IDs (os do ETL, se as colunas já vierem codificadas)
+        customers, customer_vocab = encode_ids(sales_df["cliente_id"], customer_vocab)
+        products, product_vocab = encode_ids(sales_df["produto_id"], product_vocab)
+        n_products = len(product_vocab)
+        
+        # Produtos por cliente (pares únicos cliente/produto ordenados)
+        keys = np.unique(customers.astype(np.int64) * n_products + products)
+        key_customers = keys // n_products
+        key_products = (keys % n_products).astype(products.dtype)
+        bounds = np.flatnonzero(np.diff(key_customers)) + 1
+        starts = np.concatenate([[0], bounds]) if len(keys) else bounds
+        customer_products = {
+            int(customer): set(items.tolist())
+            for customer, items in zip(key_customers[starts], np.split(key_products, bounds))
+        }
         
         # Valor médio por produto
-        avg_product_value = sales_df.groupby("produto_id")["valor"].mean().to_dict()
+        value_sums = np.bincount(products, weights=sales_df["valor"].to_numpy(dtype=float), minlength=n_products)
+        value_counts = np.bincount(products, minlength=n_products)
+        avg_product_value = np.divide(
+            value_sums, value_counts, out=np.zeros(n_products), where=value_counts > 0
+        )
+        
+        # Regras codificadas com o mesmo vocabulário de produtos
+        coded_rules = []
+        for rule in rules:
+            antecedent = product_vocab.encode(rule["antecedent"])
+            if (antecedent < 0).any():
+                continue  # Nenhum cliente tem o antecedente
+            consequent = rule["consequent"][0]
+            coded_rules.append((rule, set(antecedent.tolist()), int(product_vocab.encode([consequent])[0])))
+        
+        # Regras sequenciais por consequente: (antecedente, confiança, atraso)
+        follow_ups = {}
+        last_purchase = {}
+        if sequential_rules:
+            for rule in sequential_rules:
+                antecedent = int(product_vocab.encode(rule["antecedent"])[0])
+                consequent = int(product_vocab.encode(rule["consequent"])[0])
+                if antecedent >= 0 and consequent >= 0:
+                    follow_ups.setdefault(consequent, []).append(
+                        (antecedent, rule["confidence"], rule["atraso_mediano_dias"])
+                    )
+            
+            # Último dia de compra por (cliente, produto)
+            days = pd.to_datetime(sales_df["data"]).to_numpy().astype("datetime64[D]")
+            sale_keys = customers.astype(np.int64) * n_products + products
+            order = np.lexsort((days, sale_keys))
+            sorted_keys = sale_keys[order]
+            last = np.r_[sorted_keys[1:] != sorted_keys[:-1], True]
+            last_purchase = dict(zip(sorted_keys[last].tolist(), days[order][last]))
+        
+        # Nomes de produtos (primeira ocorrência de cada ID)
+        product_names = {}
+        if products_df is not None and "nome" in products_df.columns:
+            names = products_df.drop_duplicates(subset=["produto_id"])
+            product_names = dict(zip(names["produto_id"], names["nome"]))
         
         # Para cada cliente, verificar regras aplicáveis
-        for cliente_id, produtos in customer_products.items():
-            for rule in rules:
-                antecedent = set(rule["antecedent"])
+        for customer_code, produtos in customer_products.items():
+            cliente_id = customer_vocab.values[customer_code]
+            
+            for rule, antecedent, consequent_code in coded_rules:
                 consequent = rule["consequent"][0]
                 
                 # Cliente tem o antecedente mas não o consequente
-                if antecedent.issubset(produtos) and consequent not in produtos:
+                if antecedent.issubset(produtos) and consequent_code not in produtos:
                     # Estimar valor
-                    estimated_value = avg_product_value.get(consequent, 0)
+                    estimated_value = avg_product_value[consequent_code] if consequent_code >= 0 else 0
                     
                     # Obter nome do produto se disponível
-                    product_name = consequent
-                    if products_df is not None and "nome" in products_df.columns:
-                        match = products_df[products_df["produto_id"] == consequent]
-                        if len(match) > 0:
-                            product_name = match.iloc[0]["nome"]
+                    product_name = product_names.get(consequent, consequent)
                     
-                    opportunities.append({
+                    opportunity = {
                         "tipo": "cross_sell",
                         "cliente_id": cliente_id,
                         "produto_sugerido": consequent,
                         "produto_nome": product_name,
-                        "baseado_em": list(antecedent),
+                        "baseado_em": list(rule["antecedent"]),
                         "probabilidade": rule["confidence"],
                         "lift": rule["lift"],
-                        "valor_estimado": round(estimated_value, 2),
+                        "valor_estimado": round(float(estimated_value), 2),
                         "acao": f"Oferecer {product_name}",
                         "prioridade": self._calculate_priority(rule["confidence"], estimated_value)
-                    })
+                    }
+                    
+                    # Timing: seguir a regra sequencial mais confiante que o cliente activou
+                    timing = [f for f in follow_ups.get(consequent_code, []) if f[0] in produtos]
+                    if timing:
+                        antecedent_code, confidence, delay = max(timing, key=lambda f: f[1])
+                        bought = last_purchase[customer_code * n_products + antecedent_code]
+                        opportunity["data_sugerida"] = pd.Timestamp(bought) + pd.Timedelta(days=delay)
+                        opportunity["atraso_esperado_dias"] = delay
+                        opportunity["probabilidade_sequencial"] = confidence
+                        opportunity["apos_produto"] = product_vocab.values[antecedent_code]
+                    
+                    opportunities.append(opportunity)
         
         # Remover duplicados (mesmo cliente + mesmo produto)
         seen = set()
@@ -0,0 +1,153 @@
+"""
+AITI Insights - Contagem Paralela de Pares
+==========================================
+
+Contagem de pares de itens repartida por vários processos.
+
+A matriz CSR cesto×item é copiada uma vez para memória partilhada
+(multiprocessing.shared_memory); cada worker liga-se aos buffers no
+arranque e recebe apenas os limites do seu bloco de cestos, pelo que
+os cestos nunca são serializados por tarefa. Cada worker conta os pares
+do bloco com X^T·X e devolve as contagens parciais como chaves inteiras
+compactas; o processo principal soma-as numa redução final.
+"""
+
+import os
+import numpy as np
+from scipy import sparse
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Blocos por worker (equilibra cestos de tamanhos muito diferentes)
+SHARDS_PER_JOB = 4
+
+# Buffers partilhados do processo worker (preenchidos pelo initializer)
+_shared: Dict[str, np.ndarray] = {}
+_handles = []
+
+
+def resolve_n_jobs(n_jobs: int) -> int:
+    """Número efectivo de processos (-1 = todos os CPUs)."""
+    if n_jobs == 0 or n_jobs < -1:
+        raise ValueError(f"n_jobs deve ser >= 1 ou -1: {n_jobs}")
+    
+    return (os.cpu_count() or 1) if n_jobs == -1 else n_jobs
+
+
+def count_pairs_parallel(
+    baskets: sparse.csr_matrix,
+    frequent_items: np.ndarray,
+    min_count: float,
+    n_jobs: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Conta pares de itens frequentes em paralelo.
+    
+    Args:
+        baskets: Matriz CSR cesto×item (códigos de produto)
+        frequent_items: Códigos dos itens frequentes (ordenados)
+        min_count: Número mínimo de cestos de um par
+        n_jobs: Número de processos (-1 = todos os CPUs)
+    
+    Returns:
+        (pairs int32 (m, 2), counts int64) com os pares frequentes
+    """
+    n_jobs = resolve_n_jobs(n_jobs)
+    n_frequent = len(frequent_items)
+    
+    # Código compacto de cada item: posição em frequent_items, ou -1
+    columns = np.full(baskets.shape[1], -1, dtype=np.int32)
+    columns[frequent_items] = np.arange(n_frequent, dtype=np.int32)
+    
+    arrays = {
+        "indptr": baskets.indptr.astype(np.int64),
+        "indices": baskets.indices.astype(np.int32),
+        "columns": columns,
+    }
+    
+    blocks, specs = [], {}
+    try:
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            specs[name] = (block.name, array.shape, array.dtype.str)
+        
+        shards = _shards(baskets, n_jobs * SHARDS_PER_JOB)
+        
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_attach, initargs=(specs,)) as pool:
+            partials = list(pool.map(_count_shard, [(start, stop, n_frequent) for start, stop in shards]))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    
+    keys, counts = _reduce(partials)
+    keep = counts >= min_count
+    keys, counts = keys[keep], counts[keep]
+    
+    pairs = np.column_stack([
+        frequent_items[keys // n_frequent],
+        frequent_items[keys % n_frequent],
+    ]).astype(np.int32)
+    
+    logger.info(f"Contagem paralela: {len(shards)} blocos em {n_jobs} processos, {len(pairs)} pares frequentes")
+    return pairs, counts
+
+
+def _shards(baskets: sparse.csr_matrix, n_shards: int) -> list:
+    """
+    Limites [start, stop) de blocos contíguos de cestos com trabalho
+    semelhante (o custo de um cesto cresce com o quadrado do tamanho).
+    """
+    sizes = np.diff(baskets.indptr).astype(np.float64)
+    work = np.cumsum(sizes * sizes)
+    
+    if len(work) == 0:
+        return []
+    
+    targets = work[-1] * np.arange(1, n_shards) / n_shards
+    cuts = np.unique(np.concatenate([[0], np.searchsorted(work, targets) + 1, [len(work)]]))
+    cuts = cuts[cuts <= len(work)]
+    return [(int(a), int(b)) for a, b in zip(cuts[:-1], cuts[1:]) if b > a]
+
+
+def _reduce(partials: list) -> Tuple[np.ndarray, np.ndarray]:
+    """Soma as contagens parciais (chave int64 -> contagem) dos blocos."""
+    keys = np.concatenate([k for k, _ in partials]) if partials else np.empty(0, dtype=np.int64)
+    counts = np.concatenate([c for _, c in partials]) if partials else np.empty(0, dtype=np.int64)
+    
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64)
+
+
+def _attach(specs: dict):
+    """Initializer do worker: liga-se aos buffers de memória partilhada."""
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _handles.append(block)
+        _shared[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def _count_shard(task: tuple) -> Tuple[np.ndarray, np.ndarray]:
+    """Conta os pares do bloco de cestos [start, stop) com X^T·X."""
+    start, stop, n_frequent = task
+    indptr, indices, columns = _shared["indptr"], _shared["indices"], _shared["columns"]
+    
+    items = columns[indices[indptr[start]:indptr[stop]]]
+    rows = np.repeat(np.arange(stop - start), np.diff(indptr[start:stop + 1]))
+    keep = items >= 0
+    
+    x = sparse.csr_matrix(
+        (np.ones(int(keep.sum()), dtype=np.int32), (rows[keep], items[keep])),
+        shape=(stop - start, n_frequent)
+    )
+    co_occurrence = sparse.triu(x.T @ x, k=1).tocoo()
+    
+    keys = co_occurrence.row.astype(np.int64) * n_frequent + co_occurrence.col
+    return keys, co_occurrence.data.astype(np.int64)
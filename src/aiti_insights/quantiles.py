@@ -0,0 +1,132 @@
+"""
+AITI Insights - Sketches de Quantis
+===================================
+
+Sketch KLL (Karnin, Lang, Liberty) para quantis aproximados com memória
+limitada e fusão entre partições.
+
+Os valores entram no nível 0; quando um nível excede a sua capacidade é
+ordenado e metade dos itens (pares ou ímpares, ao acaso) sobe ao nível
+seguinte com o dobro do peso. As capacidades decrescem geometricamente
+dos níveis altos para os baixos, pelo que o sketch guarda O(k) itens e o
+erro de rank é cerca de 1.7/k da população. Dois sketches fundem-se
+concatenando nível a nível e compactando: cada partição (ou processo)
+constrói o seu e o sketch global é a fusão de todos.
+"""
+
+import numpy as np
+from typing import Iterable, Tuple
+
+# Razão entre capacidades de níveis consecutivos
+CAPACITY_RATIO = 2 / 3
+
+
+class KLLSketch:
+    """
+    Sketch de quantis fundível com memória limitada.
+    
+    Exemplo:
+        sketch = KLLSketch(k=200)
+        sketch.update(valores_particao_1)
+        sketch.merge(outro_sketch)
+        edges = sketch.quantiles([0.2, 0.4, 0.6, 0.8])
+    """
+    
+    def __init__(self, k: int = 200, seed: int = None):
+        """
+        Args:
+            k: Capacidade do nível de topo (mais alto = mais preciso)
+            seed: Semente das escolhas aleatórias de compactação
+        """
+        if k < 8:
+            raise ValueError(f"k deve ser >= 8: {k}")
+        
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0, dtype=np.float64)]
+        self._rng = np.random.default_rng(seed)
+    
+    def update(self, values: Iterable) -> "KLLSketch":
+        """Acrescenta valores ao sketch (NaN são ignorados)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+    
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        """Funde outro sketch neste (in place)."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        
+        self.n += other.n
+        self._compress()
+        return self
+    
+    def ranks(self, values: Iterable) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rank aproximado de cada valor.
+        
+        Returns:
+            (peso dos itens < valor, peso dos itens <= valor)
+        """
+        items, cumulative = self._sorted()
+        values = np.asarray(values, dtype=np.float64)
+        
+        below = cumulative[np.searchsorted(items, values, side="left")]
+        at_or_below = cumulative[np.searchsorted(items, values, side="right")]
+        return below, at_or_below
+    
+    def quantiles(self, qs: Iterable) -> np.ndarray:
+        """Valores aproximados nos quantis qs (0-1)."""
+        if self.n == 0:
+            raise ValueError("Sketch vazio")
+        
+        items, cumulative = self._sorted()
+        targets = np.asarray(qs, dtype=np.float64) * self.n
+        
+        positions = np.searchsorted(cumulative[1:], targets, side="left")
+        return items[np.minimum(positions, len(items) - 1)]
+    
+    def __len__(self) -> int:
+        """Número de itens guardados (não o número de valores vistos)."""
+        return sum(len(items) for items in self.levels)
+    
+    def _capacity(self, h: int) -> int:
+        """Capacidade do nível h (o topo tem capacidade k)."""
+        depth = len(self.levels) - 1 - h
+        return max(2, int(np.ceil(self.k * CAPACITY_RATIO ** depth)))
+    
+    def _compress(self):
+        """Compacta de baixo para cima os níveis acima da capacidade."""
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self._capacity(h):
+                if h == len(self.levels) - 1:
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                
+                # Número par de itens compactados; um eventual resto fica no nível
+                items = np.sort(items)
+                kept, items = items[:len(items) % 2], items[len(items) % 2:]
+                offset = int(self._rng.integers(2))
+                
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], items[offset::2]])
+                self.levels[h] = kept
+            h += 1
+    
+    def _sorted(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Itens ordenados e peso acumulado (cumulative[i] = peso antes do item i)."""
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([
+            np.full(len(level), 2 ** h, dtype=np.int64) for h, level in enumerate(self.levels)
+        ])
+        
+        order = np.argsort(items, kind="stable")
+        cumulative = np.concatenate([[0], np.cumsum(weights[order])])
+        return items[order], cumulative
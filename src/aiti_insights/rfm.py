@@ -8,16 +8,32 @@ Segmenta clientes por:
 - Monetary (M): Quanto gastam
 
 Gera segmentos accionáveis: Champions, At Risk, Dormant, etc.
+
+Para execuções diárias, RFMAnalyzer.update() mantém um estado por cliente
+(última compra, número de vendas, valor total) actualizado só com as vendas
+novas; os scores e segmentos são recalculados a partir desse estado.
+
+Com dados particionados por cliente, RFMAnalyzer.sketch() resume cada
+partição em sketches de quantis (KLL) fundíveis; passando o sketch global
+a analyze(), cada partição atribui scores consistentes com os quintis de
+toda a população, sem juntar os clientes em memória.
 """
 
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple, Union
 import logging
+from pathlib import Path
+
+from .encoding import IDVocabulary, encode_ids, json_bytes, read_json, save_npz
+from .quantiles import KLLSketch
 
 logger = logging.getLogger(__name__)
 
+# Versão do formato de RFMState (save/load); incrementar se os arrays mudarem
+STATE_VERSION = 1
+
 
 # Definição de segmentos RFM
 RFM_SEGMENTS = {
@@ -103,6 +119,259 @@ RFM_SEGMENTS = {
     }
 }
 
+# Clientes fora de todos os segmentos
+OTHER_SEGMENT = "Others"
+OTHER_ACTION = "Analisar caso a caso"
+
+
+def compile_segments(r_bins: int = 5, f_bins: int = 5, m_bins: int = 5) -> np.ndarray:
+    """
+    Compila RFM_SEGMENTS numa tabela R×F×M de códigos de segmento.
+    
+    lookup[r, f, m] é a posição em RFM_SEGMENTS do primeiro segmento
+    cujos intervalos contêm (r, f, m), ou len(RFM_SEGMENTS) ("Others").
+    A tabela é preenchida do último segmento para o primeiro, pelo que
+    o primeiro que corresponde prevalece, tal como num ciclo por ordem.
+    """
+    lookup = np.full((r_bins + 1, f_bins + 1, m_bins + 1), len(RFM_SEGMENTS), dtype=np.int8)
+    
+    for code, criteria in reversed(list(enumerate(RFM_SEGMENTS.values()))):
+        r_min, r_max = criteria["r_range"]
+        f_min, f_max = criteria["f_range"]
+        m_min, m_max = criteria["m_range"]
+        lookup[r_min:r_max + 1, f_min:f_max + 1, m_min:m_max + 1] = code
+    
+    return lookup
+
+
+def rfm_aggregate(
+    customer_codes: np.ndarray,
+    dates: np.ndarray,
+    values: np.ndarray,
+    n_customers: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Agrega recency, frequency e monetary numa só passagem, sem ordenar.
+    
+    Args:
+        customer_codes: Código inteiro do cliente por venda (0..n_customers-1)
+        dates: Datas das vendas (datetime64)
+        values: Valor de cada venda
+        n_customers: Número de códigos de cliente
+        
+    Returns:
+        (última data por cliente, número de vendas, valor total); clientes
+        sem vendas ficam com NaT, 0 e 0
+    """
+    frequency = np.bincount(customer_codes, minlength=n_customers)
+    monetary = np.bincount(customer_codes, weights=np.nan_to_num(values), minlength=n_customers)
+    
+    # Máximo por código directamente sobre os inteiros (NaT é o menor int64)
+    last = np.full(n_customers, np.iinfo(np.int64).min, dtype=np.int64)
+    np.maximum.at(last, customer_codes, dates.view(np.int64))
+    
+    return last.view(dates.dtype), frequency, monetary
+
+
+def quantile_scores(values: np.ndarray, bins: int, reverse: bool = False) -> np.ndarray:
+    """
+    Scores 1..bins por quantis de rank (empates desfeitos pela posição).
+    
+    Equivale a pd.qcut(pd.Series(values).rank(method="first"), bins),
+    mas sobre arrays: o rank é uma ordenação estável e o bin de cada rank
+    uma pesquisa binária nos limites dos quantis.
+    
+    Args:
+        values: Métrica por cliente
+        bins: Número de bins
+        reverse: Score mais alto para valores mais baixos (ex: recency)
+    """
+    ranks = np.empty(len(values), dtype=np.float64)
+    ranks[np.argsort(values, kind="stable")] = np.arange(1, len(values) + 1)
+    
+    edges = np.quantile(ranks, np.linspace(0, 1, bins + 1))
+    scores = np.clip(np.searchsorted(edges, ranks, side="left"), 1, bins).astype(np.int8)
+    
+    return (bins + 1 - scores).astype(np.int8) if reverse else scores
+
+
+def sketch_scores(
+    values: np.ndarray,
+    sketch: KLLSketch,
+    tie_break: np.ndarray,
+    bins: int,
+    reverse: bool = False
+) -> np.ndarray:
+    """
+    Scores 1..bins pelo rank aproximado de cada valor num sketch global.
+    
+    A posição de um valor na população é o peso abaixo dele mais uma
+    fracção tie_break (0-1) do peso dos iguais, tal como rank(method="first")
+    reparte os empates pelos bins. Com tie_break derivado do ID do cliente,
+    o score não depende da partição onde o cliente é processado.
+    
+    Args:
+        values: Métrica por cliente
+        sketch: Sketch da métrica em toda a população
+        tie_break: Fracção (0-1) por cliente para desempatar valores iguais
+        bins: Número de bins
+        reverse: Score mais alto para valores mais baixos (ex: recency)
+    """
+    below, at_or_below = sketch.ranks(values)
+    position = (below + tie_break * (at_or_below - below)) / max(sketch.n, 1)
+    scores = np.clip(np.ceil(position * bins), 1, bins).astype(np.int8)
+    
+    return (bins + 1 - scores).astype(np.int8) if reverse else scores
+
+
+def _tie_break(customer_ids: np.ndarray) -> np.ndarray:
+    """Fracção determinística em [0, 1) por cliente (hash do ID)."""
+    return pd.util.hash_array(customer_ids) / np.float64(2 ** 64)
+
+
+class RFMSketch:
+    """
+    Sketches KLL de recency, frequency e monetary por cliente.
+    
+    Cada partição (clientes disjuntos) constrói o seu com
+    RFMAnalyzer.sketch(); merge() junta-os num sketch global.
+    
+    Exemplo:
+        sketches = [analyzer.sketch(parte) for parte in partes]
+        global_sketch = RFMSketch.merge_all(sketches)
+        rfm_parte = analyzer.analyze(parte, sketch=global_sketch)
+    """
+    
+    def __init__(self, k: int = 200, seed: int = None):
+        """
+        Args:
+            k: Precisão dos sketches (erro de rank ~1.7/k)
+            seed: Semente das escolhas aleatórias de compactação
+        """
+        self.seed = seed
+        self.recency = KLLSketch(k, seed)
+        self.frequency = KLLSketch(k, seed)
+        self.monetary = KLLSketch(k, seed)
+    
+    def merge(self, other: "RFMSketch") -> "RFMSketch":
+        """Funde outro sketch neste (in place)."""
+        self.recency.merge(other.recency)
+        self.frequency.merge(other.frequency)
+        self.monetary.merge(other.monetary)
+        return self
+    
+    @classmethod
+    def merge_all(cls, sketches: List["RFMSketch"]) -> "RFMSketch":
+        """Sketch global a partir dos sketches das partições (com a semente da primeira)."""
+        merged = cls(sketches[0].recency.k, sketches[0].seed)
+        for sketch in sketches:
+            merged.merge(sketch)
+        return merged
+    
+    @property
+    def n_customers(self) -> int:
+        """Número de clientes resumidos."""
+        return self.frequency.n
+
+
+class RFMState:
+    """
+    Estado persistente por cliente: última compra, número de vendas e valor total.
+    
+    Cada update() custa o tamanho do delta: as vendas novas são agregadas
+    por cliente e fundidas (máximo, somas) só nas posições desses clientes.
+    
+    Exemplo:
+        state = RFMState()
+        state.update(vendas_ontem)
+        state.save("rfm_state.npz")
+    """
+    
+    def __init__(self, vocab: IDVocabulary = None):
+        """
+        Args:
+            vocab: Vocabulário de clientes partilhado (opcional)
+        """
+        self.vocab = vocab if vocab is not None else IDVocabulary()
+        self.last_date = np.full(len(self.vocab), np.datetime64("NaT"), dtype="datetime64[ns]")
+        self.frequency = np.zeros(len(self.vocab), dtype=np.int64)
+        self.monetary = np.zeros(len(self.vocab), dtype=np.float64)
+    
+    def update(
+        self,
+        sales_df: pd.DataFrame,
+        customer_col: str = "cliente_id",
+        date_col: str = "data",
+        value_col: str = "valor"
+    ) -> int:
+        """
+        Acrescenta vendas novas ao estado.
+        
+        Returns:
+            Número de clientes com vendas novas
+        """
+        if len(sales_df) == 0:
+            return 0
+        
+        codes = self.vocab.encode(sales_df[customer_col], extend=True)
+        self._grow(len(self.vocab))
+        
+        dates = sales_df[date_col]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates)
+        
+        # Agregar o delta sobre os seus próprios clientes e fundir no estado
+        touched, local = np.unique(codes, return_inverse=True)
+        last, frequency, monetary = rfm_aggregate(
+            local, dates.to_numpy().astype("datetime64[ns]"),
+            sales_df[value_col].to_numpy(dtype=np.float64), len(touched)
+        )
+        
+        merged = np.maximum(self.last_date[touched].view(np.int64), last.view(np.int64))
+        self.last_date[touched] = merged.view(self.last_date.dtype)
+        self.frequency[touched] += frequency
+        self.monetary[touched] += monetary
+        
+        return len(touched)
+    
+    @property
+    def n_customers(self) -> int:
+        """Número de clientes com pelo menos uma venda."""
+        return int(np.count_nonzero(self.frequency))
+    
+    def save(self, path: Union[str, Path]):
+        """Guarda o estado em disco (.npz sem pickle, vocabulário em JSON)."""
+        save_npz(path, {
+            "header": json_bytes({"versao": STATE_VERSION}),
+            "vocab": json_bytes(self.vocab.values.tolist()),
+            "last_date": self.last_date.view(np.int64),
+            "frequency": self.frequency,
+            "monetary": self.monetary,
+        })
+    
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "RFMState":
+        """Carrega um estado guardado com save()."""
+        with np.load(path, allow_pickle=False) as data:
+            header = read_json(data["header"])
+            if header.get("versao") != STATE_VERSION:
+                raise ValueError(f"Versão de estado incompatível: {header.get('versao')}")
+            
+            state = cls(IDVocabulary(read_json(data["vocab"])))
+            state.last_date = data["last_date"].view("datetime64[ns]")
+            state.frequency = data["frequency"]
+            state.monetary = data["monetary"]
+        
+        return state
+    
+    def _grow(self, n: int):
+        """Alarga os arrays para n clientes (clientes novos no vocabulário)."""
+        extra = n - len(self.frequency)
+        if extra > 0:
+            self.last_date = np.concatenate([self.last_date, np.full(extra, np.datetime64("NaT"), dtype="datetime64[ns]")])
+            self.frequency = np.concatenate([self.frequency, np.zeros(extra, dtype=np.int64)])
+            self.monetary = np.concatenate([self.monetary, np.zeros(extra, dtype=np.float64)])
+
 
 class RFMAnalyzer:
     """
@@ -133,15 +402,27 @@ class RFMAnalyzer:
         self.m_bins = m_bins
         self.reference_date = reference_date or datetime.now()
         
+        # Segmentos pré-compilados: código por (R, F, M) e acção por código
+        self._segment_lookup = compile_segments(r_bins, f_bins, m_bins)
+        self._segment_names = list(RFM_SEGMENTS) + [OTHER_SEGMENT]
+        self._action_codes, self._actions = pd.factorize(np.array(
+            [criteria.get("action", OTHER_ACTION) for criteria in RFM_SEGMENTS.values()] + [OTHER_ACTION],
+            dtype=object
+        ))
+        
         self.rfm_df = None
         self.segment_summary = None
+        self.vocab = None
+        self.state = None
     
     def analyze(
         self,
         sales_df: pd.DataFrame,
         customer_col: str = "cliente_id",
         date_col: str = "data",
-        value_col: str = "valor"
+        value_col: str = "valor",
+        vocab: Optional[IDVocabulary] = None,
+        sketch: Optional[RFMSketch] = None
     ) -> pd.DataFrame:
         """
         Calcula métricas RFM e segmenta clientes.
@@ -151,62 +432,156 @@ class RFMAnalyzer:
             customer_col: Coluna com ID do cliente
             date_col: Coluna com data
             value_col: Coluna com valor
+            vocab: Vocabulário de clientes partilhado (opcional)
+            sketch: Sketch global (ver sketch()); os scores usam os quantis
+                do sketch em vez dos ranks dos clientes de sales_df
             
         Returns:
             DataFrame com métricas RFM por cliente
         """
         logger.info("Iniciando análise RFM...")
         
-        df = sales_df.copy()
-        df[date_col] = pd.to_datetime(df[date_col])
+        last, frequency, monetary = self._aggregate(sales_df, customer_col, date_col, value_col, vocab)
+        return self._score_customers(last, frequency, monetary, sketch)
+    
+    def sketch(
+        self,
+        sales_df: pd.DataFrame,
+        customer_col: str = "cliente_id",
+        date_col: str = "data",
+        value_col: str = "valor",
+        k: int = 200,
+        seed: int = None
+    ) -> RFMSketch:
+        """
+        Resume as métricas RFM dos clientes de sales_df em sketches de quantis.
         
-        # Calcular métricas por cliente
-        rfm = df.groupby(customer_col).agg({
-            date_col: "max",  # Data da última compra
-            customer_col: "count",  # Frequência (número de transacções)
-            value_col: "sum"  # Valor total
-        }).reset_index(drop=True)
+        Em dados particionados por cliente, cada partição chama sketch();
+        a fusão (RFMSketch.merge_all) passada a analyze(..., sketch=...)
+        dá a cada partição scores consistentes com os quintis globais.
         
-        # Renomear colunas
-        rfm.columns = ["recency_date", "frequency", "monetary"]
+        Args:
+            sales_df: DataFrame com vendas (todas as vendas dos seus clientes)
+            customer_col: Coluna com ID do cliente
+            date_col: Coluna com data
+            value_col: Coluna com valor
+            k: Precisão dos sketches (erro de rank ~1.7/k)
+            seed: Semente das escolhas aleatórias de compactação
+        """
+        last, frequency, monetary = self._aggregate(sales_df, customer_col, date_col, value_col)
+        present = np.flatnonzero(frequency)
+        
+        sketch = RFMSketch(k, seed)
+        sketch.recency.update(self._recency_days(last[present]))
+        sketch.frequency.update(frequency[present])
+        sketch.monetary.update(monetary[present])
+        return sketch
+    
+    def _aggregate(
+        self,
+        sales_df: pd.DataFrame,
+        customer_col: str,
+        date_col: str,
+        value_col: str,
+        vocab: Optional[IDVocabulary] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Última compra, número de vendas e valor total por código de cliente."""
+        # Sem cópia do DataFrame: só se converte a data se ainda não for datetime
+        dates = sales_df[date_col]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates)
+        
+        # Calcular métricas por cliente numa passagem sobre os códigos inteiros
+        codes, self.vocab = encode_ids(sales_df[customer_col], vocab)
+        last, frequency, monetary = rfm_aggregate(
+            codes, dates.to_numpy(), sales_df[value_col].to_numpy(dtype=np.float64), len(self.vocab)
+        )
+        return last, frequency, monetary
+    
+    def update(
+        self,
+        sales_df: pd.DataFrame,
+        customer_col: str = "cliente_id",
+        date_col: str = "data",
+        value_col: str = "valor",
+        sketch: Optional[RFMSketch] = None
+    ) -> pd.DataFrame:
+        """
+        Actualiza o estado por cliente com novas vendas e re-segmenta.
+        
+        Na primeira chamada cria o estado incremental (self.state). Só as
+        vendas recebidas são agregadas; os scores e segmentos são
+        recalculados a partir do estado, sem reler o histórico.
+        
+        Args:
+            sales_df: Vendas novas (delta)
+            customer_col: Coluna com ID do cliente
+            date_col: Coluna com data
+            value_col: Coluna com valor
+            sketch: Sketch global para os scores (opcional, ver analyze())
+            
+        Returns:
+            DataFrame com métricas RFM por cliente
+        """
+        if self.state is None:
+            self.state = RFMState(vocab=self.vocab)
+        
+        self.state.update(sales_df, customer_col, date_col, value_col)
+        self.vocab = self.state.vocab
         
-        # Reobter cliente_id
-        rfm["cliente_id"] = df.groupby(customer_col)[customer_col].first().values
+        return self._score_customers(self.state.last_date, self.state.frequency, self.state.monetary, sketch)
+    
+    def _recency_days(self, last: np.ndarray) -> np.ndarray:
+        """Dias desde a última compra até reference_date."""
+        return (self.reference_date - pd.Series(last)).dt.days.to_numpy()
+    
+    def _score_customers(
+        self,
+        last: np.ndarray,
+        frequency: np.ndarray,
+        monetary: np.ndarray,
+        sketch: Optional[RFMSketch] = None
+    ) -> pd.DataFrame:
+        """Calcula scores e segmentos a partir das métricas agregadas por código de cliente."""
+        # Só clientes com vendas, ordenados por ID: os empates nos ranks
+        # desfazem-se pela ordem dos IDs, não pela ordem das linhas de entrada
+        present = np.flatnonzero(frequency)
+        customer_ids = self.vocab.decode(present)
+        order = pd.Index(customer_ids).argsort()
+        present, customer_ids = present[order], customer_ids[order]
+        
+        rfm = pd.DataFrame({
+            "recency_date": last[present],  # Data da última compra
+            "frequency": frequency[present],  # Frequência (número de transacções)
+            "monetary": monetary[present],  # Valor total
+            "cliente_id": customer_ids,
+        })
         
         # Calcular recency em dias
-        rfm["recency"] = (self.reference_date - pd.to_datetime(rfm["recency_date"])).dt.days
+        rfm["recency"] = self._recency_days(last[present])
         
         # Calcular scores RFM (1-5)
         # Nota: Para recency, menor é melhor, então invertemos
-        rfm["R"] = pd.qcut(
-            rfm["recency"].rank(method="first"),
-            q=self.r_bins,
-            labels=range(self.r_bins, 0, -1)
-        ).astype(int)
-        
-        rfm["F"] = pd.qcut(
-            rfm["frequency"].rank(method="first"),
-            q=self.f_bins,
-            labels=range(1, self.f_bins + 1),
-            duplicates="drop"
-        ).astype(int)
-        
-        rfm["M"] = pd.qcut(
-            rfm["monetary"].rank(method="first"),
-            q=self.m_bins,
-            labels=range(1, self.m_bins + 1),
-            duplicates="drop"
-        ).astype(int)
-        
-        # Criar score RFM combinado
-        rfm["RFM_Score"] = rfm["R"].astype(str) + rfm["F"].astype(str) + rfm["M"].astype(str)
-        
-        # Atribuir segmentos
-        rfm["segment"] = rfm.apply(self._assign_segment, axis=1)
-        
-        # Adicionar informação do segmento
-        rfm["segment_action"] = rfm["segment"].map(
-            lambda s: RFM_SEGMENTS.get(s, {}).get("action", "Analisar caso a caso")
+        if sketch is None:
+            rfm["R"] = quantile_scores(rfm["recency"].to_numpy(), self.r_bins, reverse=True)
+            rfm["F"] = quantile_scores(frequency[present], self.f_bins)
+            rfm["M"] = quantile_scores(monetary[present], self.m_bins)
+        else:
+            # Quantis globais do sketch; empates desfeitos pelo hash do cliente
+            tie_break = _tie_break(rfm["cliente_id"].to_numpy())
+            rfm["R"] = sketch_scores(rfm["recency"].to_numpy(), sketch.recency, tie_break, self.r_bins, reverse=True)
+            rfm["F"] = sketch_scores(frequency[present], sketch.frequency, tie_break, self.f_bins)
+            rfm["M"] = sketch_scores(monetary[present], sketch.monetary, tie_break, self.m_bins)
+        
+        # Score RFM combinado como inteiro (ex: 5, 4, 3 -> 543)
+        scores = np.column_stack([rfm["R"], rfm["F"], rfm["M"]]).astype(np.int16)
+        rfm["RFM_Score"] = scores @ np.array([100, 10, 1], dtype=np.int16)
+        
+        # Atribuir segmentos e acções: uma indexação na tabela R×F×M
+        segment_codes = self._segment_lookup[rfm["R"].to_numpy(), rfm["F"].to_numpy(), rfm["M"].to_numpy()]
+        rfm["segment"] = pd.Categorical.from_codes(segment_codes, categories=self._segment_names)
+        rfm["segment_action"] = pd.Categorical.from_codes(
+            self._action_codes[segment_codes], categories=self._actions
         )
         
         self.rfm_df = rfm
@@ -218,28 +593,12 @@ class RFMAnalyzer:
         
         return rfm
     
-    def _assign_segment(self, row) -> str:
-        """Atribui segmento baseado nos scores RFM."""
-        r, f, m = row["R"], row["F"], row["M"]
-        
-        for segment_name, criteria in RFM_SEGMENTS.items():
-            r_min, r_max = criteria["r_range"]
-            f_min, f_max = criteria["f_range"]
-            m_min, m_max = criteria["m_range"]
-            
-            if (r_min <= r <= r_max and
-                f_min <= f <= f_max and
-                m_min <= m <= m_max):
-                return segment_name
-        
-        return "Others"
-    
     def _calculate_segment_summary(self):
         """Calcula resumo estatístico por segmento."""
         if self.rfm_df is None:
             return
         
-        summary = self.rfm_df.groupby("segment").agg({
+        summary = self.rfm_df.groupby("segment", observed=True).agg({
             "cliente_id": "count",
             "recency": "mean",
             "frequency": "mean",
@@ -0,0 +1,213 @@
+"""
+AITI Insights - Padrões Sequenciais
+===================================
+
+Identifica compras em sequência entre produtos:
+"Clientes que compram A compram B nos N dias seguintes com probabilidade X"
+
+Ao contrário das regras Apriori, a ordem conta: A tem de ser comprado
+antes de B. Cada regra traz também o atraso esperado entre A e B, para
+agendar o contacto de follow-up.
+
+Estilo SPADE com arrays ordenados por cliente: os eventos (cliente,
+dia, produto) ficam ordenados por cliente e dia, e os pares A -> B
+dentro da janela obtêm-se, para cada evento, do intervalo contíguo de
+eventos seguintes do mesmo cliente até dia + N (searchsorted), pelo que
+o custo é proporcional ao número de pares e não ao maior histórico.
+"""
+
+import pandas as pd
+import numpy as np
+from typing import Optional, List, Dict
+import logging
+
+from .encoding import IDVocabulary, encode_ids
+
+logger = logging.getLogger(__name__)
+
+
+class SequentialAnalyzer:
+    """
+    Analisador de padrões sequenciais A -> B dentro de N dias.
+    
+    Métricas calculadas (por cliente):
+    - Suporte: fracção de clientes que compram A e depois B na janela
+    - Confiança: P(B nos N dias seguintes | comprou A)
+    - Lift: confiança / fracção de clientes que compram B
+    - Atraso: menor número de dias entre uma compra de A e uma de B, por cliente
+    
+    Exemplo:
+        analyzer = SequentialAnalyzer(max_days=30)
+        rules = analyzer.analyze(sales_df)
+    """
+    
+    def __init__(
+        self,
+        min_support: float = 0.01,
+        min_confidence: float = 0.1,
+        min_lift: float = 1.0,
+        max_days: int = 30,
+        max_rules: int = 100
+    ):
+        """
+        Args:
+            min_support: Suporte mínimo (fracção de clientes)
+            min_confidence: Confiança mínima (0-1)
+            min_lift: Lift mínimo
+            max_days: Janela máxima entre A e B (dias)
+            max_rules: Número máximo de regras a retornar
+        """
+        if max_days < 1:
+            raise ValueError(f"max_days deve ser >= 1: {max_days}")
+        
+        self.min_support = min_support
+        self.min_confidence = min_confidence
+        self.min_lift = min_lift
+        self.max_days = max_days
+        self.max_rules = max_rules
+        
+        self.rules = []
+        self.vocab = None
+        self._delays = {}
+    
+    def analyze(
+        self,
+        sales_df: pd.DataFrame,
+        product_col: str = "produto_id",
+        customer_col: str = "cliente_id",
+        date_col: str = "data",
+        vocab: Optional[IDVocabulary] = None
+    ) -> List[Dict]:
+        """
+        Executa a análise sequencial nos dados de vendas.
+        
+        Args:
+            sales_df: DataFrame com vendas
+            product_col: Coluna com ID do produto
+            customer_col: Coluna com ID do cliente
+            date_col: Coluna de data
+            vocab: Vocabulário de produtos partilhado (opcional)
+        
+        Returns:
+            Lista de regras sequenciais ordenadas por lift
+        """
+        logger.info("Iniciando análise sequencial...")
+        
+        self.rules = []
+        self._delays = {}
+        if len(sales_df) == 0:
+            return self.rules
+        
+        customers, _ = encode_ids(sales_df[customer_col])
+        products, self.vocab = encode_ids(sales_df[product_col], vocab)
+        days = pd.to_datetime(sales_df[date_col]).to_numpy().astype("datetime64[D]").astype(np.int64)
+        n_customers = int(customers.max()) + 1
+        n_products = len(self.vocab)
+        
+        # Clientes por produto; só produtos frequentes entram nas sequências
+        customer_product = np.unique(customers.astype(np.int64) * n_products + products)
+        buyers = np.bincount(customer_product % n_products, minlength=n_products)
+        frequent = buyers >= self.min_support * n_customers
+        
+        keep = frequent[products]
+        customers, products, days = customers[keep], products[keep], days[keep]
+        
+        # Eventos únicos (cliente, dia, produto), ordenados por cliente e dia
+        order = np.lexsort((products, days, customers))
+        events = np.column_stack([customers[order], days[order], products[order]])
+        events = events[np.r_[True, np.any(events[1:] != events[:-1], axis=1)]] if len(events) else events
+        event_customers, event_days, event_products = events[:, 0], events[:, 1], events[:, 2]
+        
+        if len(events) == 0:
+            logger.info("Encontradas 0 regras sequenciais")
+            return self.rules
+        
+        # Pares A -> B na janela (0, max_days]: com a chave (cliente, dia)
+        # ordenada, os sucessores de cada evento ocupam um intervalo contíguo
+        # [primeiro dia seguinte, dia + max_days], localizado por searchsorted
+        offset_days = event_days - event_days.min()
+        stride = int(offset_days.max()) + self.max_days + 1
+        event_keys = event_customers * stride + offset_days
+        window_starts = np.searchsorted(event_keys, event_keys, side="right")
+        window_ends = np.searchsorted(event_keys, event_keys + self.max_days, side="right")
+        
+        lengths = window_ends - window_starts
+        sources = np.repeat(np.arange(len(events)), lengths)
+        targets = (
+            np.arange(len(sources)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            + window_starts[sources]
+        )
+        
+        distinct = event_products[sources] != event_products[targets]
+        sources, targets = sources[distinct], targets[distinct]
+        
+        if len(sources) == 0:
+            logger.info("Encontradas 0 regras sequenciais")
+            return self.rules
+        
+        # Um registo por (cliente, A, B): o menor atraso
+        keys = (event_customers[sources] * n_products + event_products[sources]) * n_products + event_products[targets]
+        gaps = event_days[targets] - event_days[sources]
+        order = np.lexsort((gaps, keys))
+        keys, gaps = keys[order], gaps[order]
+        first = np.r_[True, keys[1:] != keys[:-1]]
+        keys, gaps = keys[first], gaps[first]
+        
+        # Agregar por (A, B): clientes, atraso médio e mediano
+        pairs = keys % (n_products * n_products)
+        order = np.argsort(pairs, kind="stable")
+        pairs, gaps = pairs[order], gaps[order].astype(np.float64)
+        starts = np.flatnonzero(np.r_[True, pairs[1:] != pairs[:-1]])
+        counts = np.diff(np.r_[starts, len(pairs)])
+        
+        antecedents = pairs[starts] // n_products
+        consequents = pairs[starts] % n_products
+        mean_gaps = np.add.reduceat(gaps, starts) / counts
+        
+        support = counts / n_customers
+        confidence = counts / buyers[antecedents]
+        lift = confidence / (buyers[consequents] / n_customers)
+        
+        selected = np.flatnonzero(
+            (support >= self.min_support)
+            & (confidence >= self.min_confidence)
+            & (lift >= self.min_lift)
+        )
+        selected = selected[np.lexsort((selected, -lift[selected]))][:self.max_rules]
+        
+        for i in selected.tolist():
+            group = np.sort(gaps[starts[i]:starts[i] + counts[i]])
+            self.rules.append({
+                "antecedent": self.vocab.decode([antecedents[i]]).tolist(),
+                "consequent": self.vocab.decode([consequents[i]]).tolist(),
+                "support": round(float(support[i]), 4),
+                "confidence": round(float(confidence[i]), 4),
+                "lift": round(float(lift[i]), 2),
+                "count": int(counts[i]),
+                "atraso_medio_dias": round(float(mean_gaps[i]), 1),
+                "atraso_mediano_dias": float(np.median(group)),
+            })
+        
+        self._delays = {
+            (rule["antecedent"][0], rule["consequent"][0]): rule["atraso_mediano_dias"]
+            for rule in self.rules
+        }
+        
+        logger.info(f"Encontradas {len(self.rules)} regras sequenciais (janela {self.max_days} dias)")
+        return self.rules
+    
+    def expected_delay(self, antecedent, consequent) -> Optional[float]:
+        """Atraso mediano (dias) de antecedent -> consequent, ou None se não houver regra."""
+        return self._delays.get((antecedent, consequent))
+    
+    def get_summary(self) -> Dict:
+        """Retorna resumo da análise."""
+        if not self.rules:
+            return {"error": "Nenhuma análise executada"}
+        
+        return {
+            "total_regras": len(self.rules),
+            "janela_dias": self.max_days,
+            "top_lift": self.rules[0],
+            "atraso_medio": sum(r["atraso_medio_dias"] for r in self.rules) / len(self.rules),
+        }
@@ -0,0 +1,218 @@
+"""
+AITI Insights - Contagem Aproximada de Pares
+============================================
+
+Mineração de pares frequentes com memória limitada, para catálogos em
+que a contagem exacta de todos os pares não cabe em memória.
+
+Duas passagens em blocos de cestos:
+
+1. Count-Min sketch (largura w, profundidade d) com as contagens de
+   todos os pares. A estimativa de um par nunca é inferior à contagem
+   real e excede-a no máximo em e/w·N com probabilidade 1 - e^-d
+   (N = total de ocorrências de pares).
+2. Pares com estimativa >= min_count são candidatos. Os primeiros têm
+   contagem exacta acumulada nesta passagem; quando a tabela exacta
+   enche, os seguintes ficam num heap limitado com a estimativa do
+   sketch (heavy hitters) e são marcados como aproximados.
+
+A memória é repartida entre o sketch e os candidatos: metade de
+memory_mb para cada um, ou seja max_candidates ≈ (memory_mb / 2) /
+CANDIDATE_BYTES pares seguidos (exactos + heap).
+
+Como a estimativa é um majorante, nenhum par frequente é perdido
+enquanto o heap não transborda. Se transbordar, os candidatos com menor
+estimativa são descartados (e pares frequentes podem faltar): o número
+de descartes, contado por bloco de cestos, fica em candidatos_descartados
+nas garantias e é registado um aviso.
+"""
+
+import heapq
+import numpy as np
+from scipy import sparse
+from typing import Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Cestos processados de cada vez (limita a matriz de pares temporária)
+CHUNK_BASKETS = 20_000
+
+# Profundidade do sketch: probabilidade de falha e^-4 ≈ 1.8%
+SKETCH_DEPTH = 4
+
+# Memória Python por candidato seguido (entrada de dict ou heap + set, com os ints)
+CANDIDATE_BYTES = 192
+
+# Fracção dos candidatos reservada ao heap de heavy hitters (o resto é exacto)
+HEAP_SHARE = 0.25
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch sobre chaves inteiras (hash multiply-shift).
+    
+    Exemplo:
+        sketch = CountMinSketch(width=2**20, depth=4)
+        sketch.add(keys, counts)
+        estimates = sketch.estimate(keys)
+    """
+    
+    def __init__(self, width: int, depth: int = SKETCH_DEPTH, seed: int = 0):
+        """
+        Args:
+            width: Colunas por linha (arredondado para potência de 2)
+            depth: Número de funções de hash
+            seed: Semente dos multiplicadores
+        """
+        self.bits = max(int(np.ceil(np.log2(max(width, 2)))), 1)
+        self.width = 1 << self.bits
+        self.depth = depth
+        self.total = 0
+        
+        rng = np.random.default_rng(seed)
+        self._multipliers = rng.integers(1, 2**63, depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.table = np.zeros((depth, self.width), dtype=np.int64)
+    
+    @property
+    def epsilon(self) -> float:
+        """Erro relativo máximo (fracção de total) por estimativa."""
+        return np.e / self.width
+    
+    @property
+    def delta(self) -> float:
+        """Probabilidade de uma estimativa exceder o erro máximo."""
+        return float(np.exp(-self.depth))
+    
+    def add(self, keys: np.ndarray, counts: np.ndarray):
+        """Soma counts às chaves keys."""
+        for row in range(self.depth):
+            np.add.at(self.table[row], self._hash(keys, row), counts)
+        self.total += int(counts.sum())
+    
+    def estimate(self, keys: np.ndarray) -> np.ndarray:
+        """Majorante da contagem de cada chave."""
+        estimates = self.table[0][self._hash(keys, 0)]
+        for row in range(1, self.depth):
+            estimates = np.minimum(estimates, self.table[row][self._hash(keys, row)])
+        return estimates
+    
+    def _hash(self, keys: np.ndarray, row: int) -> np.ndarray:
+        hashed = keys.astype(np.uint64) * self._multipliers[row]
+        return (hashed >> np.uint64(64 - self.bits)).astype(np.intp)
+
+
+def approximate_pairs(
+    baskets: sparse.csr_matrix,
+    frequent_items: np.ndarray,
+    min_count: float,
+    memory_mb: float = 64,
+    max_candidates: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+    """
+    Pares frequentes com memória fixa (sketch + candidatos limitados).
+    
+    Args:
+        baskets: Matriz CSR cesto×item (códigos de produto)
+        frequent_items: Códigos dos itens frequentes (ordenados)
+        min_count: Número mínimo de cestos de um par
+        memory_mb: Memória total (metade para o sketch, metade para os candidatos)
+        max_candidates: Pares seguidos, exactos + heap (None = derivado de memory_mb)
+    
+    Returns:
+        (pairs int32 (m, 2), counts int64, exact bool, garantias)
+    """
+    if max_candidates is None:
+        max_candidates = candidate_budget(memory_mb)
+    
+    if max_candidates < 1:
+        raise ValueError(f"max_candidates deve ser >= 1: {max_candidates}")
+    
+    n_frequent = len(frequent_items)
+    width = int(memory_mb / 2 * 2**20 / (SKETCH_DEPTH * 8))
+    sketch = CountMinSketch(width, SKETCH_DEPTH)
+    
+    # Passagem 1: todas as contagens de pares no sketch
+    for keys, counts in _chunk_pairs(baskets, frequent_items):
+        sketch.add(keys, counts)
+    
+    # Passagem 2: contagem exacta dos candidatos, heavy hitters no heap
+    heap_size = max(1, int(max_candidates * HEAP_SHARE)) if max_candidates > 1 else 0
+    exact_size = max_candidates - heap_size
+    exact_counts = {}
+    overflow, overflow_keys = [], set()
+    dropped = 0
+    
+    for keys, counts in _chunk_pairs(baskets, frequent_items):
+        estimates = sketch.estimate(keys)
+        candidate = estimates >= min_count
+        
+        for key, count, estimate in zip(
+            keys[candidate].tolist(), counts[candidate].tolist(), estimates[candidate].tolist()
+        ):
+            if key in exact_counts:
+                exact_counts[key] += count
+            elif len(exact_counts) < exact_size and key not in overflow_keys:
+                exact_counts[key] = count
+            elif key not in overflow_keys:
+                # Heap limitado: mantém os heap_size pares com maior estimativa
+                if len(overflow) < heap_size:
+                    heapq.heappush(overflow, (estimate, key))
+                    overflow_keys.add(key)
+                    continue
+                
+                dropped += 1
+                if heap_size > 0 and (estimate, key) > overflow[0]:
+                    _, removed = heapq.heapreplace(overflow, (estimate, key))
+                    overflow_keys.discard(removed)
+                    overflow_keys.add(key)
+    
+    exact = {k: c for k, c in exact_counts.items() if c >= min_count}
+    keys = np.fromiter(list(exact) + [k for _, k in overflow], dtype=np.int64, count=len(exact) + len(overflow))
+    counts = np.fromiter(list(exact.values()) + [e for e, _ in overflow], dtype=np.int64, count=len(keys))
+    is_exact = np.arange(len(keys)) < len(exact)
+    
+    order = np.argsort(keys)
+    keys, counts, is_exact = keys[order], counts[order], is_exact[order]
+    pairs = np.column_stack([
+        frequent_items[keys // max(n_frequent, 1)],
+        frequent_items[keys % max(n_frequent, 1)],
+    ]).astype(np.int32).reshape(-1, 2)
+    
+    guarantees = {
+        "epsilon": sketch.epsilon,
+        "delta": sketch.delta,
+        "erro_maximo": sketch.epsilon * sketch.total,
+        "pares_aproximados": int((~is_exact).sum()),
+        "max_candidatos": max_candidates,
+        "candidatos_descartados": dropped,
+    }
+    
+    logger.info(
+        f"Contagem aproximada: {len(pairs)} pares ({guarantees['pares_aproximados']} aproximados), "
+        f"erro <= {guarantees['erro_maximo']:.1f} cestos com prob. {1 - sketch.delta:.3f}"
+    )
+    if dropped:
+        logger.warning(
+            f"Contagem aproximada: {dropped} candidatos descartados (heap cheio com {max_candidates} "
+            f"pares seguidos); pares frequentes podem faltar, aumente sketch_memory_mb"
+        )
+    return pairs, counts, is_exact, guarantees
+
+
+def candidate_budget(memory_mb: float) -> int:
+    """Pares candidatos que cabem em metade de memory_mb (a outra metade é do sketch)."""
+    return max(1, int(memory_mb / 2 * 2**20 / CANDIDATE_BYTES))
+
+
+def _chunk_pairs(baskets: sparse.csr_matrix, frequent_items: np.ndarray):
+    """Gera (chaves a·n + b, contagens) dos pares de cada bloco de cestos."""
+    n_frequent = len(frequent_items)
+    x = baskets[:, frequent_items]
+    
+    for start in range(0, x.shape[0], CHUNK_BASKETS):
+        chunk = x[start:start + CHUNK_BASKETS]
+        co_occurrence = sparse.triu(chunk.T @ chunk, k=1).tocoo()
+        keys = co_occurrence.row.astype(np.int64) * n_frequent + co_occurrence.col
+        yield keys, co_occurrence.data.astype(np.int64)
@@ -3,6 +3,7 @@ Tests for Apriori module.
 """
 
 import pytest
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import sys
@@ -81,6 +82,638 @@ class TestAprioriAnalyzer:
             assert "produto" in rec
             assert "probabilidade" in rec
     
+    def test_recommendations_use_rule_index(self, random_sales):
+        """Test that indexed lookups match a linear scan over all rules."""
+        analyzer = AprioriAnalyzer(min_support=0.01, min_confidence=0.1, max_rules=10**6, max_len=3)
+        analyzer.analyze(random_sales)
+        
+        def linear_scan(products):
+            best = {}
+            for rule in analyzer.rules:
+                consequent = rule["consequent"][0]
+                if set(rule["antecedent"]) <= set(products) and consequent not in products:
+                    if consequent not in best or rule["confidence"] > best[consequent]["probabilidade"]:
+                        best[consequent] = {"produto": consequent, "probabilidade": rule["confidence"],
+                                            "lift": rule["lift"], "baseado_em": rule["antecedent"]}
+            return sorted(best.values(), key=lambda x: x["probabilidade"], reverse=True)[:5]
+        
+        for products in (["P0"], ["P1", "P3"], ["P5", "P6", "P7"], ["unknown"]):
+            assert analyzer.get_recommendations(products) == linear_scan(products)
+        
+        # Replacing the rules rebuilds the index
+        analyzer.rules = []
+        assert analyzer.get_recommendations(["P0"]) == []
+    
+    def test_recommend_batch_matches_per_customer(self, random_sales):
+        """Test that batch recommendations equal get_recommendations per customer."""
+        analyzer = AprioriAnalyzer(min_support=0.01, min_confidence=0.1, max_rules=10**6, max_len=3)
+        analyzer.analyze(random_sales)
+        
+        # Only each customer's first purchases, so that rules can fire
+        recent = random_sales.groupby("cliente_id").head(2)
+        matrix, customers = analyzer.customer_matrix(recent)
+        items, scores = analyzer.recommend_batch(matrix, k=3)
+        
+        assert items.shape == scores.shape == (len(customers), 3)
+        assert (items >= 0).any()
+        
+        owned = recent.groupby("cliente_id")["produto_id"].apply(set)
+        for row, customer in enumerate(customers):
+            expected = analyzer.get_recommendations(list(owned[customer]), max_recommendations=3)
+            got = [p for p in items[row] if p >= 0]
+            
+            assert not set(analyzer.vocab.decode(got)) & owned[customer]
+            assert len(got) == len(expected)
+            assert np.allclose(scores[row][:len(got)], [r["probabilidade"] for r in expected])
+    
+    def test_save_and_load_model(self, random_sales, tmp_path):
+        """Test that a saved model reloads with the same rules and itemsets."""
+        analyzer = AprioriAnalyzer(min_support=0.01, min_confidence=0.1, max_rules=50, max_len=3)
+        rules = analyzer.analyze(random_sales)
+        analyzer.save(tmp_path / "model.npz")
+        
+        header = AprioriAnalyzer.read_header(tmp_path / "model.npz")
+        assert header["data_hash"] == analyzer.data_hash
+        assert header["parametros"]["min_support"] == 0.01
+        
+        loaded = AprioriAnalyzer.load(tmp_path / "model.npz")
+        assert loaded.rules == rules
+        assert loaded.frequent_itemsets == analyzer.frequent_itemsets
+        assert loaded.get_recommendations(["P0"]) == analyzer.get_recommendations(["P0"])
+    
+    def test_analyze_or_load_reuses_model(self, random_sales, tmp_path, monkeypatch):
+        """Test that the model is reused only for unchanged data and thresholds."""
+        path = tmp_path / "model.npz"
+        expected = AprioriAnalyzer(min_support=0.01).analyze_or_load(random_sales, path)
+        assert path.exists()
+        
+        analyzer = AprioriAnalyzer(min_support=0.01)
+        monkeypatch.setattr(analyzer, "analyze", lambda *a, **k: pytest.fail("should load"))
+        assert analyzer.analyze_or_load(random_sales, path) == expected
+        
+        # Changed data or thresholds: mine again
+        changed = AprioriAnalyzer(min_support=0.02)
+        changed.analyze_or_load(random_sales, path)
+        assert AprioriAnalyzer.read_header(path)["parametros"]["min_support"] == 0.02
+        
+        fewer = AprioriAnalyzer(min_support=0.02)
+        fewer.analyze_or_load(random_sales.iloc[:-100], path)
+        assert AprioriAnalyzer.read_header(path)["data_hash"] == fewer.data_hash
+    
+    def test_analyze_or_load_skips_state_derived_model(self, random_sales, tmp_path):
+        """Test that a model re-derived by update() is saved without a data hash and never reused."""
+        path = tmp_path / "model.npz"
+        old, delta = random_sales.iloc[:-300], random_sales.iloc[-300:]
+        
+        analyzer = AprioriAnalyzer(min_support=0.01)
+        analyzer.analyze(old)
+        analyzer.update(delta, basket="day")
+        analyzer.save(path)
+        
+        header = AprioriAnalyzer.read_header(path)
+        assert header["data_hash"] is None
+        assert header["cestos"]["basket"] == "day"
+        
+        fresh = AprioriAnalyzer(min_support=0.01)
+        expected = fresh.analyze(old)
+        reloaded = AprioriAnalyzer(min_support=0.01)
+        assert reloaded.analyze_or_load(old, path) == expected
+        assert reloaded.n_baskets == fresh.n_baskets
+    
+    def test_sketch_budget_is_part_of_the_model(self, random_sales, tmp_path):
+        """Test that sketch models are not reused across memory budgets and reload with theirs."""
+        path = tmp_path / "model.npz"
+        AprioriAnalyzer(engine="sketch", sketch_memory_mb=1).analyze_or_load(random_sales, path)
+        assert AprioriAnalyzer.load(path).sketch_memory_mb == 1
+        
+        AprioriAnalyzer(engine="sketch", sketch_memory_mb=2).analyze_or_load(random_sales, path)
+        assert AprioriAnalyzer.read_header(path)["parametros"]["sketch_memory_mb"] == 2
+    
+    @pytest.fixture
+    def long_tail_sales(self):
+        """Each customer buys one of 20 fish SKUs and one of 20 olive oil SKUs."""
+        rng = np.random.default_rng(2)
+        data = []
+        for i in range(60):
+            data.append({"cliente_id": f"C{i}", "produto_id": f"F{rng.integers(20)}", "data": "2025-01-01", "valor": 10})
+            data.append({"cliente_id": f"C{i}", "produto_id": f"A{rng.integers(20)}", "data": "2025-01-01", "valor": 5})
+            if i % 2:
+                data.append({"cliente_id": f"C{i}", "produto_id": f"V{rng.integers(20)}", "data": "2025-01-01", "valor": 3})
+        for i in range(60, 90):
+            data.append({"cliente_id": f"C{i}", "produto_id": "V0", "data": "2025-01-01", "valor": 3})
+            data.append({"cliente_id": f"C{i}", "produto_id": "V1", "data": "2025-01-01", "valor": 3})
+        
+        products = pd.DataFrame({"produto_id": [f"{c}{n}" for c in "FAV" for n in range(20)]})
+        products["categoria"] = products["produto_id"].str[0].map({"F": "Peixe", "A": "Azeite", "V": "Vegetais"})
+        return pd.DataFrame(data), products
+    
+    def test_category_level_rules(self, long_tail_sales):
+        """Test that long-tail SKUs roll up to strong category rules."""
+        sales, products = long_tail_sales
+        
+        sku = AprioriAnalyzer(min_support=0.1, min_confidence=0.5)
+        assert not any(r["antecedent"][0].startswith("F") for r in sku.analyze(sales))
+        
+        category = AprioriAnalyzer(min_support=0.1, min_confidence=0.5)
+        rules = category.analyze(sales, products_df=products, level="category")
+        assert any(r["antecedent"] == ["Peixe"] and r["consequent"] == ["Azeite"] for r in rules)
+        
+        with pytest.raises(ValueError):
+            AprioriAnalyzer().analyze(sales, level="category")
+    
+    def test_category_level_with_numeric_ids_from_etl(self, long_tail_sales, tmp_path):
+        """Test the hierarchy when ETL loads sales IDs as text and product IDs as numbers."""
+        from aiti_insights.etl import ETLProcessor
+        
+        sales, products = long_tail_sales
+        numeric = {sku: str(1000 * (1 + "FAV".index(sku[0])) + int(sku[1:])) for sku in products["produto_id"]}
+        sales.assign(produto_id=sales["produto_id"].map(numeric)).to_csv(tmp_path / "vendas.csv", index=False)
+        products.assign(produto_id=products["produto_id"].map(numeric)).to_csv(tmp_path / "produtos.csv", index=False)
+        
+        etl = ETLProcessor()
+        sales = etl.load_sales(tmp_path / "vendas.csv")
+        products = etl.load_products(tmp_path / "produtos.csv")
+        assert products["produto_id"].dtype.kind == "i"
+        
+        rules = AprioriAnalyzer(min_support=0.1, min_confidence=0.5).analyze(
+            sales, products_df=products, level="category"
+        )
+        assert any(r["antecedent"] == ["Peixe"] and r["consequent"] == ["Azeite"] for r in rules)
+        
+        unrelated = products.assign(produto_id=products["produto_id"] + 10**6)
+        with pytest.raises(ValueError, match="Nenhum produto"):
+            AprioriAnalyzer().analyze(sales, products_df=unrelated, level="category")
+    
+    def test_mixed_level_rules(self, long_tail_sales):
+        """Test that mixed rules combine SKUs and categories without trivial ancestors."""
+        sales, products = long_tail_sales
+        
+        analyzer = AprioriAnalyzer(min_support=0.05, min_confidence=0.3, max_rules=10**6, max_len=3)
+        rules = analyzer.analyze(sales, products_df=products, level="mixed")
+        
+        assert any(r["antecedent"] == ["V0"] and r["consequent"] == ["V1"] for r in rules)
+        assert any(r["consequent"] == ["categoria:Azeite"] for r in rules)
+        
+        category_of = dict(zip(products["produto_id"], "categoria:" + products["categoria"]))
+        for itemset in analyzer.frequent_itemsets:
+            assert not any(category_of.get(item) in itemset for item in itemset)
+    
+    def test_top_k_rules_match_full_ranking(self, random_sales):
+        """Test that partial top-k selection equals truncating the full ranking."""
+        full = AprioriAnalyzer(min_support=0.01, min_confidence=0.1, max_rules=10**6, max_len=3)
+        ranking = full.analyze(random_sales)
+        
+        top = AprioriAnalyzer(min_support=0.01, min_confidence=0.1, max_rules=10, max_len=3)
+        assert top.analyze(random_sales) == ranking[:10]
+        
+        lifts = [r["lift"] for r in ranking]
+        assert lifts == sorted(lifts, reverse=True)
+        assert all(r["confidence"] >= 0.1 for r in ranking)
+        for r in ranking:
+            itemset = frozenset(r["antecedent"] + r["consequent"])
+            assert r["support"] == round(full.frequent_itemsets[itemset], 4)
+            assert r["count"] == round(full.frequent_itemsets[itemset] * full.n_baskets)
+    
+    def test_weighted_rules_match_brute_force(self, random_sales, tmp_path):
+        """Test revenue-weighted support, confidence and utility against a direct scan."""
+        from itertools import combinations
+        
+        sales = random_sales.assign(valor=np.random.default_rng(1).gamma(2, 20, len(random_sales)))
+        analyzer = AprioriAnalyzer(
+            min_support=0.05, min_confidence=0, min_lift=0, max_rules=10**6,
+            max_len=3, weight="valor", min_utility=0.02
+        )
+        rules = analyzer.analyze(sales)
+        
+        values = sales.groupby(["cliente_id", "produto_id"])["valor"].sum()
+        baskets = [g.droplevel(0).to_dict() for _, g in values.groupby(level=0) if len(g) >= 2]
+        total = sum(sum(b.values()) for b in baskets)
+        
+        def weighted_support(items):
+            return sum(sum(b.values()) for b in baskets if set(items) <= b.keys()) / total
+        
+        def utility(items):
+            return sum(sum(b[i] for i in items) for b in baskets if set(items) <= b.keys()) / total
+        
+        expected = set()
+        for k in (2, 3):
+            for itemset in combinations(sorted(sales["produto_id"].unique()), k):
+                if (
+                    weighted_support(itemset) >= 0.05 and utility(itemset) >= 0.02
+                    and all(weighted_support(s) >= 0.05 for s in combinations(itemset, k - 1))
+                ):
+                    expected |= {(frozenset(itemset) - {c}, c) for c in itemset}
+        
+        assert rules
+        assert {(frozenset(r["antecedent"]), r["consequent"][0]) for r in rules} == expected
+        for r in rules:
+            itemset = r["antecedent"] + r["consequent"]
+            assert r["support"] == round(weighted_support(itemset), 4)
+            assert r["confidence"] == round(weighted_support(itemset) / weighted_support(r["antecedent"]), 4)
+            assert r["utilidade"] == round(utility(itemset), 4)
+        
+        analyzer.save(tmp_path / "model.npz")
+        loaded = AprioriAnalyzer.load(tmp_path / "model.npz")
+        assert loaded.rules == rules
+        assert loaded.frequent_itemsets == analyzer.frequent_itemsets
+    
+    def test_weighted_ranking_favours_revenue(self):
+        """Test that a rarer high-value pair outranks a frequent cheap one by weighted support."""
+        data = []
+        for i in range(60):
+            data.append({"cliente_id": f"C{i}", "produto_id": "SACO", "data": "2025-01-01", "valor": 1})
+            data.append({"cliente_id": f"C{i}", "produto_id": "PILHA", "data": "2025-01-01", "valor": 4})
+        for i in range(60, 70):
+            data.append({"cliente_id": f"C{i}", "produto_id": "TV", "data": "2025-01-01", "valor": 900})
+            data.append({"cliente_id": f"C{i}", "produto_id": "SUPORTE", "data": "2025-01-01", "valor": 100})
+        sales = pd.DataFrame(data)
+        
+        plain = AprioriAnalyzer(min_support=0.2, min_confidence=0.1).analyze(sales)
+        weighted = AprioriAnalyzer(min_support=0.2, min_confidence=0.1, weight="valor").analyze(sales)
+        
+        assert {r["consequent"][0] for r in plain} == {"SACO", "PILHA"}
+        assert {r["consequent"][0] for r in weighted} == {"TV", "SUPORTE"}
+        assert weighted[0]["support"] == round(10000 / 10300, 4)
+        assert weighted[0]["utilidade"] == weighted[0]["support"]
+    
+    def test_weight_requires_vectorized_engine(self):
+        """Test that weighting is rejected where it is not supported."""
+        with pytest.raises(ValueError):
+            AprioriAnalyzer(weight="valor", engine="fpgrowth")
+        with pytest.raises(ValueError):
+            AprioriAnalyzer(min_utility=0.1)
+    
+    def test_p_values_match_fisher_exact(self, random_sales):
+        """Test vectorized p-values against scipy's Fisher exact test, raw and corrected."""
+        from scipy.stats import fisher_exact
+        
+        raw = AprioriAnalyzer(min_support=0.01, min_confidence=0, min_lift=0, max_rules=10**6, correction="none")
+        rules = raw.analyze(random_sales)
+        n = raw.n_baskets
+        
+        for r in rules[:20]:
+            both = r["count"]
+            antecedent = round(raw.frequent_itemsets[frozenset(r["antecedent"])] * n)
+            consequent = round(raw.frequent_itemsets[frozenset(r["consequent"])] * n)
+            table = [[both, antecedent - both], [consequent - both, n - antecedent - consequent + both]]
+            assert r["p_value"] == pytest.approx(fisher_exact(table, alternative="greater")[1], rel=1e-6, abs=1e-12)
+        
+        bonferroni = AprioriAnalyzer(min_support=0.01, min_confidence=0, min_lift=0, max_rules=10**6, correction="bonferroni")
+        adjusted = {(tuple(r["antecedent"]), r["consequent"][0]): r["p_value"] for r in bonferroni.analyze(random_sales)}
+        for r in rules:
+            expected = min(r["p_value"] * len(rules), 1.0)
+            assert adjusted[(tuple(r["antecedent"]), r["consequent"][0])] == pytest.approx(expected)
+    
+    def test_max_p_value_prunes_low_count_rules(self, sample_sales):
+        """Test that rare high-lift pairs are dropped while the strong pattern survives."""
+        # P900 and P901 co-occur in only 2 of their 6 baskets each
+        noise = pd.DataFrame([
+            {"cliente_id": f"N{i}", "produto_id": p, "data": "2025-01-03", "valor": 10}
+            for i, products in enumerate([("P900", "P901")] * 2 + [("P900", "P002")] * 4 + [("P901", "P004")] * 4)
+            for p in products
+        ])
+        sales = pd.concat([sample_sales, noise], ignore_index=True)
+        
+        loose = AprioriAnalyzer(min_support=0.01, min_confidence=0.3).analyze(sales)
+        strict = AprioriAnalyzer(min_support=0.01, min_confidence=0.3, max_p_value=0.01).analyze(sales)
+        
+        assert any("P900" in r["antecedent"] for r in loose)
+        assert not any("P900" in r["antecedent"] + r["consequent"] for r in strict)
+        assert any(r["antecedent"] == ["P001"] and r["consequent"] == ["P003"] for r in strict)
+        assert all(r["p_value"] <= 0.01 for r in strict)
+    
+    def test_invalid_correction_raises(self):
+        """Test that an unknown multiple-testing correction is rejected."""
+        with pytest.raises(ValueError):
+            AprioriAnalyzer(correction="holm")
+    
+    @pytest.mark.parametrize("engine", ["sparse", "fpgrowth", "eclat"])
+    def test_engine_matches_apriori(self, engine):
+        """Test that alternative engines yield the same itemsets and rules."""
+        rng = np.random.default_rng(0)
+        sales = pd.DataFrame({
+            "cliente_id": [f"C{i}" for i in rng.integers(0, 100, 1000)],
+            "produto_id": [f"P{i}" for i in rng.integers(0, 12, 1000)],
+            "data": "2025-01-01",
+            "valor": 10,
+        })
+        
+        def mine(engine):
+            analyzer = AprioriAnalyzer(
+                min_support=0.05, min_confidence=0.1, max_rules=1000, engine=engine, max_len=3
+            )
+            rules = {
+                (tuple(r["antecedent"]), tuple(r["consequent"]), r["support"], r["confidence"], r["lift"])
+                for r in analyzer.analyze(sales)
+            }
+            return analyzer.frequent_itemsets, rules
+        
+        assert mine(engine) == mine("apriori")
+    
+    def test_parallel_pair_counting_matches_serial(self, random_sales):
+        """Test that n_jobs sharded counting gives the same itemsets."""
+        serial = AprioriAnalyzer(min_support=0.01, engine="sparse", max_len=3)
+        serial.analyze(random_sales)
+        
+        parallel = AprioriAnalyzer(min_support=0.01, engine="sparse", max_len=3, n_jobs=2)
+        parallel.analyze(random_sales)
+        
+        assert parallel.frequent_itemsets == serial.frequent_itemsets
+        
+        with pytest.raises(ValueError):
+            AprioriAnalyzer(n_jobs=0)
+    
+    def test_sketch_engine_matches_exact(self, random_sales):
+        """Test that the sketch engine finds the exact itemsets with enough memory."""
+        exact = AprioriAnalyzer(min_support=0.01, engine="sparse", max_rules=10**6)
+        expected = exact.analyze(random_sales)
+        
+        approximate = AprioriAnalyzer(min_support=0.01, engine="sketch", max_rules=10**6, sketch_memory_mb=1)
+        rules = approximate.analyze(random_sales)
+        
+        assert approximate.frequent_itemsets == exact.frequent_itemsets
+        assert len(rules) == len(expected)
+        assert all(r["exact"] for r in rules)
+        assert approximate.approximation["delta"] < 0.02
+    
+    @staticmethod
+    def _true_pairs(sales):
+        """Exact pair counts of the customer baskets, for the sketch tests."""
+        analyzer = AprioriAnalyzer(engine="sparse")
+        baskets = analyzer._create_baskets(sales, "produto_id", "cliente_id")
+        items = np.arange(baskets.shape[1])
+        true_pairs, true_counts = analyzer._count_pairs_sparse(baskets, items)
+        return baskets, items, dict(zip(map(tuple, true_pairs.tolist()), true_counts.tolist()))
+    
+    def test_sketch_overflow_marks_pairs_approximate(self, random_sales):
+        """Test that pairs beyond the exact table carry upper-bound estimates."""
+        from aiti_insights.sketch import approximate_pairs
+        
+        baskets, items, truth = self._true_pairs(random_sales)
+        pairs, counts, exact, guarantees = approximate_pairs(baskets, items, 2, memory_mb=0.01, max_candidates=20)
+        
+        assert (~exact).sum() > 0
+        assert guarantees["pares_aproximados"] == (~exact).sum()
+        for pair, count, is_exact in zip(map(tuple, pairs.tolist()), counts.tolist(), exact):
+            if is_exact:
+                assert count == truth[pair]
+            else:
+                assert count >= truth.get(pair, 0)
+    
+    def test_sketch_reports_dropped_candidates(self, random_sales, caplog):
+        """Test that a full candidate budget is reported and warned about, and the default budget loses nothing."""
+        from aiti_insights.sketch import approximate_pairs, candidate_budget
+        
+        baskets, items, truth = self._true_pairs(random_sales)
+        frequent = {pair for pair, count in truth.items() if count >= 2}
+        
+        with caplog.at_level("WARNING", logger="aiti_insights.sketch"):
+            pairs, _, _, guarantees = approximate_pairs(baskets, items, 2, memory_mb=0.01, max_candidates=20)
+        
+        missing = frequent - set(map(tuple, pairs.tolist()))
+        assert len(missing) > 0
+        assert guarantees["candidatos_descartados"] >= len(missing)
+        assert "candidatos descartados" in caplog.text
+        
+        pairs, _, exact, guarantees = approximate_pairs(baskets, items, 2, memory_mb=1)
+        assert guarantees["max_candidatos"] == candidate_budget(1)
+        assert guarantees["candidatos_descartados"] == 0
+        assert set(map(tuple, pairs.tolist())) == frequent and exact.all()
+        
+        analyzer = AprioriAnalyzer(min_support=0.001, engine="sketch", sketch_max_candidates=20)
+        analyzer.analyze(random_sales)
+        assert analyzer.approximation["max_candidatos"] == 20
+        assert analyzer.approximation["candidatos_descartados"] > 0
+    
+    def test_max_len_finds_triples(self):
+        """Test k-itemset mining yields multi-item antecedents."""
+        data = []
+        for i in range(30):
+            for produto in ["P1", "P2", "P3"]:
+                data.append({"cliente_id": f"C{i}", "produto_id": produto, "data": "2025-01-01", "valor": 10})
+        for i in range(30, 60):
+            for produto in ["P1", "P2", "P4"]:
+                data.append({"cliente_id": f"C{i}", "produto_id": produto, "data": "2025-01-01", "valor": 10})
+        
+        analyzer = AprioriAnalyzer(min_support=0.1, min_confidence=0.5, max_len=3)
+        rules = analyzer.analyze(pd.DataFrame(data))
+        
+        assert frozenset(["P1", "P2", "P3"]) in analyzer.frequent_itemsets
+        assert frozenset(["P3", "P4"]) not in analyzer.frequent_itemsets
+        assert any(r["antecedent"] == ["P1", "P3"] and r["consequent"] == ["P2"] for r in rules)
+        
+        recs = analyzer.get_recommendations(["P1", "P4"])
+        assert "P2" in [rec["produto"] for rec in recs]
+    
+    @pytest.fixture
+    def two_visit_sales(self):
+        """Each customer buys P1+P2 on one visit and P3+P4 two months later."""
+        data = []
+        for i in range(20):
+            for produto, dia in [("P1", "2025-01-01"), ("P2", "2025-01-01"), ("P3", "2025-03-01"), ("P4", "2025-03-02")]:
+                data.append({"cliente_id": f"C{i}", "produto_id": produto, "data": dia, "valor": 10})
+        return pd.DataFrame(data)
+    
+    def test_basket_by_day_and_window(self, two_visit_sales):
+        """Test that day/window baskets split a customer's history."""
+        whole = AprioriAnalyzer(min_support=0.1)
+        whole.analyze(two_visit_sales)
+        assert frozenset(["P1", "P3"]) in whole.frequent_itemsets
+        
+        by_day = AprioriAnalyzer(min_support=0.1)
+        by_day.analyze(two_visit_sales, basket="day")
+        assert frozenset(["P1", "P2"]) in by_day.frequent_itemsets
+        assert frozenset(["P3", "P4"]) not in by_day.frequent_itemsets
+        
+        by_window = AprioriAnalyzer(min_support=0.1)
+        by_window.analyze(two_visit_sales, basket="window", window_days=7)
+        assert frozenset(["P3", "P4"]) in by_window.frequent_itemsets
+        assert frozenset(["P1", "P3"]) not in by_window.frequent_itemsets
+    
+    def test_invalid_basket_definition_raises(self, two_visit_sales):
+        """Test invalid basket definitions are rejected."""
+        with pytest.raises(ValueError):
+            AprioriAnalyzer().analyze(two_visit_sales, basket="week")
+        with pytest.raises(ValueError):
+            AprioriAnalyzer().analyze(two_visit_sales, basket="window")
+    
+    @pytest.fixture
+    def random_sales(self):
+        """Random daily sales over 60 days and a 25-product catalog."""
+        rng = np.random.default_rng(1)
+        n = 3000
+        days = np.sort(rng.integers(0, 60, n))
+        customers = rng.integers(0, 40, n)
+        # Each customer group buys mostly from its own 5-product range
+        products = (customers % 5) * 5 + rng.integers(0, 5, n)
+        return pd.DataFrame({
+            "cliente_id": customers.astype(str),
+            "produto_id": ["P" + str(p) for p in products],
+            "data": pd.Timestamp("2025-01-01") + pd.to_timedelta(days, unit="D"),
+            "valor": 10.0,
+        })
+    
+    @staticmethod
+    def _rule_set(rules):
+        return {
+            (frozenset(r["antecedent"]), frozenset(r["consequent"]), round(r["confidence"], 9), round(r["lift"], 9))
+            for r in rules
+        }
+    
+    @pytest.mark.parametrize("basket,window_days", [("transaction", None), ("day", None), ("window", 7)])
+    def test_update_matches_full_analysis(self, random_sales, basket, window_days):
+        """Test that incremental updates give the same rules as a full run."""
+        full = AprioriAnalyzer(min_support=0.02, min_confidence=0.1, max_rules=10**6)
+        expected = full.analyze(random_sales, basket=basket, window_days=window_days)
+        
+        incremental = AprioriAnalyzer(min_support=0.02, min_confidence=0.1, max_rules=10**6)
+        half = len(random_sales) // 2
+        incremental.update(random_sales.iloc[:half], basket=basket, window_days=window_days)
+        rules = incremental.update(random_sales.iloc[half:])
+        
+        assert len(expected) > 0
+        assert self._rule_set(rules) == self._rule_set(expected)
+    
+    def test_expire_matches_recent_data(self, random_sales):
+        """Test that expiring old baskets equals analysing only recent data."""
+        cutoff = pd.Timestamp("2025-02-01")
+        
+        recent = AprioriAnalyzer(min_support=0.02, min_confidence=0.1, max_rules=10**6)
+        expected = recent.analyze(random_sales[random_sales["data"] >= cutoff], basket="day")
+        
+        incremental = AprioriAnalyzer(min_support=0.02, min_confidence=0.1, max_rules=10**6)
+        incremental.update(random_sales, basket="day")
+        before = incremental.state.n_baskets
+        rules = incremental.expire(cutoff)
+        
+        assert incremental.state.n_baskets < before
+        assert self._rule_set(rules) == self._rule_set(expected)
+    
+    def test_time_decay_weights_recent_baskets(self, random_sales):
+        """Test decayed support against per-basket weights 2^(-age / half-life)."""
+        analyzer = AprioriAnalyzer(min_support=0.01, min_confidence=0, min_lift=0, max_rules=10**6, half_life_days=10)
+        rules = analyzer.analyze(random_sales)
+        
+        today = random_sales["data"].max()
+        baskets = random_sales.groupby("cliente_id").agg(items=("produto_id", set), last=("data", "max"))
+        baskets = baskets[baskets["items"].apply(len) >= 2]
+        weights = 2.0 ** (-(today - baskets["last"]).dt.days / 10)
+        
+        def support(items):
+            return weights[baskets["items"].apply(set(items).issubset)].sum() / weights.sum()
+        
+        assert rules
+        assert analyzer.total_weight == pytest.approx(weights.sum())
+        for r in rules:
+            itemset = r["antecedent"] + r["consequent"]
+            assert r["support"] == round(support(itemset), 4)
+            assert r["confidence"] == round(support(itemset) / support(r["antecedent"]), 4)
+    
+    @pytest.mark.parametrize("basket,half_life_days", [("transaction", 30), ("day", 30), ("day", 1)])
+    def test_decayed_update_matches_full_analysis(self, random_sales, basket, half_life_days):
+        """Test that daily decayed updates (including rescaling) equal a full decayed run."""
+        full = AprioriAnalyzer(min_support=0.02, min_confidence=0.1, max_rules=10**6, half_life_days=half_life_days)
+        expected = full.analyze(random_sales, basket=basket)
+        
+        incremental = AprioriAnalyzer(min_support=0.02, min_confidence=0.1, max_rules=10**6, half_life_days=half_life_days)
+        for _, day in random_sales.sort_values("data").groupby("data"):
+            rules = incremental.update(day, basket=basket)
+        
+        assert len(expected) > 0
+        assert self._rule_set(rules) == self._rule_set(expected)
+        assert incremental.total_weight == pytest.approx(full.total_weight)
+        assert incremental.frequent_itemsets.keys() == full.frequent_itemsets.keys()
+        for itemset, support in full.frequent_itemsets.items():
+            assert incremental.frequent_itemsets[itemset] == pytest.approx(support)
+        
+        # Expiring old day baskets keeps the decayed totals consistent
+        if basket == "transaction":
+            return
+        cutoff = pd.Timestamp("2025-02-01")
+        recent = AprioriAnalyzer(min_support=0.02, min_confidence=0.1, max_rules=10**6, half_life_days=half_life_days)
+        expected = recent.analyze(random_sales[random_sales["data"] >= cutoff], basket=basket)
+        assert self._rule_set(incremental.expire(cutoff)) == self._rule_set(expected)
+    
+    @pytest.mark.parametrize("half_life_days", [None, 5])
+    def test_frequent_pairs_tracked_across_update_and_expire(self, random_sales, half_life_days):
+        """Test that the incrementally maintained frequent pairs equal a full scan."""
+        from aiti_insights.incremental import AssociationState
+        
+        def full_scan(state, min_support):
+            keys = np.array(sorted(state.pair_counts), dtype=np.int64)
+            counts = np.array([state.pair_counts[k] for k in keys.tolist()]) * state._scale()
+            return keys[counts / state.total >= min_support]
+        
+        for min_support in (0.02, 0.05):
+            state = AssociationState(basket="day", half_life_days=half_life_days)
+            days = sorted(random_sales["data"].unique())
+            for i, day in enumerate(days):
+                state.update(random_sales[random_sales["data"] == day])
+                if i % 7 == 6:
+                    state.expire(day - pd.Timedelta(days=20))
+                levels = state.levels(min_support)
+                got = _pair_keys_of(levels.get(2, (np.empty((0, 2), dtype=np.int32), None))[0])
+                assert got.tolist() == full_scan(state, min_support).tolist()
+    
+    def test_levels_does_not_rescan_all_pairs(self, random_sales):
+        """Test that re-deriving levels after a small update skips untouched infrequent pairs."""
+        from aiti_insights.incremental import AssociationState
+        
+        state = AssociationState(basket="day")
+        state.update(random_sales.iloc[:-20])
+        state.levels(0.05)
+        
+        iterated = []
+        
+        class CountingDict(type(state.pair_counts)):
+            def __iter__(self):
+                iterated.append(True)
+                return super().__iter__()
+            
+            def keys(self):
+                iterated.append(True)
+                return super().keys()
+            
+            def items(self):
+                iterated.append(True)
+                return super().items()
+        
+        state.pair_counts = CountingDict(state.pair_counts.default_factory, state.pair_counts)
+        state.update(random_sales.iloc[-20:])
+        state.levels(0.05)
+        
+        assert not iterated
+        assert state._touched == set()
+    
+    def test_state_save_and_load(self, random_sales, tmp_path):
+        """Test that the incremental state round-trips through disk."""
+        from aiti_insights.incremental import AssociationState
+        
+        head, tail = random_sales.iloc[:len(random_sales) // 2], random_sales.iloc[len(random_sales) // 2:]
+        state = AssociationState(basket="window", window_days=7)
+        state.update(head)
+        state.save(tmp_path / "state.npz")
+        loaded = AssociationState.load(tmp_path / "state.npz")
+        
+        with np.load(tmp_path / "state.npz", allow_pickle=False) as data:
+            assert "header" in data.files  # plain arrays, no pickled objects
+        assert loaded.n_baskets == state.n_baskets
+        assert dict(loaded.pair_counts) == dict(state.pair_counts)
+        
+        # The loaded state keeps updating and expiring like the original
+        cutoff = pd.Timestamp("2025-02-01")
+        for s in (state, loaded):
+            s.update(tail)
+            s.expire(cutoff)
+        assert loaded.n_baskets == state.n_baskets
+        assert dict(loaded.pair_counts) == dict(state.pair_counts)
+        assert loaded.levels(0.02)[2][0].tolist() == state.levels(0.02)[2][0].tolist()
+    
+    def test_unknown_engine_raises(self):
+        """Test that an unknown engine is rejected."""
+        with pytest.raises(ValueError):
+            AprioriAnalyzer(engine="magic")
+    
     def test_empty_data_returns_empty(self):
         """Test that empty data returns empty rules."""
         analyzer = AprioriAnalyzer()
@@ -105,3 +738,8 @@ class TestAnalyzeCrossSell:
         rules = analyze_cross_sell(data, min_support=0.05)
         
         assert isinstance(rules, list)
+
+
+def _pair_keys_of(pairs):
+    """int64 pair keys (a << 32 | b) of an (n, 2) itemset array."""
+    return (pairs[:, 0].astype(np.int64) << 32) | pairs[:, 1].astype(np.int64)
@@ -0,0 +1,67 @@
+"""
+Tests for ID encoding module.
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from aiti_insights.encoding import IDVocabulary, encode_column, encode_ids
+
+
+class TestIDVocabulary:
+    """Tests for IDVocabulary class."""
+    
+    def test_roundtrip(self):
+        """Test that codes are dense int32 and decode back to the IDs."""
+        ids = pd.Series(["P2", "P1", "P2", "P3"])
+        codes, vocab = encode_ids(ids)
+        
+        assert codes.dtype == np.int32
+        assert codes.tolist() == [0, 1, 0, 2]
+        assert vocab.decode(codes).tolist() == ids.tolist()
+    
+    def test_unknown_and_extend(self):
+        """Test unknown IDs map to -1 unless the vocabulary is extended."""
+        vocab = IDVocabulary.fit(["A", "B"])
+        
+        assert vocab.encode(["B", "Z"]).tolist() == [1, -1]
+        assert vocab.encode(["B", "Z"], extend=True).tolist() == [1, 2]
+        assert len(vocab) == 3
+        assert "Z" in vocab
+
+
+class TestEncodedColumns:
+    """Tests for categorical ID columns that carry vocabulary codes."""
+    
+    def test_codes_are_reused(self):
+        """Test that an encoded column decodes to its IDs and keeps the vocabulary codes."""
+        vocab = IDVocabulary.fit(["P2", "P1", "P3"])
+        column = pd.Series(encode_column(["P3", "P1", "P3"], vocab))
+        
+        assert column.tolist() == ["P3", "P1", "P3"]
+        assert vocab.encode(column).tolist() == [2, 1, 2]
+        assert encode_ids(column, vocab)[0].tolist() == [2, 1, 2]
+    
+    def test_subset_without_vocab_is_dense(self):
+        """Test that a filtered column is re-numbered densely over the IDs present."""
+        vocab = IDVocabulary.fit(["P2", "P1", "P3"])
+        column = pd.Series(encode_column(["P3", "P2", "P3"], vocab))
+        
+        codes, subset_vocab = encode_ids(column)
+        assert codes.dtype == np.int32
+        assert subset_vocab.values.tolist() == ["P2", "P3"]
+        assert subset_vocab.decode(codes).tolist() == ["P3", "P2", "P3"]
+    
+    def test_other_vocabulary_is_extended(self):
+        """Test that encoding with a different vocabulary maps through the categories."""
+        column = pd.Series(encode_column(["A", "B", "A"], IDVocabulary.fit(["A", "B"])))
+        other = IDVocabulary.fit(["B", "X"])
+        
+        assert other.encode(column).tolist() == [-1, 0, -1]
+        assert other.encode(column, extend=True).tolist() == [2, 0, 2]
+        assert other.values.tolist() == ["B", "X", "A"]
+
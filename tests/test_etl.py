@@ -3,13 +3,16 @@ Tests for ETL module.
 """
 
 import pytest
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import sys
 
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-from aiti_insights.etl import ETLProcessor
+from aiti_insights.etl import (
+    ETLProcessor, MERGE_FANIN, _merge_runs, _sales_schema, _to_sales_dtypes, _write_run
+)
 
 
 class TestETLProcessor:
@@ -34,6 +37,17 @@ class TestETLProcessor:
         assert "produto_id" in df.columns
         assert "valor" in df.columns
     
+    def test_ids_encoded_once(self, etl, demo_data_path):
+        """Test that sales IDs are stored as categorical codes of the shared vocabularies."""
+        df = etl.load_sales(demo_data_path / "vendas.csv")
+        raw = pd.read_csv(demo_data_path / "vendas.csv", dtype=str)
+        
+        for column, vocab in [("cliente_id", etl.customer_vocab), ("produto_id", etl.product_vocab)]:
+            assert isinstance(df[column].dtype, pd.CategoricalDtype)
+            assert df[column].cat.categories.tolist() == vocab.values.tolist()
+            assert set(df[column].astype(str)) == set(raw[column].str.strip())
+            assert (vocab.encode(df[column]) == df[column].cat.codes.to_numpy()).all()
+    
     def test_load_customers(self, etl, demo_data_path):
         """Test loading customers."""
         df = etl.load_customers(demo_data_path / "clientes.csv")
@@ -84,6 +98,176 @@ class TestETLProcessor:
         assert "data" in df.columns or len(df.columns) > 0
 
 
+class TestCSVDialect:
+    """Tests for CSV dialect sniffing."""
+    
+    def test_semicolon_decimal_comma_latin1(self, tmp_path):
+        """Test ERP-style export: latin-1, ';' separator, decimal comma."""
+        path = tmp_path / "vendas_erp.csv"
+        content = (
+            "Data;Cliente;Artigo;Qtd;Montante\n"
+            "29/01/2026;C001;Pão de forma;2;12,50\n"
+            "30/01/2026;C002;Açúcar;1;3,75\n"
+        )
+        path.write_bytes(content.encode("latin-1"))
+        
+        etl = ETLProcessor()
+        df = etl.load_sales(path)
+        
+        assert etl.last_dialect["sep"] == ";"
+        assert etl.last_dialect["decimal"] == ","
+        assert etl.last_dialect["encoding"] != "utf-8"
+        assert etl.last_dialect["header"] is True
+        assert df["valor"].tolist() == [12.5, 3.75]
+        assert df["produto_id"].iloc[0] == "Pão de forma"
+    
+    def test_dialect_cached_by_fingerprint(self, tmp_path):
+        """Test that the dialect decision is cached per file fingerprint."""
+        path = tmp_path / "vendas.csv"
+        path.write_text("data|cliente_id|produto_id|valor\n2025-01-01|C1|P1|10\n")
+        
+        etl = ETLProcessor()
+        etl.sniff_csv(path)
+        
+        assert ETLProcessor._fingerprint(path) in etl._dialect_cache
+        assert etl.sniff_csv(path)["sep"] == "|"
+        assert ETLProcessor()._dialect_cache == {}  # not shared between instances
+    
+    def test_invalid_bytes_after_sample_single_parse(self, tmp_path, monkeypatch):
+        """Test that latin-1 bytes past the sniffed sample are decoded without a re-parse."""
+        path = tmp_path / "vendas.csv"
+        content = "data,cliente_id,produto_id,valor\n" + "01/01/2025,C1,P1,10\n" * 5000
+        path.write_bytes(content.encode("utf-8") + "02/01/2025,C2,Pão,5\n".encode("latin-1"))
+        
+        calls = []
+        read_csv = pd.read_csv
+        monkeypatch.setattr(pd, "read_csv", lambda *args, **kwargs: calls.append(1) or read_csv(*args, **kwargs))
+        
+        etl = ETLProcessor()
+        df = etl.load_sales(path)
+        
+        assert etl.last_dialect["encoding"] == "utf-8"
+        assert df["produto_id"].iloc[-1] == "Pão"
+        assert len(calls) == 1
+
+
+class TestStreaming:
+    """Tests for chunked streaming mode."""
+    
+    def test_stream_matches_full_load(self, tmp_path):
+        """Test that streamed, externally merged output matches load_sales."""
+        pytest.importorskip("pyarrow")
+        
+        rows = [
+            {"data": f"{(i * 7) % 28 + 1:02d}/01/2025", "cliente_id": f"C{i % 5}",
+             "produto_id": f"P{i % 3}", "quantidade": 1, "valor": 10 + i}
+            for i in range(40)
+        ]
+        path = tmp_path / "vendas.csv"
+        pd.DataFrame(rows).to_csv(path, index=False)
+        
+        etl = ETLProcessor()
+        full = etl.load_sales(path)
+        
+        chunk_sizes = []
+        output = tmp_path / "vendas.parquet"
+        stats = etl.stream_sales(path, output, chunksize=7, sinks=[lambda c: chunk_sizes.append(len(c))])
+        streamed = pd.read_parquet(output)
+        
+        assert stats["transacoes"] == len(full)
+        assert max(chunk_sizes) <= 7
+        assert streamed["data"].is_monotonic_increasing
+        assert sorted(streamed["valor"]) == sorted(full["valor"])
+    
+    @staticmethod
+    def _sorted_runs(tmp_path, n_runs, rows, row_group_size):
+        """Write n_runs sorted sales runs the way stream_sales does."""
+        rng = np.random.default_rng(0)
+        run_paths, schema, run_bytes = [], None, 0
+        for i in range(n_runs):
+            run = _to_sales_dtypes(pd.DataFrame({
+                "data": np.sort(pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 10**6, rows), unit="min")),
+                "cliente_id": rng.integers(0, 10**5, rows).astype(str),
+                "produto_id": rng.integers(0, 10**4, rows).astype(str),
+                "quantidade": 1,
+                "valor": rng.random(rows),
+            }))
+            schema = schema or _sales_schema(run)
+            run_paths.append(tmp_path / f"run_{i}.parquet")
+            _write_run(run, run_paths[-1], schema, row_group_size)
+            run_bytes = max(run_bytes, int(run.memory_usage(deep=True).sum()))
+        return run_paths, schema, run_bytes
+    
+    def test_merge_memory_independent_of_run_size(self, tmp_path):
+        """Test that Arrow memory during the merge stays far below the size of the runs."""
+        pa = pytest.importorskip("pyarrow")
+        
+        batch_size = 4000
+        run_paths, schema, run_bytes = self._sorted_runs(tmp_path, 5, 60_000, batch_size // MERGE_FANIN)
+        
+        output = tmp_path / "merged.parquet"
+        baseline = pa.total_allocated_bytes()
+        peak = _merge_runs(run_paths, output, schema, "data", batch_size, tmp_path)
+        merged = pd.read_parquet(output)
+        
+        assert peak - baseline < run_bytes
+        assert len(merged) == 300_000
+        assert merged["data"].is_monotonic_increasing
+    
+    def test_merge_in_several_passes(self, tmp_path):
+        """Test that more runs than the fan-in are merged in passes into one sorted file."""
+        pytest.importorskip("pyarrow")
+        
+        run_paths, schema, _ = self._sorted_runs(tmp_path, 10, 700, 50)
+        expected = pd.concat([pd.read_parquet(p) for p in run_paths])
+        
+        output = tmp_path / "merged.parquet"
+        _merge_runs(run_paths, output, schema, "data", 300, tmp_path, fanin=3)
+        merged = pd.read_parquet(output)
+        
+        assert merged["data"].is_monotonic_increasing
+        pd.testing.assert_frame_equal(
+            merged.sort_values(["data", "valor"], ignore_index=True),
+            expected.sort_values(["data", "valor"], ignore_index=True),
+        )
+    
+    def test_stream_decodes_like_full_load(self, tmp_path):
+        """Test that streaming shares the latin-1 fallback of load_sales."""
+        path = tmp_path / "vendas.csv"
+        content = "data,cliente_id,produto_id,valor\n" + "01/01/2025,C1,P1,10\n" * 5000
+        path.write_bytes(content.encode("utf-8") + "02/01/2025,C2,Pão,5\n".encode("latin-1"))
+        
+        etl = ETLProcessor()
+        streamed = pd.concat(etl.iter_sales(path, chunksize=1000), ignore_index=True)
+        
+        full = etl.load_sales(path).astype({"cliente_id": str, "produto_id": str})
+        pd.testing.assert_frame_equal(streamed, full)
+
+
+class TestETLCache:
+    """Tests for the columnar ETL cache."""
+    
+    def test_cache_hit_and_stale_rebuild(self, tmp_path):
+        """Test that cached sales are reused and rebuilt when the source changes."""
+        pytest.importorskip("pyarrow")
+        
+        path = tmp_path / "vendas.csv"
+        path.write_text("data,cliente_id,produto_id,valor\n2025-01-02,C1,P1,10\n2025-01-01,C2,P2,20\n")
+        cache_dir = tmp_path / "cache"
+        
+        first = ETLProcessor(cache_dir=cache_dir).load_sales(path)
+        assert len(list(cache_dir.glob("*.arrow"))) == 1
+        
+        cached = ETLProcessor(cache_dir=cache_dir).load_sales(path)
+        pd.testing.assert_frame_equal(first, cached)
+        
+        path.write_text("data,cliente_id,produto_id,valor\n2025-01-03,C3,P3,30\n")
+        rebuilt = ETLProcessor(cache_dir=cache_dir).load_sales(path)
+        
+        assert rebuilt["cliente_id"].tolist() == ["C3"]
+        assert len(list(cache_dir.glob("*.arrow"))) == 1
+
+
 class TestDataValidation:
     """Tests for data validation."""
     
@@ -0,0 +1,63 @@
+"""
+Tests for quantile sketches.
+"""
+
+import pytest
+import numpy as np
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from aiti_insights.quantiles import KLLSketch
+
+
+@pytest.fixture
+def values():
+    """Skewed values, like customer monetary totals."""
+    return np.random.default_rng(0).lognormal(size=200_000)
+
+
+def rank_error(values, sketch, qs):
+    """Largest gap between target quantiles and the true rank of the sketch estimates."""
+    estimates = sketch.quantiles(qs)
+    return np.abs((values[:, None] <= estimates).mean(axis=0) - qs).max()
+
+
+class TestKLLSketch:
+    """Tests for KLLSketch class."""
+    
+    def test_small_input_is_exact(self):
+        """Test that ranks are exact while nothing was compacted."""
+        sketch = KLLSketch(k=200).update([3, 1, 2, 2, 5])
+        
+        below, at_or_below = sketch.ranks([2, 4])
+        assert below.tolist() == [1, 4]
+        assert at_or_below.tolist() == [3, 4]
+        assert sketch.quantiles([0.0, 0.5, 1.0]).tolist() == [1, 2, 5]
+    
+    def test_bounded_memory_and_accuracy(self, values):
+        """Test that the sketch keeps O(k) items with small rank error."""
+        sketch = KLLSketch(k=200, seed=1)
+        for chunk in np.array_split(values, 100):
+            sketch.update(chunk)
+        
+        assert sketch.n == len(values)
+        assert len(sketch) < 3 * 200
+        assert rank_error(values, sketch, np.linspace(0.05, 0.95, 19)) < 0.02
+    
+    def test_merged_shards_match_population(self, values):
+        """Test that merging per-shard sketches approximates the global quantiles."""
+        shards = [KLLSketch(k=200, seed=i).update(part) for i, part in enumerate(np.array_split(values, 8))]
+        merged = shards[0]
+        for shard in shards[1:]:
+            merged.merge(shard)
+        
+        assert merged.n == len(values)
+        assert len(merged) < 3 * 200
+        assert rank_error(values, merged, np.linspace(0.05, 0.95, 19)) < 0.02
+    
+    def test_invalid_k_raises(self):
+        """Test that a tiny k is rejected."""
+        with pytest.raises(ValueError):
+            KLLSketch(k=2)
@@ -0,0 +1,192 @@
+"""
+Tests for RFM module.
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+from itertools import product
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from aiti_insights.rfm import RFMAnalyzer, RFM_SEGMENTS, compile_segments, quantile_scores, RFMState, RFMSketch
+
+
+@pytest.fixture
+def random_sales():
+    """Random sales for 500 customers over one year."""
+    rng = np.random.default_rng(0)
+    n = 5000
+    return pd.DataFrame({
+        "cliente_id": [f"C{i}" for i in rng.integers(0, 500, n)],
+        "data": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D"),
+        "valor": rng.gamma(2, 50, n),
+    })
+
+
+def first_match(r, f, m):
+    """Reference segment assignment: first segment whose ranges contain (r, f, m)."""
+    for name, criteria in RFM_SEGMENTS.items():
+        if (criteria["r_range"][0] <= r <= criteria["r_range"][1]
+                and criteria["f_range"][0] <= f <= criteria["f_range"][1]
+                and criteria["m_range"][0] <= m <= criteria["m_range"][1]):
+            return name
+    return "Others"
+
+
+class TestSegmentLookup:
+    """Tests for the precompiled R×F×M segment table."""
+    
+    def test_lookup_respects_first_match_order(self):
+        """Test that every score combination maps to the first matching segment."""
+        lookup = compile_segments(5, 5, 5)
+        names = list(RFM_SEGMENTS) + ["Others"]
+        
+        for r, f, m in product(range(1, 6), repeat=3):
+            assert names[lookup[r, f, m]] == first_match(r, f, m)
+
+
+class TestQuantileScores:
+    """Tests for the array-based quantile scoring."""
+    
+    def test_matches_qcut_of_first_rank(self):
+        """Test scores against pd.qcut over ranks, including ties."""
+        values = np.random.default_rng(1).integers(0, 20, 997)
+        ranks = pd.Series(values).rank(method="first")
+        
+        expected = pd.qcut(ranks, q=5, labels=range(1, 6)).astype(int)
+        assert quantile_scores(values, 5).tolist() == expected.tolist()
+        
+        expected = pd.qcut(ranks, q=5, labels=range(5, 0, -1)).astype(int)
+        assert quantile_scores(values, 5, reverse=True).tolist() == expected.tolist()
+
+
+class TestRFMAnalyzer:
+    """Tests for RFMAnalyzer class."""
+    
+    def test_segments_match_reference(self, random_sales):
+        """Test vectorized segments and actions against per-row assignment."""
+        analyzer = RFMAnalyzer(reference_date=pd.Timestamp("2025-01-01"))
+        rfm = analyzer.analyze(random_sales)
+        
+        assert isinstance(rfm["segment"].dtype, pd.CategoricalDtype)
+        expected = [first_match(r, f, m) for r, f, m in zip(rfm["R"], rfm["F"], rfm["M"])]
+        assert rfm["segment"].astype(str).tolist() == expected
+        
+        actions = [RFM_SEGMENTS.get(s, {}).get("action", "Analisar caso a caso") for s in expected]
+        assert rfm["segment_action"].astype(str).tolist() == actions
+    
+    def test_scores_independent_of_row_order(self, random_sales):
+        """Test that shuffling the sales rows leaves every score and segment unchanged."""
+        analyzer = RFMAnalyzer(reference_date=pd.Timestamp("2025-01-01"))
+        rfm = analyzer.analyze(random_sales)
+        shuffled = analyzer.analyze(random_sales.sample(frac=1, random_state=1))
+        
+        assert rfm["cliente_id"].is_monotonic_increasing
+        columns = ["cliente_id", "R", "F", "M", "RFM_Score", "segment"]
+        pd.testing.assert_frame_equal(shuffled[columns], rfm[columns])
+    
+    def test_summary_only_lists_present_segments(self, random_sales):
+        """Test that empty categorical segments are left out of the summary."""
+        analyzer = RFMAnalyzer(reference_date=pd.Timestamp("2025-01-01"))
+        rfm = analyzer.analyze(random_sales)
+        summary = analyzer.get_segment_summary()
+        
+        assert set(summary["segment"].astype(str)) == set(rfm["segment"].astype(str))
+        assert summary["count"].sum() == len(rfm)
+        assert (summary["count"] > 0).all()
+    
+    def test_metrics_match_groupby(self, random_sales):
+        """Test the single-pass kernel against a pandas groupby."""
+        sales = random_sales.assign(data=random_sales["data"].dt.strftime("%Y-%m-%d"))
+        before = sales.copy()
+        
+        rfm = RFMAnalyzer(reference_date=pd.Timestamp("2025-01-01")).analyze(sales)
+        pd.testing.assert_frame_equal(sales, before)  # input left untouched
+        
+        expected = random_sales.groupby("cliente_id").agg(
+            last=("data", "max"), frequency=("data", "size"), monetary=("valor", "sum")
+        )
+        assert rfm["cliente_id"].tolist() == expected.index.tolist()
+        assert (rfm["recency_date"].to_numpy() == expected["last"].to_numpy()).all()
+        assert (rfm["frequency"].to_numpy() == expected["frequency"].to_numpy()).all()
+        np.testing.assert_allclose(rfm["monetary"], expected["monetary"])
+        
+        assert rfm["RFM_Score"].tolist() == (rfm[["R", "F", "M"]].astype(int) @ [100, 10, 1]).tolist()
+
+
+class TestIncrementalRFM:
+    """Tests for the incremental per-customer RFM state."""
+    
+    def test_update_matches_full_analysis(self, random_sales):
+        """Test that monthly updates give the same RFM table as a full run."""
+        sales = random_sales.assign(valor=random_sales["valor"].round()).sort_values("data", kind="stable")
+        reference = pd.Timestamp("2025-01-01")
+        
+        full = RFMAnalyzer(reference_date=reference).analyze(sales)
+        
+        incremental = RFMAnalyzer(reference_date=reference)
+        for _, month in sales.groupby(sales["data"].dt.month):
+            rfm = incremental.update(month)
+        
+        columns = ["cliente_id", "recency", "frequency", "monetary", "R", "F", "M", "RFM_Score", "segment"]
+        pd.testing.assert_frame_equal(rfm[columns], full[columns])
+        assert incremental.state.n_customers == len(full)
+    
+    def test_state_save_load(self, random_sales, tmp_path):
+        """Test that a saved state resumes with the same totals."""
+        state = RFMState()
+        state.update(random_sales.iloc[:2500])
+        state.save(tmp_path / "rfm_state.npz")
+        
+        loaded = RFMState.load(tmp_path / "rfm_state.npz")
+        assert loaded.update(random_sales.iloc[2500:]) > 0
+        state.update(random_sales.iloc[2500:])
+        
+        assert (loaded.last_date == state.last_date).all()
+        assert (loaded.frequency == state.frequency).all()
+        np.testing.assert_allclose(loaded.monetary, state.monetary)
+        assert loaded.frequency.sum() == len(random_sales)
+
+
+class TestSketchBinning:
+    """Tests for RFM scores from merged quantile sketches."""
+    
+    def test_sharded_scores_are_consistent(self, random_sales):
+        """Test that shards scored with the merged sketch agree with a single pass."""
+        analyzer = RFMAnalyzer(reference_date=pd.Timestamp("2025-01-01"))
+        shard = pd.util.hash_array(random_sales["cliente_id"].to_numpy()) % 3
+        parts = [random_sales[shard == i] for i in range(3)]
+        
+        sketch = RFMSketch.merge_all([analyzer.sketch(part, seed=i) for i, part in enumerate(parts)])
+        assert sketch.n_customers == random_sales["cliente_id"].nunique()
+        
+        columns = ["R", "F", "M", "segment"]
+        sharded = pd.concat([analyzer.analyze(part, sketch=sketch) for part in parts]).set_index("cliente_id")
+        single = analyzer.analyze(random_sales, sketch=sketch).set_index("cliente_id")
+        pd.testing.assert_frame_equal(
+            sharded.loc[single.index, columns].astype(str), single[columns].astype(str)
+        )
+        
+        # Close to the exact rank-based quintiles
+        exact = analyzer.analyze(random_sales).set_index("cliente_id")
+        for column in ["R", "F", "M"]:
+            assert (single[column].astype(int) - exact[column]).abs().max() <= 1
+            assert single[column].value_counts(normalize=True).between(0.15, 0.25).all()
+    
+    def test_merge_all_is_reproducible_with_seed(self, random_sales):
+        """Test that merging seeded shard sketches twice gives the same quantiles."""
+        analyzer = RFMAnalyzer(reference_date=pd.Timestamp("2025-01-01"))
+        shard = pd.util.hash_array(random_sales["cliente_id"].to_numpy()) % 3
+        parts = [random_sales[shard == i] for i in range(3)]
+        
+        qs = np.linspace(0.05, 0.95, 19)
+        runs = []
+        for _ in range(2):
+            sketch = RFMSketch.merge_all([analyzer.sketch(part, k=8, seed=7) for part in parts])
+            assert sketch.seed == 7
+            runs.append([getattr(sketch, m).quantiles(qs) for m in ("recency", "frequency", "monetary")])
+        
+        np.testing.assert_array_equal(runs[0], runs[1])
@@ -0,0 +1,138 @@
+"""
+Tests for sequential pattern mining.
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+from itertools import product
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from aiti_insights.encoding import IDVocabulary, encode_column
+from aiti_insights.sequences import SequentialAnalyzer
+from aiti_insights.opportunities import OpportunityEngine
+
+
+@pytest.fixture
+def follow_up_sales():
+    """Customers buy a printer, then toner about 10 days later."""
+    data = []
+    for i in range(40):
+        start = pd.Timestamp("2025-01-01") + pd.Timedelta(days=i)
+        data.append({"cliente_id": f"C{i}", "produto_id": "PRINTER", "data": start, "valor": 300})
+        if i < 30:
+            data.append({"cliente_id": f"C{i}", "produto_id": "TONER", "data": start + pd.Timedelta(days=10), "valor": 80})
+        data.append({"cliente_id": f"C{i}", "produto_id": "PAPER", "data": start, "valor": 5})
+    for i in range(40, 60):
+        data.append({"cliente_id": f"C{i}", "produto_id": "PAPER", "data": "2025-03-01", "valor": 5})
+    for i in range(60, 65):
+        data.append({"cliente_id": f"C{i}", "produto_id": "TONER", "data": "2025-03-01", "valor": 80})
+    return pd.DataFrame(data)
+
+
+class TestSequentialAnalyzer:
+    """Tests for SequentialAnalyzer class."""
+    
+    def test_finds_ordered_rule_and_delay(self, follow_up_sales):
+        """Test that A -> B is found with its delay, but not B -> A."""
+        analyzer = SequentialAnalyzer(min_support=0.05, min_confidence=0.3, max_days=30)
+        rules = analyzer.analyze(follow_up_sales)
+        
+        pairs = {(r["antecedent"][0], r["consequent"][0]): r for r in rules}
+        assert ("PRINTER", "TONER") in pairs
+        assert ("TONER", "PRINTER") not in pairs
+        assert ("PRINTER", "PAPER") not in pairs  # same day is not a sequence
+        
+        rule = pairs[("PRINTER", "TONER")]
+        assert rule["count"] == 30
+        assert rule["confidence"] == 0.75
+        assert rule["atraso_mediano_dias"] == 10
+        assert analyzer.expected_delay("PRINTER", "TONER") == 10
+    
+    def test_window_limits_sequences(self, follow_up_sales):
+        """Test that purchases outside max_days are ignored."""
+        analyzer = SequentialAnalyzer(min_support=0.05, min_confidence=0.3, max_days=5)
+        assert analyzer.analyze(follow_up_sales) == []
+    
+    @pytest.mark.parametrize("heavy_events", [0, 600])
+    def test_matches_brute_force(self, heavy_events):
+        """Test counts and delays against a brute-force pair scan, with and without one heavy customer."""
+        rng = np.random.default_rng(0)
+        n = 1500
+        sales = pd.DataFrame({
+            "cliente_id": rng.integers(0, 60, n),
+            "produto_id": rng.integers(0, 6, n),
+            "data": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 120, n), unit="D"),
+        })
+        heavy = pd.DataFrame({
+            "cliente_id": 999,
+            "produto_id": rng.integers(0, 6, heavy_events),
+            "data": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 400, heavy_events), unit="D"),
+        })
+        sales = pd.concat([sales, heavy], ignore_index=True)
+        
+        analyzer = SequentialAnalyzer(min_support=0, min_confidence=0, min_lift=0, max_days=7, max_rules=10**6)
+        got = {
+            (r["antecedent"][0], r["consequent"][0]): (r["count"], r["atraso_mediano_dias"])
+            for r in analyzer.analyze(sales)
+        }
+        
+        delays = {}
+        for _, group in sales.groupby("cliente_id"):
+            events = list(zip(group["data"], group["produto_id"]))
+            best = {}
+            for (day_a, a), (day_b, b) in product(events, events):
+                gap = (day_b - day_a).days
+                if a != b and 0 < gap <= 7:
+                    best[(a, b)] = min(best.get((a, b), gap), gap)
+            for pair, gap in best.items():
+                delays.setdefault(pair, []).append(gap)
+        
+        assert got == {pair: (len(g), float(np.median(g))) for pair, g in delays.items()}
+        assert all(analyzer.expected_delay(a, b) == delay for (a, b), (_, delay) in got.items())
+        assert analyzer.expected_delay("missing", 0) is None
+    
+    def test_invalid_window_raises(self):
+        """Test that a non-positive window is rejected."""
+        with pytest.raises(ValueError):
+            SequentialAnalyzer(max_days=0)
+
+
+class TestOpportunityTiming:
+    """Tests for sequential timing in cross-sell opportunities."""
+    
+    @pytest.mark.parametrize("encoded", [False, True])
+    def test_cross_sell_gets_suggested_date(self, follow_up_sales, encoded):
+        """Test that cross-sell opportunities are timed after the antecedent, also on ETL-encoded IDs."""
+        sales = follow_up_sales[follow_up_sales["cliente_id"] != "C35"]
+        recent = pd.DataFrame([
+            {"cliente_id": "C99", "produto_id": "PRINTER", "data": pd.Timestamp("2025-04-01"), "valor": 300},
+        ])
+        sales = pd.concat([sales, recent], ignore_index=True)
+        
+        customer_vocab = product_vocab = None
+        if encoded:
+            customer_vocab = IDVocabulary.fit(["C_OLD"])
+            product_vocab = IDVocabulary.fit(["UNSOLD"])
+            sales = sales.assign(
+                cliente_id=encode_column(sales["cliente_id"], customer_vocab),
+                produto_id=encode_column(sales["produto_id"], product_vocab),
+            )
+        
+        rules = [{"antecedent": ["PRINTER"], "consequent": ["TONER"], "confidence": 0.75, "lift": 1.2}]
+        sequential = SequentialAnalyzer(min_support=0.05, max_days=30).analyze(sales, vocab=product_vocab)
+        rfm = pd.DataFrame(columns=["cliente_id", "segment", "monetary", "recency", "F", "M", "R", "RFM_Score"])
+        
+        engine = OpportunityEngine(min_value=0)
+        opportunities = engine.generate(
+            sales, rules, rfm, sequential_rules=sequential,
+            customer_vocab=customer_vocab, product_vocab=product_vocab
+        )
+        
+        timed = [op for op in opportunities if op["cliente_id"] == "C99"]
+        assert len(timed) == 1
+        assert timed[0]["data_sugerida"] == pd.Timestamp("2025-04-11")
+        assert timed[0]["apos_produto"] == "PRINTER"